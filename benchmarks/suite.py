@@ -0,0 +1,278 @@
+"""Pipeline benchmark suite: wall time and peak memory of every stage.
+
+    python main.py benchmark --frames 10 --size 1024 --output bench.json
+    python -m benchmarks.suite --stages stack,normalize --compare bench.json
+
+Frames are synthetic star fields (see benchmarks.synthetic). Each case
+reports the best and mean wall time over `--repeat` runs and the peak of
+Python/numpy allocations (tracemalloc) over one extra run; memory-mapped
+files and worker processes are not counted.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+from .synthetic import DTYPES, calibration_masters, synthetic_frames
+
+RESULTS_VERSION = 1
+STAGES = ("load", "align", "calibrate", "stack", "normalize")
+
+
+def measure(fn, repeat=3):
+    """Time `fn` `repeat` times, then trace one run for its peak memory."""
+    times = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "mean_seconds": sum(times) / len(times),
+        "peak_mb": peak / 2**20,
+    }
+
+
+def load_cases(frames, workdir):
+    from osiris_io.file_loader import FileLoader
+    from osiris_io.file_writer import FileWriter
+
+    cases = {}
+    fits_dir = os.path.join(workdir, "fits")
+    os.makedirs(fits_dir)
+    for i, frame in enumerate(frames):
+        FileWriter.save_image(os.path.join(fits_dir, f"frame_{i:04d}.fits"), frame)
+    cases["fits"] = lambda: FileLoader.load_images_from_dir(fits_dir)
+    cases["fits (prefetch)"] = lambda: list(FileLoader.iter_prefetched(fits_dir))
+    if frames[0].dtype.kind == "u":
+        png_dir = os.path.join(workdir, "png")
+        os.makedirs(png_dir)
+        for i, frame in enumerate(frames):
+            FileWriter.save_image(os.path.join(png_dir, f"frame_{i:04d}.png"), frame)
+        cases["png"] = lambda: FileLoader.load_images_from_dir(png_dir)
+    return cases
+
+
+def align_cases(frames):
+    from stacking import align_images
+
+    return {
+        "phase": lambda: align_images(frames, method="phase"),
+        "feature": lambda: align_images(frames, method="feature"),
+    }
+
+
+def calibrate_cases(frames, masters):
+    from stacking import Calibrator, apply_calibration
+
+    bias, dark, flat = masters
+    calibrator = Calibrator(bias, dark, flat)
+    out = np.empty(frames[0].shape, dtype=np.float32)
+    cube = np.stack(frames)
+    return {
+        "apply_calibration": lambda: [
+            apply_calibration(f, bias, dark, flat) for f in frames
+        ],
+        "Calibrator.apply (reused buffer)": lambda: [
+            calibrator.apply(f, out=out) for f in frames
+        ],
+        "Calibrator.apply_batch": lambda: calibrator.apply_batch(cube),
+    }
+
+
+def stack_cases(aligned, workdir):
+    from stacking import stack_images
+    from stacking.combine import ChunkedSigmaClipStrategy
+
+    cases = {
+        method: (lambda method=method: stack_images(aligned, method=method))
+        for method in ("average", "median", "sigma", "weighted")
+    }
+    for method in ("average", "median", "sigma"):
+        cases[f"{method} (memmap)"] = lambda method=method: stack_images(
+            aligned, method=method, use_memmap=True, tmp_dir=workdir
+        )
+    cases["sigma (chunked)"] = lambda: ChunkedSigmaClipStrategy(
+        chunk_size=max(2, len(aligned) // 3)
+    ).combine(aligned)
+    return cases
+
+
+def normalize_cases(stacked):
+    from stacking import normalize_image
+    from stacking.postprocess import STRETCHES
+
+    cases = {
+        stretch: (lambda stretch=stretch: normalize_image(stacked, stretch=stretch))
+        for stretch in STRETCHES
+    }
+    cases["gamma (uint16)"] = lambda: normalize_image(stacked, out_dtype=np.uint16)
+    return cases
+
+
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_suite(frames=10, height=512, width=512, channels=1, dtype="uint16",
+              stages=STAGES, repeat=3, seed=0, report=None):
+    """Run the selected stages; returns a JSON-serialisable result dict.
+
+    `report`, if given, is called with each result as it is produced.
+    """
+    from stacking import align_images, stack_images
+
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown benchmark stage(s): {', '.join(sorted(unknown))}")
+    raw, _ = synthetic_frames(frames, height, width, channels, dtype, seed=seed)
+    pixels = frames * height * width
+    results = []
+
+    def run(stage, cases, npix):
+        for name, fn in cases.items():
+            entry = {"stage": stage, "case": name}
+            try:
+                entry.update(measure(fn, repeat))
+            except ImportError as exc:
+                entry["skipped"] = str(exc)
+            else:
+                entry["mpix_per_s"] = npix / 1e6 / max(entry["seconds"], 1e-12)
+            results.append(entry)
+            if report is not None:
+                report(entry)
+
+    with tempfile.TemporaryDirectory(prefix="osiris_bench_") as workdir, \
+            warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if "load" in stages:
+            run("load", load_cases(raw, workdir), pixels)
+        if "align" in stages:
+            run("align", align_cases(raw), pixels)
+        if "calibrate" in stages:
+            masters = calibration_masters(height, width, channels, dtype, seed=seed + 1)
+            run("calibrate", calibrate_cases(raw, masters), pixels)
+        if "stack" in stages or "normalize" in stages:
+            # Inputs for the later stages are prepared once, outside the timings
+            aligned = align_images(raw, method="phase")
+            if "stack" in stages:
+                run("stack", stack_cases(aligned, workdir), pixels)
+            if "normalize" in stages:
+                stacked = stack_images(aligned, method="average")
+                run("normalize", normalize_cases(stacked), height * width)
+
+    return {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": _environment(),
+        "params": {
+            "frames": frames, "height": height, "width": width,
+            "channels": channels, "dtype": dtype, "repeat": repeat, "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    """Per-case time ratios (current / baseline) for cases present in both.
+
+    Returns a list of ``(stage, case, baseline_s, current_s, ratio,
+    regressed)`` tuples; `regressed` is True when the case got slower by
+    more than `threshold`.
+    """
+    if current["params"] != baseline["params"]:
+        warnings.warn("Benchmark parameters differ; ratios are not comparable")
+    before = {
+        (r["stage"], r["case"]): r["seconds"]
+        for r in baseline["results"] if "seconds" in r
+    }
+    rows = []
+    for r in current["results"]:
+        old = before.get((r["stage"], r["case"]))
+        if old is None or "seconds" not in r:
+            continue
+        ratio = r["seconds"] / max(old, 1e-12)
+        rows.append((r["stage"], r["case"], old, r["seconds"], ratio,
+                     ratio > 1 + threshold))
+    return rows
+
+
+def _print_result(entry):
+    name = f"{entry['stage']:10s} {entry['case']:34s}"
+    if "skipped" in entry:
+        print(f"{name} skipped ({entry['skipped']})")
+        return
+    print(f"{name} {entry['seconds']:8.3f}s  {entry['peak_mb']:9.1f} MB  "
+          f"{entry['mpix_per_s']:8.1f} Mpix/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="osiris benchmark", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--size", type=int, default=512,
+                        help="Frame height and width (overridden by --height/--width)")
+    parser.add_argument("--height", type=int)
+    parser.add_argument("--width", type=int)
+    parser.add_argument("--channels", type=int, choices=[1, 3], default=1)
+    parser.add_argument("--dtype", choices=DTYPES, default="uint16")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", "-o", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown that counts as a regression (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    height, width = args.height or args.size, args.width or args.size
+    print(f"{args.frames} frames of {height}x{width}x{args.channels} {args.dtype}, "
+          f"best of {args.repeat}")
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    results = run_suite(
+        frames=args.frames, height=height, width=width, channels=args.channels,
+        dtype=args.dtype, stages=stages,
+        repeat=args.repeat, seed=args.seed, report=_print_result,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.compare}:")
+        for stage, case, old, new, ratio, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{stage:10s} {case:34s} {old:8.3f}s -> {new:8.3f}s  "
+                  f"x{ratio:5.2f}{flag}")
+        if args.fail_on_regression and any(row[-1] for row in rows):
+            sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
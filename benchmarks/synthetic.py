@@ -0,0 +1,77 @@
+"""Synthetic star fields for benchmarks: Gaussian stars on a sky gradient."""
+import numpy as np
+
+DTYPES = ("uint8", "uint16", "float32")
+# Sky level and brightest star peak as fractions of the dtype's range
+_SKY, _PEAK = 0.04, 0.6
+
+
+def _full_scale(dtype):
+    dtype = np.dtype(dtype)
+    return float(np.iinfo(dtype).max) if dtype.kind in "ui" else 1.0
+
+
+def star_field(height, width, stars, shift=(0.0, 0.0), fwhm=3.0, channels=1,
+               dtype="uint16", noise=0.01, rng=None):
+    """One frame: `stars` is an (N, 3) array of y, x, relative flux."""
+    rng = np.random.default_rng() if rng is None else rng
+    sigma = fwhm / 2.3548
+    radius = int(np.ceil(4 * sigma))
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = _SKY * (1 + 0.3 * xx / max(width, 1))
+    dy, dx = shift
+    for y, x, flux in stars:
+        cy, cx = y + dy, x + dx
+        y0, y1 = max(int(cy) - radius, 0), min(int(cy) + radius + 1, height)
+        x0, x1 = max(int(cx) - radius, 0), min(int(cx) + radius + 1, width)
+        if y0 >= y1 or x0 >= x1:
+            continue
+        r2 = (yy[y0:y1, x0:x1] - cy) ** 2 + (xx[y0:y1, x0:x1] - cx) ** 2
+        img[y0:y1, x0:x1] += _PEAK * flux * np.exp(-r2 / (2 * sigma**2))
+    img = img + rng.normal(0, noise, img.shape).astype(np.float32)
+    if channels > 1:
+        gains = np.linspace(0.9, 1.1, channels, dtype=np.float32)
+        img = img[..., None] * gains
+    np.clip(img, 0, 1, out=img)
+    scale = _full_scale(dtype)
+    if np.dtype(dtype).kind in "ui":
+        return np.rint(img * scale).astype(dtype)
+    return img.astype(dtype)
+
+
+def synthetic_frames(n_frames, height=512, width=512, channels=1, dtype="uint16",
+                     n_stars=200, max_shift=4.0, seed=0):
+    """`n_frames` dithered exposures of one star field.
+
+    Frames are shifted by up to `max_shift` pixels (sub-pixel) relative to
+    the first one, so alignment has real work to do. Returns the frames and
+    the (n_frames, 2) array of applied shifts.
+    """
+    rng = np.random.default_rng(seed)
+    stars = np.column_stack([
+        rng.uniform(0, height, n_stars),
+        rng.uniform(0, width, n_stars),
+        rng.pareto(2.0, n_stars).clip(0, 20) / 20 + 0.05,
+    ])
+    shifts = rng.uniform(-max_shift, max_shift, (n_frames, 2))
+    shifts[0] = 0
+    frames = [
+        star_field(height, width, stars, shift, channels=channels, dtype=dtype, rng=rng)
+        for shift in shifts
+    ]
+    return frames, shifts
+
+
+def calibration_masters(height, width, channels=1, dtype="uint16", seed=1):
+    """Bias, dark and flat frames matching `synthetic_frames` output."""
+    rng = np.random.default_rng(seed)
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    scale = _full_scale(dtype)
+    bias = np.full(shape, 0.01 * scale, dtype=np.float32)
+    dark = rng.exponential(0.002 * scale, shape).astype(np.float32)
+    yy, xx = np.mgrid[0:height, 0:width]
+    r2 = ((yy - height / 2) ** 2 + (xx - width / 2) ** 2) / (height**2 + width**2)
+    flat = (1 - 0.5 * r2).astype(np.float32)
+    if channels > 1:
+        flat = np.repeat(flat[..., None], channels, axis=2)
+    return bias, dark, flat
@@ -1,56 +1,1036 @@
 import argparse
 import os
 import gc
+import time
 import numpy as np
 from typing import Optional
 
+TRANSFORM_INDEX = ".osiris_transforms.json"
 
-def run_pipeline(input_dir, output_path, method="average", align=False, verbose=False, **kwargs):
+
+def _load_calibration(kwargs):
+    """Load bias/dark/flat given as files, directories of raw frames or arrays.
+
+    Directories are stacked into cached masters by MasterFrameBuilder. In a
+    batch the masters are loaded once and shared by every job using them.
+    """
     from osiris_io.file_loader import FileLoader
-    from osiris_io.file_writer import FileWriter
-    from stacking import align_images, normalize_image, stack_images
+    from stacking.masters import MasterFrameBuilder
+
+    shared = kwargs.get("shared")
+    if shared is not None:
+        key = (_calibration_tag(kwargs), kwargs.get("masters_cache"),
+               kwargs.get("masters_method", "sigma"))
+        return shared.calibration(
+            key, lambda: _load_calibration(dict(kwargs, shared=None))
+        )
+
+    builder = MasterFrameBuilder(
+        cache_dir=kwargs.get("masters_cache"),
+        method=kwargs.get("masters_method", "sigma"),
+    )
+    frames = {}
+    for name in ("bias", "dark", "flat"):
+        value = kwargs.get(name)
+        if isinstance(value, str) and os.path.isdir(value):
+            value = builder.build(name, value, bias=frames.get("bias"))
+        elif isinstance(value, str):
+            value = FileLoader.load_image(value)
+        frames[name] = value
+    return frames
+
+
+def _calibration_tag(kwargs):
+    """Cache tag that changes whenever the calibration inputs change."""
+    from stacking.cache import file_signature
+
+    parts = []
+    for name in ("bias", "dark", "flat"):
+        value = kwargs.get(name)
+        if isinstance(value, str):
+            parts.append(f"{name}={file_signature(value)}")
+        elif value is not None:
+            parts.append(f"{name}=<array {id(value)}>")
+    return ";".join(parts)
+
+
+def _io_options(kwargs):
+    """Decode-ahead settings for FileLoader.iter_prefetched."""
+    workers = kwargs.get("io_workers") or 4
+    return {"workers": workers, "prefetch": kwargs.get("prefetch") or 2 * workers}
+
+
+def _align_options(kwargs):
+    """Alignment settings shared by the in-memory and streaming paths."""
+    return {
+        "method": kwargs.get("align_method"),
+        "feature_cache": kwargs.get("feature_cache"),
+        "cache_tag": _calibration_tag(kwargs),
+        "align_downsample": kwargs.get("align_downsample", 1),
+        "align_window": kwargs.get("align_window", False),
+        "align_roi": kwargs.get("align_roi"),
+    }
+
+
+def _transform_cache(input_dir, kwargs, memory_fallback=False):
+    """Registration transform cache; a sidecar file in `input_dir` by default."""
+    from stacking.cache import TransformCache
+
+    setting = kwargs.get("transform_cache", True)
+    tag = _calibration_tag(kwargs)
+    if setting is False:
+        # Multi-pass streaming still benefits from an in-process cache
+        return TransformCache(None, tag=tag) if memory_fallback else None
+    if not isinstance(setting, str):
+        setting = os.path.join(input_dir, TRANSFORM_INDEX)
+    return TransformCache(setting, tag=tag)
+
+
+def _profiler(kwargs, logger, verbose):
+    """StageProfiler for `profile_report`; a disabled one otherwise."""
+    from utils.profiling import StageProfiler
+
+    def log_stage(record):
+        rate = ""
+        if record.frames:
+            rate = f", {record.frames / max(record.wall_s, 1e-9):.1f} frames/s"
+        logger.info(
+            f"[profile] {record.name}: {record.wall_s:.2f}s wall, "
+            f"{record.cpu_s:.2f}s CPU, peak RSS {record.peak_rss_mb:.0f} MB{rate}"
+        )
+
+    return StageProfiler(
+        enabled=bool(kwargs.get("profile_report")),
+        capture=kwargs.get("profile_capture"),
+        on_stage=log_stage if verbose else None,
+    )
+
+
+_EXPLICIT_MODES = ("append", "shards", "stream", "use_memmap")
+
+
+def _make_plan(paths, method, align, calibrated, library, kwargs):
+    from stacking.planner import ExecutionPlanner
+
+    return ExecutionPlanner(kwargs.get("memory_limit_mb")).plan(
+        paths,
+        method=method,
+        align=align,
+        calibrated=calibrated,
+        library=library,
+        quality=_wants_quality(method, kwargs),
+        precision=kwargs.get("precision") or "float32",
+        jobs=kwargs.get("jobs", 1),
+    )
+
+
+def _plan_execution(input_dir, method, align, calibrator, library, logger, verbose,
+                    kwargs):
+    """Choose in-memory, tiled or streaming execution unless one was asked for.
+
+    Updates `kwargs` with the plan's run parameters and returns the plan.
+    """
+    from osiris_io.file_loader import FileLoader
+
+    explicit = any(kwargs.get(key) for key in _EXPLICIT_MODES)
+    if explicit or not kwargs.get("plan", True):
+        return None
+    paths = FileLoader.list_image_paths(input_dir)
+    if not paths:
+        return None
+    plan = _make_plan(paths, method, align, calibrator is not None,
+                      library is not None, kwargs)
+    if verbose:
+        logger.info(plan.describe())
+    kwargs.update(plan.options())
+    return plan
+
+
+def _input_bytes(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def run_pipeline(input_dir, output_path, method="average", align=False, verbose=False, **kwargs):
     from utils import LogManager
 
     logger = LogManager.get_logger()
+    profiler = _profiler(kwargs, logger, verbose)
+    try:
+        return _run_stages(
+            input_dir, output_path, method, align, verbose, logger, profiler, **kwargs
+        )
+    finally:
+        if profiler.enabled:
+            profiler.write(kwargs["profile_report"])
+            if verbose:
+                logger.info(f"Profile report saved to: {kwargs['profile_report']}")
 
-    # 1. Load
-    images = FileLoader.load_images_from_dir(input_dir)
 
-    # 2. Align (Uses NaN for borders)
-    if align:
-        if verbose: logger.info("Aligning frames...")
-        aligned = align_images(images, method=kwargs.get("align_method"), show_progress=True)
-        images = aligned  # Overwrite to free old references
-        gc.collect()
+def _run_stages(input_dir, output_path, method, align, verbose, logger, profiler,
+                **kwargs):
+    from osiris_io.file_loader import FileLoader
+    from osiris_io.file_writer import FileWriter
+    from stacking import Calibrator, align_images, normalize_image, stack_images
+    from stacking.precision import FrameCodec
+    from stacking.quality import measure_frame
+
+    with profiler.stage("calibration"):
+        calib = _load_calibration(kwargs)
+        calibrator = Calibrator(**calib)
+        if calibrator.is_identity:
+            calibrator = None
+        library = _calibration_library(kwargs, bias=calib["bias"], flat=calib["flat"])
+    if library is not None and calib["dark"] is not None:
+        logger.warning("--dark is ignored with --calib-library; "
+                       "darks are matched from the library")
+    _plan_execution(input_dir, method, align, calibrator, library, logger, verbose,
+                    kwargs)
+
+    if kwargs.get("append"):
+        # Only frames missing from the saved state are processed
+        with profiler.stage("stack (append)") as stage:
+            stacked = _append_stack(
+                input_dir, output_path, method, align, calibrator, verbose,
+                library=library, stage=stage, **kwargs
+            )
+    elif kwargs.get("shards"):
+        # Map: shard frames across processes; reduce: merge the partials
+        with profiler.stage("stack (sharded)") as stage:
+            paths = FileLoader.list_image_paths(input_dir)
+            stage.add_frames(len(paths))
+            # Workers read the files; the parent's read counter never sees them
+            stage.add_bytes(_input_bytes(paths))
+            stacked = _sharded_stack(
+                input_dir, method, align, calibrator, verbose, library=library, **kwargs
+            )
+    elif kwargs.get("stream"):
+        # One frame in flight: decode -> calibrate -> align -> accumulate
+        with profiler.stage("stack (stream)") as stage:
+            stage.add_frames(len(FileLoader.list_image_paths(input_dir)))
+            stacked = _stream_stack(
+                input_dir, method, align, calibrator, verbose, library=library, **kwargs
+            )
+    elif (library is None and not _wants_quality(method, kwargs)
+          and _fits_tiled_eligible(input_dir, align, kwargs)):
+        # Memory-mapped FITS: strips are read straight from the files
+        if verbose:
+            logger.info(f"Tiled FITS stacking (Method: {method})...")
+        with profiler.stage("stack (tiled FITS)") as stage:
+            paths = FileLoader.list_image_paths(input_dir)
+            stage.add_frames(len(paths))
+            # Strips are paged in from memory maps, not read()
+            stage.add_bytes(_input_bytes(paths))
+            stacked = _tiled_fits_stack(input_dir, method, calibrator, **kwargs)
+    else:
+        # 1. Load
+        paths = FileLoader.list_image_paths(input_dir)
+        if verbose and (calibrator is not None or library is not None):
+            logger.info("Applying calibration frames...")
+        # Calibrate (and grade) each frame as it arrives, overlapping with decoding
+        grade = _wants_quality(method, kwargs)
+        precision = kwargs.get("precision") or "float32"
+        images, qualities, codec = [], [], None
+        with profiler.stage("load") as stage:
+            for i, img in enumerate(_iter_frames(paths, kwargs, calibrator, library)):
+                if grade:
+                    qualities.append(measure_frame(img, index=i, path=paths[i]))
+                if codec is None:
+                    codec = FrameCodec.for_sample(precision, img)
+                # Native integer frames stay as they are; float ones are compacted
+                images.append(codec.store(img))
+                stage.add_frames()
+        if grade:
+            kept = _grade_frames(qualities, kwargs, logger, verbose)
+            images = [images[q.index] for q in kept]
+            paths = [q.path for q in kept]
+            kwargs["weights"] = [q.weight for q in kept]
+            # The best-graded frame becomes the alignment reference
+            best = max(kept, key=lambda q: q.score)
+            kwargs["reference_index"] = kept.index(best)
+
+        # 2. Align (Uses NaN for borders)
+        if align:
+            if verbose:
+                logger.info("Aligning frames...")
+            cache = _transform_cache(input_dir, kwargs)
+            started = time.perf_counter()
+            with profiler.stage("align") as stage:
+                aligned = align_images(
+                    images,
+                    reference_index=kwargs.get("reference_index", 0),
+                    show_progress=True,
+                    jobs=kwargs.get("jobs", 1),
+                    paths=paths,
+                    transform_cache=cache,
+                    codec=codec,
+                    **_align_options(kwargs),
+                )
+                stage.add_frames(len(aligned))
+            if verbose:
+                _log_alignment(logger, len(aligned), started, cache)
+            images = aligned  # Overwrite to free old references
+            gc.collect()
 
-    # 3. Stack (Memory Safe)
-    if verbose: logger.info(f"Stacking images (Method: {method})...")
-    stacked = stack_images(images, method=method, **kwargs)
+        if codec is not None and codec.clipped:
+            logger.warning(
+                f"{codec.clipped} sample(s) outside the {codec.name} storage range "
+                "were clipped; use --precision float32 to keep them"
+            )
 
-    # Clear RAM
-    del images
-    gc.collect()
+        # 3. Stack (Memory Safe)
+        if verbose:
+            logger.info(f"Stacking images (Method: {method})...")
+        noise_map = kwargs.get("noise_map")
+        with profiler.stage("stack") as stage:
+            stage.add_frames(len(images))
+            if noise_map and method == "average" and not kwargs.get("use_memmap"):
+                strategy = _average_strategy(kwargs)
+                stacked = strategy.combine(codec.decode(img) for img in images)
+                _write_noise_map(noise_map, strategy, logger, verbose)
+            else:
+                stacked = stack_images(images, method=method, codec=codec, **kwargs)
+
+        # Clear RAM
+        del images
+        gc.collect()
 
     # 4. Postprocess (Fixed assignment!)
     if verbose: logger.info("Performing Color Neutralization and Stretch...")
-    final_image = normalize_image(stacked, out_dtype=np.uint8)
+    with profiler.stage("postprocess"):
+        final_image = normalize_image(
+            stacked, out_dtype=np.uint8, **_stretch_options(kwargs)
+        )
 
     # 5. Save
-    FileWriter.save_image(output_path, final_image)
+    with profiler.stage("write"):
+        FileWriter.save_image(output_path, final_image)
     if verbose: logger.info(f"Successfully saved to: {output_path}")
+    return output_path
+
+
+def _stretch_options(kwargs):
+    """normalize_image() keywords from the run parameters."""
+    options = {"stretch": kwargs.get("stretch") or "gamma"}
+    for key in ("gamma", "asinh_beta", "midtone"):
+        if kwargs.get(key) is not None:
+            options[key] = kwargs[key]
+    return options
+
+
+def _wants_quality(method, kwargs):
+    return bool(
+        method == "weighted"
+        or kwargs.get("reject_worst")
+        or kwargs.get("quality_report")
+    )
+
+
+def _grade_frames(qualities, kwargs, logger, verbose):
+    """Grade measured frames; returns the kept ones, best first."""
+    from stacking.quality import grade_frames, write_quality_report
+
+    grade_frames(qualities, reject_fraction=kwargs.get("reject_worst") or 0.0)
+    if kwargs.get("quality_report"):
+        write_quality_report(kwargs["quality_report"], qualities)
+    kept = [q for q in qualities if not q.rejected]
+    if verbose:
+        logger.info(f"Quality: kept {len(kept)} of {len(qualities)} frames")
+    return kept
+
+
+def _fits_tiled_eligible(input_dir, align, kwargs):
+    """Unaligned memmap runs over FITS-only input can skip the temp cube."""
+    from osiris_io.file_loader import FileLoader, fits
+
+    if align or not kwargs.get("use_memmap") or fits is None:
+        return False
+    paths = FileLoader.list_image_paths(input_dir)
+    return bool(paths) and all(p.lower().endswith((".fits", ".fit")) for p in paths)
+
+
+def _tiled_fits_stack(input_dir, method, calibrator, **kwargs):
+    from osiris_io.file_loader import FileLoader
+    from stacking.tiled import TiledCombineEngine
+
+    preprocess = None
+    if calibrator is not None:
+        def preprocess(strip, rows):
+            # Strips read from FITS are fresh float32 arrays: calibrate in place
+            return calibrator.apply(strip, out=strip, rows=rows)
+
+    engine = TiledCombineEngine(
+        method=method,
+        memory_limit_mb=kwargs.get("memory_limit_mb"),
+        sigma=kwargs.get("sigma", 3.0),
+        iters=kwargs.get("sigma_iters", 5),
+        clip_mode=kwargs.get("clip_mode", "sigma"),
+        clip_low=kwargs.get("clip_low"),
+        clip_high=kwargs.get("clip_high"),
+    )
+    return engine.combine_handles(FileLoader.list_frames(input_dir), preprocess)
+
+
+def _calibration_library(kwargs, bias=None, flat=None):
+    """Exposure/temperature-matched darks from `calib_library`, if configured.
+
+    `bias` is used for frames the library has no bias for.
+    """
+    from stacking.library import CalibrationLibrary
+
+    directory = kwargs.get("calib_library")
+    if not directory:
+        return None
+    return CalibrationLibrary.from_directory(
+        directory,
+        bias=bias,
+        flat=flat,
+        temp_tolerance=kwargs.get("temp_tolerance", 2.0),
+        temp_doubling=kwargs.get("temp_doubling"),
+    )
+
+
+def _iter_frames(paths, kwargs, calibrator=None, library=None, reuse_buffer=False):
+    """Decode (prefetched) and calibrate frames in order.
+
+    With a library, each frame's header picks its own Calibrator.
+    `reuse_buffer` writes every calibrated frame into one buffer; only safe
+    for consumers that finish with a frame before asking for the next
+    (accumulators, and alignment, which copies its reference).
+    """
+    from osiris_io.file_loader import FileLoader
+    from stacking.library import FrameInfo
+
+    shared = kwargs.get("shared")
+    if shared is not None and shared.frames is not None:
+        # Batch runs reading the same files decode each one once
+        paths = shared.frames.handles(paths)
+    frames = FileLoader.iter_prefetched(
+        paths, return_headers=library is not None, **_io_options(kwargs)
+    )
+    buf = None
+    for item in frames:
+        if library is not None:
+            img, header = item
+            cal = library.calibrator_for(FrameInfo.from_header(header))
+        else:
+            img, cal = item, calibrator
+        if cal is None:
+            yield img
+            continue
+        if reuse_buffer:
+            if buf is None or buf.shape != img.shape:
+                buf = np.empty(img.shape, dtype=np.float32)
+            yield cal.apply(img, out=buf)
+        else:
+            yield cal.apply(img)
+
+
+def _average_strategy(kwargs):
+    from stacking.combine import StreamingAverageStrategy
+
+    return StreamingAverageStrategy(kwargs.get("accumulator_precision", "float64"))
 
 
-def main():
+def _write_noise_map(path, accumulator, logger, verbose):
+    """Save the per-pixel standard error of the mean as float32."""
+    from osiris_io.file_writer import FileWriter
+
+    FileWriter.save_image(path, accumulator.noise())
+    if verbose:
+        logger.info(f"Noise map saved to: {path}")
+
+
+def _log_alignment(logger, n_frames, started, cache):
+    elapsed = time.perf_counter() - started
+    detail = ""
+    if cache is not None:
+        detail = f" ({cache.hits} cached, {cache.misses} computed transforms)"
+    logger.info(f"Aligned {n_frames} frames in {elapsed:.2f}s{detail}")
+
+
+def _stream_stack(input_dir, method, align, calibrator, verbose, library=None,
+                  **kwargs):
+    """Stack frames straight from disk without ever holding the whole set."""
+    from osiris_io.file_loader import FileLoader
+    from stacking.align import iter_aligned
+    from stacking.combine import StreamingSigmaClipStrategy, WeightedAverageStrategy
+    from stacking.median import HistogramMedianStrategy
+    from stacking.quality import measure_frame
+    from utils import LogManager
+
+    if method not in ("average", "sigma", "weighted", "median"):
+        raise ValueError(f"Streaming mode does not support method '{method}'")
+    if method == "median" and (align or calibrator is not None or library is not None):
+        raise ValueError(
+            "Streaming median works on raw integer frames; drop --align and "
+            "calibration, or use --use-memmap"
+        )
+
+    logger = LogManager.get_logger()
+    paths = FileLoader.list_image_paths(input_dir)
+    weights = None
+    if _wants_quality(method, kwargs):
+        # Grading pre-pass: one decode per frame, nothing kept but the metrics
+        qualities = [
+            measure_frame(img, index=i, path=paths[i])
+            for i, img in enumerate(_iter_frames(paths, kwargs, calibrator, library))
+        ]
+        kept = sorted(_grade_frames(qualities, kwargs, logger, verbose),
+                      key=lambda q: q.score, reverse=True)
+        # Best frame first: iter_aligned uses the first frame as reference
+        paths = [q.path for q in kept]
+        weights = [q.weight for q in kept]
+    # Shared across passes, so multi-pass combines register each frame once
+    cache = _transform_cache(input_dir, kwargs, memory_fallback=True) if align else None
+
+    def frames():
+        stream = _iter_frames(paths, kwargs, calibrator, library, reuse_buffer=True)
+        if align:
+            stream = iter_aligned(
+                stream, paths=paths, transform_cache=cache, **_align_options(kwargs)
+            )
+        return stream
+
+    if verbose:
+        logger.info(f"Streaming frames from {input_dir} (Method: {method})...")
+    started = time.perf_counter()
+    if method == "sigma":
+        # Re-reads the directory once per pass instead of holding the stack
+        strategy = StreamingSigmaClipStrategy(
+            sigma=kwargs.get("sigma", 3.0), iters=kwargs.get("sigma_iters", 5)
+        )
+        stacked = strategy.combine(frames)
+    elif method == "weighted":
+        stacked = WeightedAverageStrategy().combine(frames(), weights)
+    elif method == "median":
+        # Exact radix-histogram median: a few passes, no frame cube
+        stacked = HistogramMedianStrategy().combine(frames)
+    else:
+        strategy = _average_strategy(kwargs)
+        stacked = strategy.combine(frames())
+        if kwargs.get("noise_map"):
+            _write_noise_map(kwargs["noise_map"], strategy, logger, verbose)
+    if verbose and align:
+        _log_alignment(logger, len(paths), started, cache)
+    return stacked
+
+
+def _sharded_stack(input_dir, method, align, calibrator, verbose, library=None,
+                   **kwargs):
+    """Stack in worker processes through mergeable on-disk partial results."""
+    from osiris_io.file_loader import FileLoader
+    from stacking.sharded import ShardedStacker
+    from utils import LogManager
+
+    logger = LogManager.get_logger()
+    paths = FileLoader.list_image_paths(input_dir)
+    stacker = ShardedStacker(
+        method=method,
+        workers=kwargs["shards"],
+        shard_dir=kwargs.get("shard_dir"),
+        sigma=kwargs.get("sigma", 3.0),
+        iters=kwargs.get("sigma_iters", 5),
+        calibrator=calibrator,
+        library=library,
+        align=align,
+        align_options=_align_options(kwargs),
+    )
+    if verbose:
+        n = len(stacker.shards(paths))
+        logger.info(f"Stacking {len(paths)} frames in {n} shards (Method: {method})...")
+    started = time.perf_counter()
+    merged = stacker.stack(paths)
+    elapsed = time.perf_counter() - started
+    if verbose:
+        logger.info(f"Sharded stack finished in {elapsed:.2f}s")
+    _save_accumulator_outputs(
+        merged, stacker.partial_meta(paths), kwargs, logger, verbose
+    )
+    return merged.finalize()
+
+
+def _append_stack(input_dir, output_path, method, align, calibrator, verbose,
+                  library=None, stage=None, **kwargs):
+    """Merge the frames not yet stacked into the state saved next to the output."""
+    from osiris_io.file_loader import FileLoader
+    from stacking.incremental import IncrementalStacker
+    from utils import LogManager
+
+    logger = LogManager.get_logger()
+    align_options = _align_options(kwargs)
+    stacker = IncrementalStacker(
+        output_path,
+        method=method,
+        settings={
+            "sigma": kwargs.get("sigma", 3.0),
+            "iters": kwargs.get("sigma_iters", 5),
+            "align": align,
+            "align_options": align_options,
+            "calib_library": kwargs.get("calib_library"),
+        },
+        workers=kwargs.get("shards") or 1,
+        sigma=kwargs.get("sigma", 3.0),
+        iters=kwargs.get("sigma_iters", 5),
+        calibrator=calibrator,
+        library=library,
+        align=align,
+        align_options=align_options,
+    )
+    paths = FileLoader.list_image_paths(input_dir)
+    acc, new, reason = stacker.update(paths)
+    if stage is not None:
+        stage.add_frames(len(new))
+    if verbose:
+        if reason:
+            logger.info(f"Append: starting a new stack ({reason})")
+        logger.info(f"Append: {len(new)} new of {len(paths)} frames stacked")
+    if acc.count is None:
+        raise ValueError(f"No frames to stack in {input_dir}")
+    _save_accumulator_outputs(acc, {"method": method}, kwargs, logger, verbose)
+    return acc.finalize()
+
+
+def _save_accumulator_outputs(accumulator, meta, kwargs, logger, verbose):
+    """Optional by-products of merged stacks: noise map and merged partial."""
+    if kwargs.get("noise_map"):
+        _write_noise_map(kwargs["noise_map"], accumulator, logger, verbose)
+    if kwargs.get("partial_out"):
+        accumulator.save(kwargs["partial_out"], **meta)
+        if verbose:
+            logger.info(f"Partial result saved to: {kwargs['partial_out']}")
+
+
+def merge_main(argv):
+    """`merge` subcommand: reduce partial results from sharded runs."""
+    import glob
+
+    from osiris_io.file_writer import FileWriter
+    from stacking import normalize_image
+    from stacking.sharded import merge_partials
+    from utils import LogManager
+
+    parser = argparse.ArgumentParser(
+        prog="osiris merge", description="Merge partial stack results"
+    )
+    parser.add_argument("partials", nargs="+",
+                        help="Partial .npz files, or directories containing them")
+    parser.add_argument("--output", "-o", required=True)
+    parser.add_argument("--noise-map", help="Write the per-pixel noise (FITS)")
+    parser.add_argument("--partial-out", help="Also write the merged partial")
+    parser.add_argument("--stretch", choices=["gamma", "asinh", "mtf", "linear"])
+    args = parser.parse_args(argv)
+
+    logger = LogManager.get_logger()
+    paths = []
+    for item in args.partials:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.npz"))))
+        else:
+            paths.append(item)
+    merged, meta = merge_partials(paths)
+    logger.info(f"Merged {len(paths)} partials ({len(meta['frames'])} frames)")
+    _save_accumulator_outputs(merged, meta, vars(args), logger, True)
+    FileWriter.save_image(
+        args.output, normalize_image(merged.finalize(), **_stretch_options(vars(args)))
+    )
+    logger.info(f"Successfully saved to: {args.output}")
+    return args.output
+
+
+def masters_main(argv):
+    """`masters` subcommand: build (or fetch cached) calibration masters."""
+    from osiris_io.file_writer import FileWriter
+    from stacking.masters import MasterFrameBuilder
+    from utils import LogManager
+
+    parser = argparse.ArgumentParser(
+        prog="osiris masters", description="Build calibration master frames"
+    )
+    parser.add_argument("--bias", help="Directory of bias frames")
+    parser.add_argument("--dark", help="Directory of dark frames")
+    parser.add_argument("--flat", help="Directory of flat frames")
+    parser.add_argument("--out", "-o", required=True, help="Output directory")
+    parser.add_argument("--method", "-m", default="sigma",
+                        choices=["average", "median", "sigma"])
+    parser.add_argument("--masters-cache", help="Cache directory for masters")
+    args = parser.parse_args(argv)
+    if not (args.bias or args.dark or args.flat):
+        parser.error("At least one of --bias, --dark or --flat is required.")
+
+    logger = LogManager.get_logger()
+    builder = MasterFrameBuilder(cache_dir=args.masters_cache, method=args.method)
+    masters = builder.build_all(bias=args.bias, dark=args.dark, flat=args.flat)
+    os.makedirs(args.out, exist_ok=True)
+    for name, master in masters.items():
+        if master is None:
+            continue
+        path = os.path.join(args.out, f"master_{name}.fits")
+        FileWriter.save_image(path, master)
+        logger.info(f"Saved master {name} to: {path}")
+
+
+def watch_main(argv):
+    """`watch` subcommand: live-stack frames as they land in a directory."""
+    from collections import deque
+
+    from osiris_io.file_loader import FileLoader
+    from osiris_io.watcher import DirectoryWatcher
+    from stacking import Calibrator
+    from stacking.live import LivePreview, LiveStacker
+    from utils import LogManager
+
+    parser = argparse.ArgumentParser(
+        prog="osiris watch", description="Live-stack a directory during capture"
+    )
+    parser.add_argument("--input", "-i", required=True, help="Directory to watch")
+    parser.add_argument("--output", "-o", required=True,
+                        help="Preview image, rewritten as the stack grows")
+    parser.add_argument("--align", action="store_true")
+    parser.add_argument("--align-method", choices=["phase", "feature"], default="phase")
+    parser.add_argument("--align-downsample", type=int, default=4,
+                        help="Phase-correlate on a 1/N luminance (default 4)")
+    parser.add_argument("--bias")
+    parser.add_argument("--dark")
+    parser.add_argument("--flat")
+    parser.add_argument("--stretch", choices=["gamma", "asinh", "mtf", "linear"])
+    parser.add_argument("--preview-interval", type=float, default=10.0,
+                        help="Seconds between preview writes")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--polling", action="store_true",
+                        help="Poll the directory instead of using inotify")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="Ignore frames already in the directory")
+    parser.add_argument("--idle-timeout", type=float,
+                        help="Stop after this many seconds without a new frame")
+    parser.add_argument("--max-frames", type=int, help="Stop after this many frames")
+    parser.add_argument("--retry-delay", type=float, default=2.0,
+                        help="Seconds before a frame that failed is tried once more")
+    args = parser.parse_args(argv)
+    params = vars(args)
+
+    logger = LogManager.get_logger()
+    calibrator = Calibrator(**_load_calibration(params))
+    stacker = LiveStacker(
+        calibrator=None if calibrator.is_identity else calibrator,
+        align=args.align,
+        align_options=_align_options(params),
+    )
+    preview = LivePreview(stacker, args.output, _stretch_options(params))
+    watcher = DirectoryWatcher(
+        args.input, poll_interval=args.poll_interval, use_inotify=not args.polling
+    )
+    existing = watcher.existing()
+    queue = deque([] if args.skip_existing else existing)
+    logger.info(f"Watching {args.input} ({watcher.backend}); "
+                f"{len(queue)} existing frame(s) queued")
+    # Frames that failed once (e.g. still being written): (due time, path)
+    retries, failed = deque(), set()
+    last_frame = last_preview = time.monotonic()
+    try:
+        while args.max_frames is None or stacker.frames < args.max_frames:
+            now = time.monotonic()
+            while retries and retries[0][0] <= now:
+                queue.append(retries.popleft()[1])
+            if not queue:
+                timeout = args.poll_interval
+                if retries:
+                    timeout = min(timeout, retries[0][0] - now)
+                queue.extend(watcher.poll(max(timeout, 0.0)))
+            now = time.monotonic()
+            if queue:
+                path = queue.popleft()
+                started = time.perf_counter()
+                try:
+                    img = FileLoader.load_image(path)
+                    stacker.add(img, path)
+                except Exception as exc:
+                    if path in failed:
+                        logger.warning(f"Skipping {path}: {exc}")
+                    else:
+                        failed.add(path)
+                        retries.append((now + args.retry_delay, path))
+                        logger.warning(f"Could not stack {path} ({exc}); "
+                                       f"retrying in {args.retry_delay:g}s")
+                else:
+                    latency = time.perf_counter() - started
+                    logger.info(f"Stacked {os.path.basename(path)} in {latency:.2f}s "
+                                f"({stacker.frames} frames)")
+                    last_frame = now
+            elif (not retries and args.idle_timeout
+                  and now - last_frame >= args.idle_timeout):
+                logger.info(f"No new frames for {args.idle_timeout:.0f}s; stopping")
+                break
+            if now - last_preview >= args.preview_interval and preview.update():
+                last_preview = now
+    except KeyboardInterrupt:
+        logger.info("Stopping")
+    finally:
+        watcher.close()
+        preview.update(wait=True)
+    if preview.written:
+        logger.info(f"Preview of {stacker.frames} frames saved to: {args.output}")
+    return stacker
+
+
+def _batch_jobs(parser, args, profiles):
+    """BatchJob per requested profile, with the CLI options applied to each."""
+    from stacking.batch import BatchJob
+
+    if args.input or args.output:
+        parser.error("Batch mode takes input and output paths from each profile.")
+    if args.all_profiles:
+        names = [name for name, data in profiles.items() if isinstance(data, dict)]
+    else:
+        names = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    unknown = [name for name in names if name not in profiles]
+    if unknown:
+        parser.error(f"Unknown profile(s): {', '.join(unknown)}")
+    if not names:
+        parser.error("No profiles to run.")
+    jobs = []
+    for name in names:
+        data = profiles[name]
+        if not data.get("input") or not data.get("output"):
+            parser.error(f"Profile '{name}' needs input and output paths.")
+        params = _run_params(args, data)
+        jobs.append(BatchJob(name, data["input"], data["output"], params))
+    outputs = [os.path.abspath(job.output_path) for job in jobs]
+    if len(set(outputs)) < len(outputs):
+        parser.error("Batch profiles must write to different outputs.")
+    return jobs
+
+
+def _job_cores(params, total):
+    """Cores a batch job occupies; process-wide profiling runs alone."""
+    if params.get("profile_capture"):
+        return total
+    jobs = params.get("jobs", 1)
+    cores = max(total if jobs == 0 else jobs or 1, params.get("shards") or 1)
+    return min(cores, total)
+
+
+def _job_memory_mb(job):
+    """Planned peak memory (MB) of a batch job, from its frame headers."""
+    from osiris_io.file_loader import FileLoader
+
+    params = job.params
+    if not os.path.isdir(job.input_dir):
+        return 0.0
+    paths = FileLoader.list_image_paths(job.input_dir)
+    if not paths:
+        return 0.0
+    calibrated = any(params.get(name) for name in ("bias", "dark", "flat"))
+    plan = _make_plan(paths, params["method"], params["align"], calibrated,
+                      bool(params.get("calib_library")), params)
+    if params.get("shards"):
+        return plan.estimates_mb["stream"] * params["shards"]
+    if params.get("stream") or params.get("append"):
+        return plan.estimates_mb["stream"]
+    if params.get("use_memmap"):
+        return plan.estimates_mb["tiled"]
+    if not params.get("plan", True):
+        return plan.estimates_mb["memory"]
+    return plan.estimated_mb
+
+
+def _run_batch(parser, args, profiles):
+    """Run several profiles in one process under a core and memory budget.
+
+    Calibration masters are loaded once per set of calibration inputs, and
+    frames read by more than one profile are decoded once. A quarter of the
+    memory budget is kept for those shared frames; each job plans its
+    execution within the rest.
+    """
+    from osiris_io.file_loader import FileLoader
+    from osiris_io.frame_cache import SharedFrameCache
+    from stacking.batch import BatchScheduler, SharedResources
+    from utils import LogManager
+
+    logger = LogManager.get_logger()
+    jobs = _batch_jobs(parser, args, profiles)
+    scheduler = BatchScheduler(cores=args.batch_cores,
+                               memory_limit_mb=args.memory_limit)
+    frames = SharedFrameCache()
+    for job in jobs:
+        if os.path.isdir(job.input_dir):
+            frames.expect(FileLoader.list_image_paths(job.input_dir))
+    if frames.overlap:
+        cache_mb = scheduler.memory_mb / 4
+        frames.max_bytes = int(cache_mb * 1024 * 1024)
+        scheduler.memory_mb -= cache_mb
+    shared = SharedResources(frames if frames.overlap else None)
+    for job in jobs:
+        limit = job.params.get("memory_limit_mb")
+        job.params["memory_limit_mb"] = (
+            min(limit, scheduler.memory_mb) if limit else scheduler.memory_mb
+        )
+        job.params["shared"] = shared
+        job.cores = _job_cores(job.params, scheduler.cores)
+        job.memory_mb = _job_memory_mb(job)
+    logger.info(
+        f"Batch of {len(jobs)} profiles on {scheduler.cores} core(s), "
+        f"{scheduler.memory_mb:.0f} MB; {frames.overlap} frame(s) read by several"
+    )
+
+    def started(job):
+        logger.info(f"[{job.name}] started ({job.cores} core(s), "
+                    f"~{job.memory_mb:.0f} MB planned)")
+
+    def finished(job):
+        if job.ok:
+            logger.info(f"[{job.name}] done in {job.elapsed_s:.1f}s: {job.output_path}")
+        else:
+            logger.error(f"[{job.name}] failed: {job.error}")
+
+    def run_job(job):
+        run_pipeline(job.input_dir, job.output_path, verbose=args.verbose, **job.params)
+
+    wall = time.perf_counter()
+    jobs = scheduler.run(jobs, run_job, on_start=started, on_done=finished)
+    failed = [job.name for job in jobs if not job.ok]
+    logger.info(
+        f"Batch finished in {time.perf_counter() - wall:.1f}s: "
+        f"{len(jobs) - len(failed)}/{len(jobs)} profiles, "
+        f"{frames.hits} frame decode(s) shared"
+    )
+    if failed:
+        raise SystemExit(f"Failed profile(s): {', '.join(failed)}")
+    return jobs
+
+
+def _run_params(args, profile_data):
+    """run_pipeline() parameters from the CLI and a profile (CLI has priority)."""
+    return {
+        "method": args.method or profile_data.get("method", "average"),
+        "align": args.align or profile_data.get("align", False),
+        "use_memmap": args.use_memmap or profile_data.get("use_memmap", False),
+        "stream": args.stream or profile_data.get("stream", False),
+        "sigma": profile_data.get("sigma", 3.0),
+        "sigma_iters": profile_data.get("sigma_iters", 5),
+        "clip_mode": args.clip_mode or profile_data.get("clip_mode", "sigma"),
+        "clip_low": profile_data.get("clip_low"),
+        "clip_high": profile_data.get("clip_high"),
+        "align_method": profile_data.get("align_method", "phase"),
+        "align_downsample": (
+            args.align_downsample or profile_data.get("align_downsample", 1)
+        ),
+        "align_window": profile_data.get("align_window", False),
+        "align_roi": profile_data.get("align_roi"),
+        "feature_cache": args.feature_cache or profile_data.get("feature_cache"),
+        "transform_cache": (
+            False if args.no_transform_cache
+            else args.transform_cache or profile_data.get("transform_cache", True)
+        ),
+        "io_workers": args.io_workers or profile_data.get("io_workers"),
+        "prefetch": args.prefetch or profile_data.get("prefetch"),
+        "bias": args.bias or profile_data.get("bias"),
+        "dark": args.dark or profile_data.get("dark"),
+        "flat": args.flat or profile_data.get("flat"),
+        "masters_cache": args.masters_cache or profile_data.get("masters_cache"),
+        "masters_method": profile_data.get("masters_method", "sigma"),
+        "calib_library": args.calib_library or profile_data.get("calib_library"),
+        "temp_tolerance": profile_data.get("temp_tolerance", 2.0),
+        "temp_doubling": profile_data.get("temp_doubling"),
+        "reject_worst": args.reject_worst or profile_data.get("reject_worst", 0.0),
+        "quality_report": args.quality_report or profile_data.get("quality_report"),
+        "noise_map": args.noise_map or profile_data.get("noise_map"),
+        "shards": args.shards or profile_data.get("shards"),
+        "shard_dir": args.shard_dir or profile_data.get("shard_dir"),
+        "partial_out": args.partial_out,
+        "accumulator_precision": profile_data.get("accumulator_precision", "float64"),
+        "precision": args.precision or profile_data.get("precision", "float32"),
+        "stretch": args.stretch or profile_data.get("stretch", "gamma"),
+        "gamma": profile_data.get("gamma"),
+        "asinh_beta": profile_data.get("asinh_beta"),
+        "midtone": profile_data.get("midtone"),
+        "append": args.append or profile_data.get("append", False),
+        "memory_limit_mb": args.memory_limit or profile_data.get("memory_limit_mb"),
+        "plan": not args.no_plan and profile_data.get("plan", True),
+        "profile_report": args.profile_report or profile_data.get("profile_report"),
+        "profile_capture": args.profile_capture or profile_data.get("profile_capture"),
+        "jobs": args.jobs if args.jobs is not None else profile_data.get("jobs", 1),
+    }
+
+
+def main(argv=None):
+    import sys
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "masters":
+        return masters_main(argv[1:])
+    if argv and argv[0] == "merge":
+        return merge_main(argv[1:])
+    if argv and argv[0] == "watch":
+        return watch_main(argv[1:])
+    if argv and argv[0] == "benchmark":
+        from benchmarks.suite import main as benchmark_main
+
+        return benchmark_main(argv[1:])
+
     parser = argparse.ArgumentParser(description="Osiris Stacker CLI")
     parser.add_argument("--input", "-i")
     parser.add_argument("--output", "-o")
     parser.add_argument("--method", "-m")
     parser.add_argument("--profile", "-p")
+    parser.add_argument("--profiles",
+                        help="Comma-separated profiles to run as one batch")
+    parser.add_argument("--all-profiles", action="store_true",
+                        help="Run every profile in osiris.toml as one batch")
+    parser.add_argument("--batch-cores", type=int,
+                        help="Cores shared by concurrent batch jobs (default: all)")
     parser.add_argument("--align", "-a", action="store_true")
     parser.add_argument("--verbose", "-v", action="store_true", default=True)
     parser.add_argument("--use-memmap", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--bias", help="Bias frame, or directory of bias frames")
+    parser.add_argument("--dark", help="Dark frame, or directory of dark frames")
+    parser.add_argument("--flat", help="Flat frame, or directory of flat frames")
+    parser.add_argument("--masters-cache", help="Cache directory for built masters")
+    parser.add_argument("--calib-library",
+                        help="Directory of master darks/biases matched per frame")
+    parser.add_argument("--reject-worst", type=float,
+                        help="Drop this fraction of the lowest-graded frames")
+    parser.add_argument("--quality-report", help="Write per-frame metrics to CSV")
+    parser.add_argument("--clip-mode",
+                        choices=["sigma", "winsorized", "percentile", "linear"],
+                        help="Rejection used by --method sigma (in-memory/memmap)")
+    parser.add_argument("--precision", choices=["float32", "float16", "uint16"],
+                        help="Storage of frames held between align and stack")
+    parser.add_argument("--stretch", choices=["gamma", "asinh", "mtf", "linear"],
+                        help="Tone curve applied to the stacked image")
+    parser.add_argument("--append", action="store_true",
+                        help="Only stack frames not in the state saved next to "
+                             "the output")
+    parser.add_argument("--memory-limit", type=float,
+                        help="Memory budget in MB (default: DefaultConfig, 1024)")
+    parser.add_argument("--no-plan", action="store_true",
+                        help="Keep the in-memory path instead of planning by memory")
+    parser.add_argument("--profile-report",
+                        help="Write per-stage time, memory and throughput as JSON")
+    parser.add_argument("--profile-capture", choices=["cprofile", "tracemalloc"],
+                        help="Deep-dive capture added to --profile-report")
+    parser.add_argument("--shards", type=int,
+                        help="Stack frame shards in N processes (average/sigma)")
+    parser.add_argument("--shard-dir",
+                        help="Keep the per-shard partial results in this directory")
+    parser.add_argument("--partial-out",
+                        help="Write the merged partial result for `osiris merge`")
+    parser.add_argument("--noise-map",
+                        help="Write the per-pixel noise of an average stack (FITS)")
+    parser.add_argument("--align-downsample", type=int,
+                        help="Register on a 1/N block-averaged luminance (phase)")
+    parser.add_argument("--feature-cache",
+                        help="Directory for cached ORB features (feature alignment)")
+    parser.add_argument("--transform-cache",
+                        help="Registration transform index (default: sidecar in input)")
+    parser.add_argument("--no-transform-cache", action="store_true")
+    parser.add_argument("--io-workers", type=int, help="Frame decoding threads")
+    parser.add_argument("--prefetch", type=int,
+                        help="Max decoded frames waiting to be processed")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Alignment worker processes (0 = all cores)")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Profile integration
     import tomllib
@@ -59,6 +1039,9 @@ def main():
         with open("osiris.toml", "rb") as f:
             profiles = tomllib.load(f)
 
+    if args.profiles or args.all_profiles:
+        return _run_batch(parser, args, profiles)
+
     profile_data = profiles.get(args.profile, {}) if args.profile else {}
 
     # Merge CLI and Profile (CLI has priority)
@@ -69,14 +1052,7 @@ def main():
         parser.error("Input and Output paths required via CLI or Profile.")
 
     # Prepare safe arguments
-    run_params = {
-        "method": args.method or profile_data.get("method", "average"),
-        "align": args.align or profile_data.get("align", False),
-        "use_memmap": args.use_memmap or profile_data.get("use_memmap", False),
-        "chunk_size": profile_data.get("chunk_size", 3),
-        "sigma": profile_data.get("sigma", 3.0),
-        "align_method": profile_data.get("align_method", "phase")
-    }
+    run_params = _run_params(args, profile_data)
 
     run_pipeline(
         input_dir=input_path,
@@ -87,4 +1063,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
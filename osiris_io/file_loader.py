@@ -1,7 +1,10 @@
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable, List
 
 import imageio.v3 as iio
+import numpy as np
 
 try:
     from astropy.io import fits
@@ -12,6 +15,149 @@ except Exception:
 EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".fits", ".fit")
 
 
+def _is_fits(path: str) -> bool:
+    return path.lower().endswith((".fits", ".fit")) and fits is not None
+
+
+# Pillow mode -> (numpy dtype, bands) as decoded by imageio
+_PIL_MODES = {
+    "1": ("bool", 1), "L": ("uint8", 1), "P": ("uint8", 1), "LA": ("uint8", 2),
+    "RGB": ("uint8", 3), "RGBA": ("uint8", 4), "I;16": ("uint16", 1),
+    "I;16B": ("uint16", 1), "I": ("int32", 1), "F": ("float32", 1),
+}
+
+
+def _fits_dtype(hdr):
+    """dtype astropy returns for a primary HDU (scaled data is float32)."""
+    bitpix, bzero = hdr["BITPIX"], hdr.get("BZERO", 0)
+    if hdr.get("BSCALE", 1) != 1:
+        return np.dtype(np.float32)
+    if bitpix == 16 and bzero == 32768:
+        return np.dtype(np.uint16)
+    if bzero != 0:
+        return np.dtype(np.float32)
+    return np.dtype({8: "uint8", 16: "int16", 32: "int32", 64: "int64",
+                     -32: "float32", -64: "float64"}[bitpix])
+
+
+def _fits_pixels(hdu, rows=None, dtype=None):
+    """Native copy of (rows of) a primary HDU opened unscaled and mapped.
+
+    BSCALE/BZERO are applied and BLANK samples of scaled data become NaN,
+    as astropy's own scaling would; `dtype` defaults to what astropy
+    returns for the header (see `_fits_dtype`).
+    """
+    hdr = hdu.header
+    dtype = np.dtype(dtype or _fits_dtype(hdr))
+    raw = hdu.data if rows is None else hdu.data[rows]
+    bzero = hdr.get("BZERO", 0)
+    if dtype.kind in "iu":
+        # Unscaled integers, or uint16 stored as int16 with BZERO = 32768
+        out = raw.astype(dtype)
+        if bzero:
+            out += dtype.type(bzero)
+        return out
+    out = raw.astype(dtype)
+    blank = hdr.get("BLANK")
+    if blank is not None and raw.dtype.kind in "iu":
+        out[raw == blank] = np.nan
+    bscale = hdr.get("BSCALE", 1)
+    if bscale != 1:
+        out *= dtype.type(bscale)
+    if bzero != 0:
+        out += dtype.type(bzero)
+    return out
+
+
+class FrameHandle:
+    """Lazy reference to a frame on disk; nothing is decoded until `load()`.
+
+    For FITS files `read(rows)` memory-maps the primary HDU and converts only
+    the requested rows from big-endian to native float32 (applying
+    BSCALE/BZERO/BLANK), so tiled consumers never touch the rest of the file.
+    The file is closed again after each read, so any number of handles
+    can be read strip by strip; inside ``with handle:`` it stays open
+    across reads. Other formats have to be decoded whole and are sliced
+    afterwards.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._hdul = None
+        self._keep_open = False
+
+    def load(self, return_header: bool = False):
+        return FileLoader.load_image(self.path, return_header=return_header)
+
+    @property
+    def row_access(self) -> bool:
+        """True when `read(rows)` reads only those rows (memory-mapped FITS)."""
+        return _is_fits(self.path)
+
+    @property
+    def shape(self):
+        if _is_fits(self.path):
+            hdr = fits.getheader(self.path)
+            return tuple(hdr[f"NAXIS{i}"] for i in range(hdr["NAXIS"], 0, -1))
+        return self.load().shape
+
+    def info(self):
+        """`(shape, dtype)` of `load()`, from the file header where possible.
+
+        FITS, TIFF and the Pillow formats (PNG, JPEG) are described without
+        decoding any pixels; anything else falls back to a full decode.
+        """
+        if _is_fits(self.path):
+            hdr = fits.getheader(self.path)
+            shape = tuple(hdr[f"NAXIS{i}"] for i in range(hdr["NAXIS"], 0, -1))
+            return shape, _fits_dtype(hdr)
+        if self.path.lower().endswith((".tif", ".tiff")):
+            import tifffile
+
+            with tifffile.TiffFile(self.path) as tif:
+                series = tif.series[0]
+                return tuple(series.shape), np.dtype(series.dtype)
+        try:
+            from PIL import Image
+
+            with Image.open(self.path) as im:
+                dtype, bands = _PIL_MODES[im.mode]
+                shape = (im.height, im.width) + ((bands,) if bands > 1 else ())
+                return shape, np.dtype(dtype)
+        except (ImportError, KeyError, OSError):
+            img = self.load()
+            return img.shape, img.dtype
+
+    def read(self, rows=None):
+        """Return `load()[rows]` as native float32, reading only those rows."""
+        if not _is_fits(self.path):
+            img = self.load()
+            return np.asarray(img if rows is None else img[rows], dtype=np.float32)
+        if self._hdul is None:
+            self._hdul = fits.open(self.path, memmap=True, do_not_scale_image_data=True)
+        try:
+            return _fits_pixels(self._hdul[0], rows, np.float32)
+        finally:
+            if not self._keep_open:
+                self.close()
+
+    def close(self):
+        if self._hdul is not None:
+            self._hdul.close()
+            self._hdul = None
+
+    def __enter__(self):
+        self._keep_open = True
+        return self
+
+    def __exit__(self, *exc):
+        self._keep_open = False
+        self.close()
+
+    def __repr__(self):
+        return f"FrameHandle({self.path!r})"
+
+
 class FileLoader:
     """Loads images from a directory into numpy arrays.
 
@@ -20,6 +166,60 @@ class FileLoader:
     compatibility.
     """
 
+    @staticmethod
+    def list_image_paths(directory: str, extensions=EXTENSIONS) -> List[str]:
+        """Return the sorted paths the directory loaders would read."""
+        return [
+            os.path.join(directory, fname)
+            for fname in sorted(os.listdir(directory))
+            if fname.lower().endswith(extensions)
+        ]
+
+    @staticmethod
+    def list_frames(directory: str, extensions=EXTENSIONS) -> List[FrameHandle]:
+        """Return lazy handles for the frames in `directory` (no decoding)."""
+        paths = FileLoader.list_image_paths(directory, extensions)
+        return [FrameHandle(p) for p in paths]
+
+    @staticmethod
+    def iter_prefetched(
+        sources,
+        workers: int = 4,
+        prefetch: int = 8,
+        return_headers: bool = False,
+    ) -> Iterable:
+        """Yield decoded frames in order while decoding ahead in a thread pool.
+
+        `sources` is a directory or a sequence of paths / `FrameHandle`s.
+        At most `prefetch` frames are decoded but not yet consumed, which
+        bounds memory while the consumer (align, combine) runs concurrently.
+        """
+        if isinstance(sources, str):
+            sources = FileLoader.list_frames(sources)
+        handles = [s if isinstance(s, FrameHandle) else FrameHandle(s) for s in sources]
+        if workers <= 1 and prefetch <= 1:
+            for handle in handles:
+                yield handle.load(return_header=return_headers)
+            return
+
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        pending = deque()
+        todo = iter(handles)
+        try:
+            for handle in todo:
+                pending.append(pool.submit(handle.load, return_headers))
+                if len(pending) >= max(1, prefetch):
+                    break
+            while pending:
+                frame = pending.popleft().result()
+                nxt = next(todo, None)
+                if nxt is not None:
+                    pending.append(pool.submit(nxt.load, return_headers))
+                yield frame
+        finally:
+            # Consumer stopped early: drop queued decodes instead of finishing them
+            pool.shutdown(wait=False, cancel_futures=True)
+
     @staticmethod
     def load_images_from_dir(
         directory: str,
@@ -32,22 +232,9 @@ class FileLoader:
         where header is an astropy header for FITS files or None for other
         formats. Otherwise returns a list of numpy arrays.
         """
-        images = []
-        for fname in sorted(os.listdir(directory)):
-            if fname.lower().endswith(extensions):
-                path = os.path.join(directory, fname)
-                if (
-                    path.lower().endswith(".fits")
-                    or path.lower().endswith(".fit")
-                ) and fits is not None:
-                    with fits.open(path) as hdul:
-                        img = hdul[0].data
-                        hdr = hdul[0].header
-                else:
-                    img = iio.imread(path)
-                    hdr = None
-                images.append((img, hdr) if return_headers else img)
-        return images
+        return list(
+            FileLoader.iter_images_from_dir(directory, extensions, return_headers)
+        )
 
     @staticmethod
     def iter_images_from_dir(
@@ -60,20 +247,18 @@ class FileLoader:
         Useful for streaming processing. `return_headers` same semantics as
         in `load_images_from_dir`.
         """
-        for fname in sorted(os.listdir(directory)):
-            if fname.lower().endswith(extensions):
-                path = os.path.join(directory, fname)
-                if (
-                    path.lower().endswith(".fits")
-                    or path.lower().endswith(".fit")
-                ) and fits is not None:
-                    with fits.open(path) as hdul:
-                        img = hdul[0].data
-                        hdr = hdul[0].header
-                else:
-                    img = iio.imread(path)
-                    hdr = None
-                yield (img, hdr) if return_headers else img
+        for path in FileLoader.list_image_paths(directory, extensions):
+            yield FileLoader.load_image(path, return_header=return_headers)
+
+    @staticmethod
+    def load_header(path: str):
+        """Return the FITS primary header without reading pixel data.
+
+        Returns None for non-FITS formats.
+        """
+        if _is_fits(path):
+            return fits.getheader(path)
+        return None
 
     @staticmethod
     def load_image(path: str, return_header: bool = False):
@@ -83,13 +268,17 @@ class FileLoader:
         otherwise returns image array.
         """
         p = path
-        if (
-            p.lower().endswith(".fits")
-            or p.lower().endswith(".fit")
-        ) and fits is not None:
-            with fits.open(p) as hdul:
-                img = hdul[0].data
-                hdr = hdul[0].header
+        if _is_fits(p):
+            # Decoded from the memory-mapped file like FrameHandle.read, into
+            # a native array, so no descriptor stays open per loaded frame
+            with fits.open(p, memmap=True, do_not_scale_image_data=True) as hdul:
+                hdr = hdul[0].header.copy()
+                img = None if hdul[0].data is None else _fits_pixels(hdul[0])
+            if img is not None and img.dtype.kind == "f" and hdr["BITPIX"] > 0:
+                # Scaled to float: the header now describes float data
+                for key in ("BSCALE", "BZERO", "BLANK"):
+                    hdr.remove(key, ignore_missing=True)
+                hdr["BITPIX"] = -32
             return (img, hdr) if return_header else img
         img = iio.imread(p)
         return (img, None) if return_header else img
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+from .file_loader import FileLoader, FrameHandle
+
+
+class SharedFrameCache:
+    """Decoded frames shared by runs in one process that read the same files.
+
+    `expect(paths)` registers one future read of each path. A frame with
+    more than one expected reader is decoded once, kept read-only until
+    its last reader has it and then dropped; reads that arrive while the
+    frame is still being decoded wait for that decode instead of starting
+    another. At most `max_bytes` of frames are kept; frames that do not
+    fit are simply decoded again by later readers.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._readers = Counter()
+        self._frames = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def expect(self, paths):
+        for path in paths:
+            self._readers[os.path.abspath(path)] += 1
+
+    @property
+    def overlap(self) -> int:
+        """Number of files with more than one expected reader."""
+        return sum(1 for n in self._readers.values() if n > 1)
+
+    def handles(self, paths):
+        return [CachedFrameHandle(p, self) for p in paths]
+
+    def _keep(self, key, entry):
+        size = entry[0].nbytes
+        if self.max_bytes is not None and self.bytes + size > self.max_bytes:
+            return
+        self._frames[key] = entry
+        self.bytes += size
+
+    def _release(self, key):
+        self._readers[key] -= 1
+        if self._readers[key] <= 0 and key in self._frames:
+            self.bytes -= self._frames.pop(key)[0].nbytes
+
+    def load(self, path, return_header=False):
+        """Decoded frame (read-only), from the cache when another run has it."""
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._frames.get(key)
+            waiting = self._pending.get(key)
+            owner = entry is None and waiting is None
+            if owner:
+                waiting = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if owner:
+            try:
+                img, header = FileLoader.load_image(path, return_header=True)
+                img.flags.writeable = False
+                entry = (img, header)
+            except BaseException as exc:
+                with self._lock:
+                    del self._pending[key]
+                waiting.set_exception(exc)
+                raise
+            with self._lock:
+                del self._pending[key]
+                if self._readers[key] > 1:
+                    self._keep(key, entry)
+            waiting.set_result(entry)
+        elif entry is None:
+            entry = waiting.result()
+        with self._lock:
+            self._release(key)
+        return entry if return_header else entry[0]
+
+
+class CachedFrameHandle(FrameHandle):
+    """FrameHandle whose `load()` goes through a SharedFrameCache."""
+
+    def __init__(self, path: str, cache: SharedFrameCache):
+        super().__init__(path)
+        self.cache = cache
+
+    def load(self, return_header: bool = False):
+        return self.cache.load(self.path, return_header=return_header)
@@ -0,0 +1,132 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from .file_loader import EXTENSIONS
+
+# inotify(7) constants
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+def _inotify_watch(directory):
+    """Non-blocking inotify fd watching `directory`, or None if unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    wd = libc.inotify_add_watch(
+        fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO
+    )
+    if wd < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class DirectoryWatcher:
+    """New image files in a directory, reported once they are complete.
+
+    On Linux, inotify (through libc, no extra dependency) reports files when
+    the writer closes them or when they are moved in. Elsewhere, or when
+    inotify is unavailable, the directory is polled and a file counts as
+    complete once its size and mtime are unchanged between two scans.
+    """
+
+    def __init__(self, directory, extensions=EXTENSIONS, poll_interval=1.0,
+                 use_inotify=True):
+        self.directory = directory
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.poll_interval = poll_interval
+        self.seen = set()
+        self._sizes = {}
+        self._fd = _inotify_watch(directory) if use_inotify else None
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._fd is not None else "polling"
+
+    def _wanted(self, name):
+        # Hidden files are usually partial writes that get renamed when done
+        name = os.path.basename(name)
+        return not name.startswith(".") and name.lower().endswith(self.extensions)
+
+    def _scan(self):
+        with os.scandir(self.directory) as entries:
+            return {
+                e.path: (e.stat().st_size, e.stat().st_mtime_ns)
+                for e in entries if e.is_file() and self._wanted(e.name)
+            }
+
+    def existing(self):
+        """Files already present; they are not reported by `poll` again."""
+        paths = sorted(self._scan())
+        self.seen.update(paths)
+        return paths
+
+    def _take(self, paths):
+        fresh = sorted(p for p in paths if p not in self.seen)
+        self.seen.update(fresh)
+        return fresh
+
+    def _poll_inotify(self, timeout):
+        ready, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        if not ready:
+            return []
+        names = []
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            if self._wanted(name):
+                names.append(os.path.join(self.directory, name))
+        return self._take(names)
+
+    def _poll_scan(self):
+        current = self._scan()
+        # Complete once unchanged since the previous scan
+        stable = [p for p, sig in current.items()
+                  if p not in self.seen and self._sizes.get(p) == sig]
+        self._sizes = current
+        return self._take(stable)
+
+    def poll(self, timeout=None):
+        """New complete files, waiting up to `timeout` seconds for some."""
+        timeout = self.poll_interval if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if self._fd is not None:
+                new = self._poll_inotify(remaining)
+            else:
+                new = self._poll_scan()
+                if not new and remaining > 0:
+                    time.sleep(min(self.poll_interval, remaining))
+            if new or time.monotonic() >= deadline:
+                return new
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
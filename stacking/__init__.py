@@ -3,6 +3,13 @@
 from .align import align_images as align_images
 from .combine import stack_images as stack_images
 from .postprocess import normalize_image as normalize_image
+from .preprocess import Calibrator as Calibrator
 from .preprocess import apply_calibration as apply_calibration
 
-__all__ = ["align_images", "stack_images", "apply_calibration", "normalize_image"]
+__all__ = [
+    "align_images",
+    "stack_images",
+    "apply_calibration",
+    "Calibrator",
+    "normalize_image",
+]
@@ -0,0 +1,196 @@
+import json
+import os
+
+import numpy as np
+
+
+class WelfordAccumulator:
+    """Per-pixel NaN-aware running count, mean and M2 (Welford's update).
+
+    Frames are folded in one at a time with `add`, so an average never
+    needs the frames stacked in memory. Partial accumulators built from
+    disjoint frame sets combine exactly with `merge` (Chan et al.), which
+    lets streaming, multi-process and multi-node stacks share one engine.
+
+    `precision="float64"` keeps the state in float64; `"float32"` halves
+    the state size and keeps Kahan compensation terms for the mean and M2
+    so long stacks do not drift.
+    """
+
+    def __init__(self, precision="float64"):
+        if precision not in ("float64", "float32"):
+            raise ValueError(f"Unsupported accumulator precision '{precision}'")
+        self.precision = precision
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self._mean_c = None
+        self._m2_c = None
+        self._work = None
+
+    @classmethod
+    def from_moments(cls, count, total, total_sq, precision="float64"):
+        """Accumulator equivalent to samples with these per-pixel sums."""
+        acc = cls(precision)
+        acc._init(count.shape)
+        acc.count[...] = count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, 0.0)
+        acc.mean[...] = mean
+        acc.m2[...] = np.maximum(total_sq - count * mean * mean, 0.0)
+        return acc
+
+    @property
+    def dtype(self):
+        return np.dtype(self.precision)
+
+    @property
+    def compensated(self) -> bool:
+        return self.precision == "float32"
+
+    @property
+    def shape(self):
+        return None if self.count is None else self.count.shape
+
+    def _init(self, shape):
+        self.count = np.zeros(shape, dtype=np.uint32)
+        self.mean = np.zeros(shape, dtype=self.dtype)
+        self.m2 = np.zeros(shape, dtype=self.dtype)
+        if self.compensated:
+            self._mean_c = np.zeros(shape, dtype=self.dtype)
+            self._m2_c = np.zeros(shape, dtype=self.dtype)
+
+    @staticmethod
+    def _kahan_add(total, comp, value):
+        # total += value, carrying the lost low-order bits in comp
+        y = value - comp
+        t = total + y
+        comp[...] = (t - total) - y
+        total[...] = t
+
+    def _update(self, name, value):
+        if self.compensated:
+            comp = self._mean_c if name == "mean" else self._m2_c
+            self._kahan_add(getattr(self, name), comp, value)
+        else:
+            getattr(self, name).__iadd__(value)
+
+    def _value(self, name):
+        """`mean` or `m2` as float64 with its compensation term folded in."""
+        value = getattr(self, name).astype(np.float64)
+        if self.compensated:
+            value -= self._mean_c if name == "mean" else self._m2_c
+        return value
+
+    def _store(self, name, value):
+        target = getattr(self, name)
+        target[...] = value
+        if self.compensated:
+            # What the float32 state could not hold becomes the compensation
+            comp = self._mean_c if name == "mean" else self._m2_c
+            comp[...] = target - value
+
+    def _scratch(self, shape):
+        # Per-frame work buffers, kept so each add skips the page faults of
+        # fresh frame-sized allocations
+        if self._work is None or self._work[0].shape != shape:
+            self._work = tuple(np.empty(shape, dtype=self.dtype) for _ in range(3))
+        return self._work
+
+    def add(self, frame):
+        frame = np.asarray(frame)
+        if self.count is None:
+            self._init(frame.shape)
+        x, delta, step = self._scratch(frame.shape)
+        if frame.dtype == self.dtype:
+            x = frame
+        else:
+            np.copyto(x, frame, casting="unsafe")
+        missing = np.isnan(x)
+        # NaN-free frames (the common case) skip all masking
+        masked = missing.any()
+        np.add(self.count, 1, out=self.count, where=~missing if masked else True)
+        np.subtract(x, self.mean, out=delta)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Missing samples (0/0 where a pixel never had one) are zeroed below
+            np.divide(delta, self.count, out=step)
+        if masked:
+            delta[missing] = 0
+            step[missing] = 0
+        self._update("mean", step)
+        # Second factor against the updated mean
+        np.subtract(x, self.mean, out=step)
+        step *= delta
+        if masked:
+            step[missing] = 0
+        self._update("m2", step)
+        return self
+
+    def merge(self, other: "WelfordAccumulator"):
+        """Fold another accumulator's frames into this one."""
+        if other.count is None:
+            return self
+        if self.count is None:
+            self._init(other.shape)
+        if other.shape != self.shape:
+            raise ValueError(f"Cannot merge shapes {other.shape} and {self.shape}")
+        na = self.count.astype(np.float64)
+        nb = other.count.astype(np.float64)
+        n = na + nb
+        # Both sides exactly as accumulated, Kahan compensation included
+        mean = self._value("mean")
+        delta = other._value("mean") - mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shift = np.where(n > 0, delta * nb / n, 0)
+            extra = np.where(n > 0, delta * delta * na * nb / n, 0)
+        self._store("mean", mean + shift)
+        self._store("m2", self._value("m2") + other._value("m2") + extra)
+        self.count += other.count
+        return self
+
+    def finalize(self):
+        """Mean image as float32; pixels that never had a sample are NaN."""
+        if self.count is None:
+            return None
+        return np.where(self.count > 0, self._value("mean"), np.nan).astype(np.float32)
+
+    def variance(self, ddof=1):
+        """Per-pixel sample variance (NaN where fewer than ddof + 1 samples)."""
+        if self.count is None:
+            return None
+        dof = self.count.astype(np.float64) - ddof
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = np.where(dof > 0, self._value("m2") / dof, np.nan)
+        return np.maximum(var, 0).astype(np.float32)
+
+    def noise(self):
+        """Standard error of the stacked mean: the noise map of the result."""
+        if self.count is None:
+            return None
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.variance() / self.count).astype(np.float32)
+
+    def save(self, path, **meta):
+        """Write the state as a partial result (.npz) with JSON metadata."""
+        mean, m2 = self.mean, self.m2
+        if self.compensated:
+            mean = self._value("mean").astype(self.dtype)
+            m2 = self._value("m2").astype(self.dtype)
+        meta = dict(meta, precision=self.precision)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, count=self.count, mean=mean, m2=m2, meta=json.dumps(meta))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Read a partial written by `save`; returns (accumulator, metadata)."""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            acc = cls(meta.get("precision", "float64"))
+            acc._init(data["count"].shape)
+            acc.count[...] = data["count"]
+            acc.mean[...] = data["mean"]
+            acc.m2[...] = data["m2"]
+        return acc, meta
@@ -1,57 +1,431 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import tempfile
+
 import numpy as np
-import gc
-from scipy.ndimage import shift as ndi_shift
 from skimage.color import rgb2gray
 from skimage.feature import ORB, match_descriptors
+from skimage.filters import window
 from skimage.measure import ransac
 from skimage.registration import phase_cross_correlation
 from skimage.transform import SimilarityTransform, warp
 from tqdm import tqdm
 
+from utils import pool_context
+
+from .cache import FeatureCache
+from .precision import FrameCodec
+
+def _luminance(img):
+    """Single registration channel (Rec. 709 weights for RGB input)."""
+    if img.ndim == 3 and img.shape[-1] >= 3:
+        img = img[..., 0] * 0.2125 + img[..., 1] * 0.7154 + img[..., 2] * 0.0721
+    elif img.ndim == 3:
+        img = img[..., 0]
+    # One float32 copy, cleaned in place
+    return np.nan_to_num(np.array(img, dtype=np.float32), copy=False, nan=0.0)
+
+
+def _shift_bilinear(img, shift):
+    """`img` moved by (dy, dx) with bilinear interpolation, NaN outside.
+
+    Same interpolation as ``scipy.ndimage.shift(order=1, mode="constant",
+    cval=nan)``, computed as a weighted sum of up to four shifted views of
+    the frame, which is several times faster on large frames. Trailing
+    (colour) axes are not shifted.
+    """
+    img = np.asarray(img)
+    (iy, ix), (fy, fx) = np.divmod(np.asarray(shift[:2], dtype=np.float64), 1.0)
+    iy, ix = int(iy), int(ix)
+    h, w = img.shape[:2]
+    # Output pixels whose every contributing sample lies inside the frame
+    y0, y1 = max(iy + (fy > 0), 0), min(h + iy, h)
+    x0, x1 = max(ix + (fx > 0), 0), min(w + ix, w)
+    if y0 >= y1 or x0 >= x1:
+        return np.full(img.shape, np.nan, dtype=np.float32)
+    out = np.empty(img.shape, dtype=np.float32)
+    # Only the border is NaN; the interior is written below
+    out[:y0] = np.nan
+    out[y1:] = np.nan
+    out[y0:y1, :x0] = np.nan
+    out[y0:y1, x1:] = np.nan
+
+    def view(dy, dx):
+        return img[y0 - iy - dy:y1 - iy - dy, x0 - ix - dx:x1 - ix - dx]
+
+    dst = out[y0:y1, x0:x1]
+    np.multiply(view(0, 0), np.float32((1 - fy) * (1 - fx)), out=dst,
+                dtype=np.float32)
+    corners = ((0, 1, (1 - fy) * fx), (1, 0, fy * (1 - fx)), (1, 1, fy * fx))
+    term = None
+    for dy, dx, weight in corners:
+        if weight:
+            if term is None:
+                term = np.empty_like(dst)
+            np.multiply(view(dy, dx), np.float32(weight), out=term, dtype=np.float32)
+            dst += term
+    return out
+
+class PhaseCorrelationEngine:
+    """Phase correlation against a fixed reference whose FFT is computed once.
+
+    Frames are reduced to luminance, optionally cropped to `roi`
+    ((y0, y1, x0, x1) in full-resolution pixels), block-averaged by
+    `downsample` and Hann-windowed, so each call costs one forward FFT plus
+    the upsampled-DFT refinement around the correlation peak.
+    """
+
+    def __init__(
+        self, reference, upsample_factor=10, downsample=1, roi=None, window=False
+    ):
+        self.upsample_factor = upsample_factor
+        self.downsample = max(1, int(downsample))
+        self.roi = roi
+        self.window = window
+        self._window = None
+        self._ref_fft = np.fft.fft2(self._prepare(reference))
+
+    def _prepare(self, img):
+        lum = np.asarray(img)
+        if self.roi is not None:
+            y0, y1, x0, x1 = self.roi
+            lum = lum[y0:y1, x0:x1]
+        if self.downsample > 1 and lum.dtype.kind in "ui":
+            # Integer frames have no NaN to clean: block-average the raw
+            # samples first, so luminance only sees the small image
+            lum = _luminance(self._block_mean(lum))
+        elif self.downsample > 1:
+            lum = self._block_mean(_luminance(lum))
+        else:
+            lum = _luminance(lum)
+        if self.window:
+            if self._window is None:
+                self._window = window("hann", lum.shape).astype(np.float32)
+            lum = lum * self._window
+        return lum
+
+    def _block_mean(self, img):
+        d = self.downsample
+        h, w = (img.shape[0] // d) * d, (img.shape[1] // d) * d
+        # Block mean as a sum of d * d strided views (no reshape temporaries)
+        block = img[:h:d, :w:d].astype(np.float32)
+        for i in range(d):
+            for j in range(d):
+                if i or j:
+                    block += img[i:h:d, j:w:d]
+        block *= np.float32(1.0 / (d * d))
+        return block
+
+    def shift(self, img):
+        """(dy, dx) that moves `img` onto the reference, in full-res pixels."""
+        img_fft = np.fft.fft2(self._prepare(img))
+        shift, _, _ = phase_cross_correlation(
+            self._ref_fft, img_fft, space="fourier",
+            upsample_factor=self.upsample_factor,
+        )
+        return shift * self.downsample
+
 class PhaseCorrelationAlignStrategy:
-    def align(self, images, reference_index=0, show_progress=False):
-        ref = images[reference_index].astype(np.float32)
-        aligned = []
-        iterator = tqdm(images, desc="Aligning") if show_progress else images
-        for img in iterator:
-            img_f = img.astype(np.float32)
-            shift, _, _ = phase_cross_correlation(ref, img_f, upsample_factor=10)
-            corrected = ndi_shift(img_f, shift=shift, order=1, mode="constant", cval=np.nan)
-            aligned.append(corrected)
-            gc.collect()
-        return aligned
+    def __init__(self, upsample_factor=10, downsample=1, roi=None, window=False):
+        self.upsample_factor = upsample_factor
+        self.downsample = downsample
+        self.roi = roi
+        self.window = window
+        self._ref = None
+        self._engine = None
+
+    def cache_key(self):
+        return (f"phase:up{self.upsample_factor}:ds{self.downsample}"
+                f":{self.roi}:{self.window}")
+
+    def prepare(self, ref, path=None):
+        """Precompute the reference spectrum; reused until a new ref is given."""
+        self._engine = PhaseCorrelationEngine(
+            ref, self.upsample_factor, self.downsample, self.roi, self.window
+        )
+        self._ref = ref
+
+    def estimate(self, ref, img, path=None):
+        """JSON-serialisable transform that moves `img` onto `ref`."""
+        if self._ref is not ref:
+            self.prepare(ref)
+        return {"type": "shift", "params": [float(v) for v in self._engine.shift(img)]}
+
+    def apply_transform(self, img, transform, shape=None):
+        # Colour channels are never shifted against each other
+        return _shift_bilinear(img, transform["params"])
+
+    def align_frame(self, ref, img, path=None):
+        """Register a single frame against `ref` (NaN-filled borders)."""
+        return self.apply_transform(img, self.estimate(ref, img, path))
+
+    def align(self, images, reference_index=0, show_progress=False, jobs=1, paths=None,
+              transform_cache=None, codec=None):
+        return _align_all(self, images, reference_index, show_progress, jobs, paths,
+                          transform_cache, codec)
 
 class FeatureMatchAlignStrategy:
-    def __init__(self, n_keypoints=5000):
+    def __init__(self, n_keypoints=5000, cache_dir=None, cache_tag=""):
         self.n_keypoints = n_keypoints
+        self.cache = None
+        if cache_dir:
+            self.cache = FeatureCache(cache_dir, n_keypoints, cache_tag)
+        self._ref = None
+        self._ref_features = None
 
-    def align(self, images, reference_index=0, show_progress=False):
-        ref = images[reference_index].astype(np.float32)
-        ref_gray = rgb2gray(ref) if ref.ndim == 3 else ref
-        aligned = []
+    def cache_key(self):
+        return f"feature:kp{self.n_keypoints}"
+
+    def _features(self, img_f, path=None):
+        if self.cache is not None and path is not None:
+            cached = self.cache.get(path)
+            if cached is not None:
+                return cached
+        gray = rgb2gray(img_f) if img_f.ndim == 3 else img_f
         detector = ORB(n_keypoints=self.n_keypoints)
-        iterator = tqdm(images, desc="Aligning") if show_progress else images
-        for img in iterator:
-            img_f = img.astype(np.float32)
-            try:
-                img_gray = rgb2gray(img_f) if img_f.ndim == 3 else img_f
-                detector.detect_and_extract((ref_gray * 255).astype("uint8"))
-                kp1, des1 = detector.keypoints, detector.descriptors
-                detector.detect_and_extract((img_gray * 255).astype("uint8"))
-                kp2, des2 = detector.keypoints, detector.descriptors
-                matches = match_descriptors(des1, des2, cross_check=True)
-                src, dst = kp2[matches[:, 1]], kp1[matches[:, 0]]
-                model, _ = ransac((src, dst), SimilarityTransform, min_samples=2, residual_threshold=2, max_trials=500)
-                warped = warp(img_f, inverse_map=model.inverse, output_shape=ref.shape, cval=np.nan)
-                aligned.append(warped.astype(np.float32))
-            except:
-                aligned.append(img_f)
-            gc.collect()
-        return aligned
+        detector.detect_and_extract((gray * 255).astype("uint8"))
+        features = detector.keypoints, detector.descriptors
+        if self.cache is not None and path is not None:
+            self.cache.put(path, *features)
+        return features
+
+    def prepare(self, ref, path=None):
+        """Extract reference keypoints once; reused for every frame aligned to `ref`."""
+        self._ref_features = self._features(ref, path)
+        self._ref = ref
+
+    def estimate(self, ref, img, path=None):
+        """Similarity transform mapping `img` onto `ref`, or None if matching fails."""
+        try:
+            if self._ref is not ref:
+                self.prepare(ref)
+            kp1, des1 = self._ref_features
+            kp2, des2 = self._features(img.astype(np.float32), path)
+            matches = match_descriptors(des1, des2, cross_check=True)
+            src, dst = kp2[matches[:, 1]], kp1[matches[:, 0]]
+            model, _ = ransac((src, dst), SimilarityTransform, min_samples=2,
+                              residual_threshold=2, max_trials=500)
+            return {"type": "similarity", "params": model.params.tolist()}
+        except Exception:
+            return None
+
+    def apply_transform(self, img, transform, shape=None):
+        img_f = img.astype(np.float32)
+        if transform is None:
+            return img_f
+        model = SimilarityTransform(matrix=np.asarray(transform["params"]))
+        warped = warp(img_f, inverse_map=model.inverse,
+                      output_shape=shape or img_f.shape, cval=np.nan)
+        return warped.astype(np.float32)
+
+    def align_frame(self, ref, img, path=None):
+        """Register a single frame against `ref`; returns it unmodified on failure."""
+        return self.apply_transform(img, self.estimate(ref, img, path), ref.shape)
+
+    def align(self, images, reference_index=0, show_progress=False, jobs=1, paths=None,
+              transform_cache=None, codec=None):
+        return _align_all(self, images, reference_index, show_progress, jobs, paths,
+                          transform_cache, codec)
+
+def _register(strategy, ref, img, path, transform=None):
+    """Align one frame, reusing `transform` when one was cached."""
+    if transform is None:
+        transform = strategy.estimate(ref, img, path)
+    return strategy.apply_transform(img, transform, ref.shape), transform
+
+
+def _prepare(strategy, ref, path):
+    try:
+        strategy.prepare(ref, path)
+    except Exception:
+        # Reported per frame by the strategy's own fallback
+        pass
+
+
+# Per-worker state, set once by _init_worker so the reference is shipped once
+_WORKER = {}
+
+
+def _init_worker(strategy, ref, paths, cached, block_path, shape):
+    _WORKER.update(
+        strategy=strategy,
+        ref=ref,
+        paths=paths,
+        cached=cached,
+        frames=np.memmap(block_path, dtype=np.float32, mode="r+", shape=shape),
+    )
+
+
+def _align_shared(i):
+    frames = _WORKER["frames"]
+    # Aligned output replaces the input slot; only the transform is returned
+    w = _WORKER
+    frames[i], transform = _register(
+        w["strategy"], w["ref"], frames[i], w["paths"][i], w["cached"][i]
+    )
+    return i, transform
+
+
+def _align_all(strategy, images, reference_index=0, show_progress=False, jobs=1,
+               paths=None, transform_cache=None, codec=None):
+    """Align `images` to one reference.
+
+    With a FrameCodec, frames may be stored compactly: each one is decoded
+    to float32 only while it is registered and its aligned output is
+    encoded straight away.
+    """
+    codec = codec or FrameCodec()
+    ref = np.array(codec.decode(images[reference_index]), dtype=np.float32)
+    n = len(images)
+    paths = paths or [None] * n
+    keys = [None] * n
+    if transform_cache is not None and paths[reference_index] is not None:
+        config = strategy.cache_key()
+        keys = [transform_cache.key(p, paths[reference_index], config) for p in paths]
+    cached = [transform_cache.get(k) if k else None for k in keys]
+    transforms = list(cached)
+    if any(t is None for t in cached):
+        # Done once here so pool workers inherit the reference features
+        _prepare(strategy, ref, paths[reference_index])
+
+    if jobs is not None and jobs <= 0:
+        jobs = os.cpu_count() or 1
+    if not jobs or jobs == 1 or n < 2:
+        items = range(n)
+        if show_progress:
+            items = tqdm(items, desc="Aligning")
+        aligned = []
+        for i in items:
+            out, transforms[i] = _register(
+                strategy, ref, codec.decode(images[i]), paths[i], cached[i]
+            )
+            aligned.append(codec.encode(out))
+    else:
+        aligned = _align_parallel(
+            strategy, images, ref, paths, cached, transforms, jobs, show_progress,
+            codec,
+        )
+
+    if transform_cache is not None:
+        for key, old, new in zip(keys, cached, transforms):
+            if key and old is None and new is not None:
+                transform_cache.put(key, new)
+        transform_cache.save()
+    return aligned
+
+
+def _shared_block(shape):
+    """float32 frame block in a file that worker processes map by path.
+
+    The file lives in /dev/shm where available. It is unlinked once the
+    workers are done; the mapping, and the frames handed out as views of
+    it, stay valid until the last view is released.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    fd, path = tempfile.mkstemp(prefix="osiris-align-", suffix=".f32", dir=directory)
+    os.close(fd)
+    return np.memmap(path, dtype=np.float32, mode="w+", shape=shape), path
+
+
+def _align_parallel(strategy, images, ref, paths, cached, transforms, jobs,
+                    show_progress, codec):
+    # Frames travel through one shared block instead of being pickled per task
+    shape = (len(images), *ref.shape)
+    block, block_path = _shared_block(shape)
+    try:
+        frames = np.asarray(block)
+        for i, img in enumerate(images):
+            codec.decode(img, out=frames[i])
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(images)),
+            mp_context=pool_context(),
+            initializer=_init_worker,
+            initargs=(strategy, ref, paths, cached, block_path, shape),
+        ) as pool:
+            futures = [pool.submit(_align_shared, i) for i in range(len(images))]
+            done = as_completed(futures)
+            if show_progress:
+                done = tqdm(done, total=len(futures), desc="Aligning")
+            for future in done:
+                i, transforms[i] = future.result()
+    finally:
+        os.unlink(block_path)
+    # float32 "encoding" returns views, which keep the block alive; compact
+    # codecs copy out and the block is freed with the last reference
+    return [codec.encode(frames[i]) for i in range(len(images))]
+
+
+def get_align_strategy(method=None, **kwargs):
+    if method == "feature":
+        return FeatureMatchAlignStrategy(
+            n_keypoints=kwargs.get("kp", 5000),
+            cache_dir=kwargs.get("feature_cache"),
+            cache_tag=kwargs.get("cache_tag", ""),
+        )
+    return PhaseCorrelationAlignStrategy(
+        downsample=kwargs.get("align_downsample", 1),
+        roi=kwargs.get("align_roi"),
+        window=kwargs.get("align_window", False),
+    )
+
+class FrameAligner:
+    """Registers frames one at a time; the first frame becomes the reference.
+
+    Borders are left as NaN so NaN-aware accumulators can ignore them.
+    `path`, when given, enables feature and transform caching.
+    """
+
+    def __init__(self, method=None, transform_cache=None, **kwargs):
+        self.strategy = get_align_strategy(method, **kwargs)
+        self.transform_cache = transform_cache
+        self.ref = self.ref_path = None
+
+    def align(self, img, path=None):
+        strategy, cache = self.strategy, self.transform_cache
+        if self.ref is None:
+            self.ref, self.ref_path = img.astype(np.float32), path
+        key = cached = None
+        if cache is not None and None not in (path, self.ref_path):
+            key = cache.key(path, self.ref_path, strategy.cache_key())
+            cached = cache.get(key)
+        if cached is None and strategy._ref is not self.ref:
+            _prepare(strategy, self.ref, self.ref_path)
+        out, transform = _register(strategy, self.ref, img, path, cached)
+        if key and cached is None and transform is not None:
+            cache.put(key, transform)
+        return out
+
+
+def iter_aligned(frames, method=None, paths=None, transform_cache=None, **kwargs):
+    """Align frames lazily; the first frame is cached as the reference.
+
+    Borders are left as NaN so NaN-aware accumulators can ignore them.
+    `paths`, if given, runs parallel to `frames` and enables feature and
+    transform caching.
+    """
+    aligner = FrameAligner(method, transform_cache, **kwargs)
+    try:
+        for img, path in zip(frames, paths or itertools.repeat(None)):
+            yield aligner.align(img, path)
+    finally:
+        if transform_cache is not None:
+            transform_cache.save()
 
 def align_images(images, method=None, **kwargs):
-    strategy = FeatureMatchAlignStrategy(n_keypoints=kwargs.get("kp", 5000)) if method == "feature" else PhaseCorrelationAlignStrategy()
-    aligned = strategy.align(images, show_progress=kwargs.get("show_progress", False))
-    # replace NaN with zeros to avoid downstream argmax/nan issues
-    aligned = [np.nan_to_num(a, nan=0.0, posinf=0.0, neginf=0.0) for a in aligned]
+    codec = kwargs.get("codec") or FrameCodec()
+    strategy = get_align_strategy(method, **kwargs)
+    aligned = strategy.align(
+        images,
+        reference_index=kwargs.get("reference_index", 0),
+        show_progress=kwargs.get("show_progress", False),
+        jobs=kwargs.get("jobs", 1),
+        paths=kwargs.get("paths"),
+        transform_cache=kwargs.get("transform_cache"),
+        codec=codec,
+    )
+    # replace NaN with zeros to avoid downstream argmax/nan issues; the
+    # aligned frames are fresh arrays, so this happens in place
+    for a in aligned:
+        codec.fill_missing(a)
     return aligned
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from .planner import memory_budget_mb
+
+
+@dataclass
+class BatchJob:
+    """One run of a batch: a named profile with its pipeline parameters.
+
+    `cores` and `memory_mb` are what the scheduler reserves while it runs.
+    """
+
+    name: str
+    input_dir: str
+    output_path: str
+    params: dict = field(default_factory=dict)
+    cores: int = 1
+    memory_mb: float = 0.0
+    elapsed_s: float = None
+    error: BaseException = None
+
+    @property
+    def ok(self) -> bool:
+        return self.elapsed_s is not None and self.error is None
+
+
+class SharedResources:
+    """What the jobs of a batch load once and share.
+
+    Calibration masters are built once per key, by whichever job asks
+    first, while the others wait for it; `frames` is the SharedFrameCache
+    of decoded input frames (None when no file is read by two jobs).
+    """
+
+    def __init__(self, frames=None):
+        self.frames = frames
+        self._calibration = {}
+        self._lock = threading.Lock()
+
+    def calibration(self, key, build):
+        with self._lock:
+            done = self._calibration.get(key)
+            owner = done is None
+            if owner:
+                done = self._calibration[key] = Future()
+        if not owner:
+            return done.result()
+        try:
+            masters = build()
+        except BaseException as exc:
+            done.set_exception(exc)
+            raise
+        for frame in masters.values():
+            # Every job gets the same arrays
+            if frame is not None and hasattr(frame, "flags"):
+                frame.flags.writeable = False
+        done.set_result(masters)
+        return masters
+
+
+class BatchScheduler:
+    """Runs batch jobs concurrently under a core and a memory budget.
+
+    Jobs start in order (grouped by input directory, so jobs reading the
+    same frames run side by side) whenever their cores and planned peak
+    memory fit in what the running jobs leave free; a later job that fits
+    may start before an earlier one that does not. A job too large for
+    the whole budget runs alone. Jobs run in threads of this process, so
+    loaded calibration and decoded frames can be shared between them.
+    """
+
+    def __init__(self, cores=None, memory_limit_mb=None):
+        self.cores = max(1, cores or os.cpu_count() or 1)
+        self.memory_mb = memory_budget_mb(memory_limit_mb)
+
+    @staticmethod
+    def order(jobs):
+        first = {}
+        for i, job in enumerate(jobs):
+            first.setdefault(os.path.abspath(job.input_dir), i)
+        return sorted(jobs, key=lambda j: first[os.path.abspath(j.input_dir)])
+
+    def fits(self, job, running) -> bool:
+        if not running:
+            return True
+        cores = sum(j.cores for j in running) + job.cores
+        memory = sum(j.memory_mb for j in running) + job.memory_mb
+        return cores <= self.cores and memory <= self.memory_mb
+
+    @staticmethod
+    def _run(run_job, job):
+        started = time.perf_counter()
+        try:
+            run_job(job)
+        except Exception as exc:
+            job.error = exc
+        job.elapsed_s = time.perf_counter() - started
+        return job
+
+    def run(self, jobs, run_job, on_start=None, on_done=None):
+        """Run `run_job(job)` for every job; returns the jobs in run order.
+
+        A failing job records its exception in `job.error` and does not
+        stop the others.
+        """
+        pending = self.order(jobs)
+        ordered = list(pending)
+        running = {}
+        with ThreadPoolExecutor(max_workers=min(self.cores, len(pending)) or 1) as pool:
+            while pending or running:
+                for job in list(pending):
+                    if self.fits(job, list(running.values())):
+                        pending.remove(job)
+                        if on_start is not None:
+                            on_start(job)
+                        running[pool.submit(self._run, run_job, job)] = job
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    if on_done is not None:
+                        on_done(job)
+        return ordered
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+
+def file_signature(path: str) -> str:
+    """Identify a file by absolute path, size and modification time."""
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def file_digest(path: str) -> str:
+    """SHA-1 of the file's contents."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """On-disk store of ORB keypoints/descriptors keyed by file path + mtime.
+
+    `tag` is folded into every key; use it for anything that changes the
+    pixels features are extracted from (e.g. the calibration frames).
+    """
+
+    def __init__(self, cache_dir: str, n_keypoints: int = 5000, tag: str = ""):
+        self.cache_dir = cache_dir
+        self.n_keypoints = n_keypoints
+        self.tag = tag
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry(self, path: str) -> str:
+        key = f"{file_signature(path)}|orb{self.n_keypoints}|{self.tag}"
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npz")
+
+    def get(self, path: str):
+        entry = self._entry(path)
+        if not os.path.exists(entry):
+            return None
+        try:
+            with np.load(entry) as data:
+                return data["keypoints"], data["descriptors"]
+        except Exception:
+            # Truncated or foreign file: treat as a miss and overwrite later
+            return None
+
+    def put(self, path: str, keypoints, descriptors):
+        entry = self._entry(path)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, keypoints=keypoints, descriptors=descriptors)
+        os.replace(tmp, entry)
+
+
+class TransformCache:
+    """JSON sidecar index of per-frame registration transforms.
+
+    Entries are keyed by the frame's signature, the reference frame's
+    signature, the strategy settings and `tag`, so a transform is only reused
+    for exactly the registration that produced it. With `index_path=None`
+    the cache lives in memory only (useful for multi-pass streaming).
+    """
+
+    def __init__(self, index_path=None, tag: str = "", hash_content: bool = False):
+        self.index_path = index_path
+        self.tag = tag
+        self.hash_content = hash_content
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._digests = {}
+        self._dirty = False
+        if index_path and os.path.exists(index_path):
+            try:
+                with open(index_path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def _signature(self, path: str) -> str:
+        sig = file_signature(path)
+        if not self.hash_content:
+            return sig
+        if sig not in self._digests:
+            self._digests[sig] = file_digest(path)
+        return self._digests[sig]
+
+    def key(self, path: str, ref_path: str, config: str) -> str:
+        ref_sig = self._signature(ref_path)
+        raw = f"{self._signature(path)}|ref={ref_sig}|{config}|{self.tag}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        transform = self._entries.get(key)
+        if transform is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return transform
+
+    def put(self, key, transform):
+        self._entries[key] = transform
+        self._dirty = True
+
+    def save(self):
+        if not self.index_path or not self._dirty:
+            return
+        tmp = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.index_path)
+        except OSError:
+            # Read-only input directory: the cache is an optimisation only
+            return
+        self._dirty = False
@@ -0,0 +1,151 @@
+import numpy as np
+
+# 1 / Phi^-1(3/4): MAD -> standard deviation for Gaussian noise
+_MAD_TO_STD = 1.4826
+# Winsorized sigma correction for a 1.5-sigma cut (Huber)
+_WINSOR_CORRECTION = 1.134
+
+
+class ClipKernel:
+    """NaN-based rejection over a (frames, ...) block, without numpy.ma.
+
+    Rejected samples are set to NaN in place, so each iteration only needs
+    NaN-aware reductions over the same block plus one reusable work buffer.
+    Medians come from one in-buffer sort along the frame axis (NaNs sort
+    last), which is several times faster than ``np.nanmedian``. Iteration
+    stops early once an iteration rejects nothing.
+
+    Modes (`low`/`high` are per-mode thresholds below/above the centre):
+
+    - ``sigma``: median centre, MAD-based sigma (multiples of sigma).
+    - ``winsorized``: median centre, sigma of the 1.5-sigma winsorized
+      samples (multiples of sigma); robust for small stacks.
+    - ``percentile``: single pass, rejects samples further than a fraction
+      of the median from it (e.g. 0.2 = 20 %).
+    - ``linear``: fits a line to each pixel's sorted samples and rejects
+      by distance from the fit in mean-absolute-deviations; suited to
+      gradients that change during the session.
+    """
+
+    MODES = ("sigma", "winsorized", "percentile", "linear")
+    _DEFAULTS = {
+        "sigma": (3.0, 3.0),
+        "winsorized": (3.0, 3.0),
+        "percentile": (0.2, 0.1),
+        "linear": (5.0, 2.5),
+    }
+
+    def __init__(self, mode="sigma", low=None, high=None, iters=5):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown clipping mode '{mode}'")
+        default_low, default_high = self._DEFAULTS[mode]
+        self.mode = mode
+        self.low = default_low if low is None else low
+        self.high = default_high if high is None else high
+        self.iters = 1 if mode == "percentile" else max(1, iters)
+
+    @staticmethod
+    def _floor(width, center):
+        # Identical samples (zero spread) must survive their own clip
+        return np.maximum(width, np.finfo(np.float32).eps * np.abs(center))
+
+    @staticmethod
+    def _median(work, n):
+        """Median along axis 0 of `work`, sorted in place; `n` valid samples."""
+        work.sort(axis=0)
+        lo = np.take_along_axis(work, ((n - 1) // 2)[None], axis=0)[0]
+        hi = np.take_along_axis(work, (n // 2)[None], axis=0)[0]
+        return np.where(n > 0, 0.5 * (lo + hi), np.nan)
+
+    def _center(self, data, work, n):
+        np.copyto(work, data)
+        return self._median(work, n)
+
+    def _sigma(self, data, work, n):
+        center = self._center(data, work, n)
+        np.subtract(data, center, out=work)
+        np.abs(work, out=work)
+        sigma = _MAD_TO_STD * self._median(work, n)
+        return center, sigma * self.low, sigma * self.high
+
+    def _winsorized(self, data, work, n):
+        center = self._center(data, work, n)
+        sigma = np.nanstd(data, axis=0)
+        for _ in range(10):
+            np.clip(data, center - 1.5 * sigma, center + 1.5 * sigma, out=work)
+            new = _WINSOR_CORRECTION * np.nanstd(work, axis=0)
+            done = np.all(np.abs(new - sigma) <= 5e-4 * np.maximum(sigma, 1e-12))
+            sigma = new
+            if done:
+                break
+        return center, sigma * self.low, sigma * self.high
+
+    def _percentile(self, data, work, n):
+        center = self._center(data, work, n)
+        return center, self.low * np.abs(center), self.high * np.abs(center)
+
+    def _linear(self, data, work, n):
+        # NaNs sort last, so valid samples occupy ranks 0..n-1
+        order = np.argsort(data, axis=0)
+        ys = np.take_along_axis(data, order, axis=0)
+        valid = ~np.isnan(ys)
+        x = np.arange(data.shape[0], dtype=np.float64).reshape(
+            (-1,) + (1,) * (data.ndim - 1)
+        )
+        sx = (x * valid).sum(axis=0)
+        sxx = (x * x * valid).sum(axis=0)
+        sy = np.nansum(ys, axis=0, dtype=np.float64)
+        sxy = np.nansum(x * ys, axis=0, dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            denom = n * sxx - sx * sx
+            slope = np.where(denom > 0, (n * sxy - sx * sy) / denom, 0.0)
+            intercept = (sy - slope * sx) / n
+        fit = (intercept + slope * x).astype(data.dtype)
+        sigma = np.nanmean(np.abs(ys - fit), axis=0)
+        center = np.empty_like(data)
+        np.put_along_axis(center, order, fit, axis=0)
+        return center, sigma * self.low, sigma * self.high
+
+    def reject(self, block):
+        """Clip `block` in place (rejected samples become NaN).
+
+        After the first iteration only pixels that lost a sample are
+        revisited. Returns the number of iterations run.
+        """
+        bounds = getattr(self, f"_{self.mode}")
+        flat = block.reshape(block.shape[0], -1)
+        work = np.empty_like(flat)
+        below_buf = np.empty(flat.shape, dtype=bool)
+        above_buf = np.empty(flat.shape, dtype=bool)
+        n = np.count_nonzero(~np.isnan(flat), axis=0)
+        active = None  # every pixel
+        for it in range(1, self.iters + 1):
+            data = flat if active is None else flat[:, active]
+            k = data.shape[1]
+            w, below, above = work[:, :k], below_buf[:, :k], above_buf[:, :k]
+            with np.errstate(invalid="ignore"):
+                center, low, high = bounds(data, w, n if active is None else n[active])
+                np.subtract(data, center, out=w)
+                np.less(w, -self._floor(low, center), out=below)
+                np.greater(w, self._floor(high, center), out=above)
+            np.logical_or(below, above, out=below)
+            data[below] = np.nan
+            lost = below.sum(axis=0)
+            if active is None:
+                n -= lost
+                active = np.flatnonzero(lost)
+            else:
+                flat[:, active] = data
+                n[active] -= lost
+                active = active[lost > 0]
+            if active.size == 0:
+                break
+        if not np.shares_memory(flat, block):
+            block[...] = flat.reshape(block.shape)
+        return it
+
+    def combine(self, block):
+        """Mean of the samples that survive clipping, as float32."""
+        block = np.array(block, dtype=np.float32)
+        self.reject(block)
+        return np.nanmean(block, axis=0).astype(np.float32)
@@ -1,10 +1,21 @@
+import itertools
+
 import numpy as np
-import tempfile
-import os
 from astropy.stats import mad_std, sigma_clip
 
+from .accumulator import WelfordAccumulator
+from .precision import FrameCodec
+from .tiled import TiledCombineEngine
+
 
 class ChunkedSigmaClipStrategy:
+    """Astropy sigma clip applied chunk by chunk.
+
+    Kept only as the baseline the benchmarks compare SigmaClipStrategy
+    against: each chunk is clipped on its own, so a pixel is never judged
+    against the whole stack. Pipelines use SigmaClipStrategy.
+    """
+
     def __init__(self, sigma=3.0, iters=5, chunk_size=3):
         self.sigma = sigma
         self.iters = iters
@@ -33,40 +44,264 @@ class ChunkedSigmaClipStrategy:
         return (result / weights).astype(np.float32)
 
 
+class SigmaClipStrategy:
+    """Clipped mean over the whole stack, reduced in row tiles.
+
+    Each tile is a (frames, rows, ...) block clipped by ClipKernel, so
+    every pixel is judged against all frames (not per chunk) and no masked
+    arrays are built. `mode` selects sigma, winsorized, percentile or
+    linear-fit clipping.
+    """
+
+    def __init__(self, sigma=3.0, iters=5, mode="sigma", low=None, high=None,
+                 memory_limit_mb=None, codec=None):
+        self.engine = TiledCombineEngine(
+            method="sigma", memory_limit_mb=memory_limit_mb, sigma=sigma,
+            iters=iters, clip_mode=mode, clip_low=low, clip_high=high, codec=codec,
+        )
+
+    def combine(self, images):
+        return self.engine.combine_arrays(images)
+
+
+class StreamingAverageStrategy(WelfordAccumulator):
+    """One-pass NaN-aware mean; also yields per-pixel variance and noise maps."""
+
+    def result(self):
+        return self.finalize()
+
+    def combine(self, frames):
+        for frame in frames:
+            self.add(frame)
+        return self.result()
+
+
+class WeightedAverageStrategy:
+    """One-pass NaN-aware weighted mean with one weight per frame."""
+
+    def __init__(self):
+        self.total = None
+        self.weight_sum = None
+
+    def add(self, frame, weight=1.0):
+        frame = np.asarray(frame, dtype=np.float32)
+        if self.total is None:
+            self.total = np.zeros(frame.shape, dtype=np.float64)
+            self.weight_sum = np.zeros(frame.shape, dtype=np.float64)
+        valid = ~np.isnan(frame)
+        self.total += np.where(valid, frame, 0) * weight
+        self.weight_sum += valid * weight
+
+    def result(self):
+        if self.total is None:
+            return None
+        with np.errstate(invalid="ignore", divide="ignore"):
+            res = self.total / self.weight_sum
+        return res.astype(np.float32)
+
+    def combine(self, frames, weights=None):
+        weights = weights if weights is not None else itertools.repeat(1.0)
+        for frame, weight in zip(frames, weights):
+            if weight > 0:
+                self.add(frame, weight)
+        return self.result()
+
+
+class StreamingSigmaClipStrategy:
+    """Sigma clipping over the whole stack with O(frame) memory.
+
+    `frames` is either a re-iterable sequence or a zero-argument callable
+    returning a fresh iterable, so each pass can stream from disk again.
+    The clip is seeded from robust per-pixel statistics: one pass finds
+    each pixel's range and a second builds a coarse `bins`-bin histogram
+    over it, from which the median and interquartile spread are read, so
+    several coincident outliers cannot drag the start. Every further pass
+    rejects samples outside ``centre +/- sigma * std`` and re-accumulates,
+    stopping early once no pixel changes its sample count; the frames are
+    read at most ``iters + 2`` times.
+    """
+
+    def __init__(self, sigma=3.0, iters=5, bins=16):
+        self.sigma = sigma
+        self.iters = max(1, iters)
+        self.bins = bins
+
+    @staticmethod
+    def _open(frames):
+        return frames() if callable(frames) else iter(frames)
+
+    def _range(self, frames):
+        lo = hi = None
+        for frame in self._open(frames):
+            x = np.asarray(frame, dtype=np.float64)
+            if lo is None:
+                lo = np.full(x.shape, np.inf)
+                hi = np.full(x.shape, -np.inf)
+            # fmin/fmax skip NaN samples
+            np.fmin(lo, x, out=lo)
+            np.fmax(hi, x, out=hi)
+        return lo, hi
+
+    def _histogram(self, frames, lo, scale):
+        counts = np.zeros((self.bins,) + lo.shape, dtype=np.uint16)
+        n = 0
+        for frame in self._open(frames):
+            n += 1
+            if n == np.iinfo(counts.dtype).max:
+                counts = counts.astype(np.uint32)
+            x = np.subtract(frame, lo, dtype=np.float64)
+            x *= scale
+            missing = np.isnan(x)
+            x[missing] = 0
+            np.clip(x, 0, self.bins - 1, out=x)
+            index = x.astype(np.int8)
+            index[missing] = -1
+            # A compare per bin beats a scattered add for small bin counts
+            for b in range(self.bins):
+                counts[b] += index == b
+        return counts
+
+    def _seed(self, frames):
+        """Per-pixel median and IQR-based std from a coarse histogram."""
+        lo, hi = self._range(frames)
+        if lo is None:
+            return None
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Pixels without samples have lo = inf, hi = -inf
+            width = (hi - lo) / self.bins
+            scale = np.where(width > 0, 1.0 / width, 0.0)
+        counts = self._histogram(frames, lo, scale)
+        upto = np.cumsum(counts, axis=0, dtype=np.int32)
+        n = upto[-1]
+        values = []
+        for q in (0.25, 0.5, 0.75):
+            target = q * (n - 1)
+            # Bin holding the target rank, and the samples below that bin
+            b = np.minimum((upto <= target).sum(axis=0), self.bins - 1)[None]
+            in_bin = np.take_along_axis(upto, b, axis=0)[0] - 0.0
+            below = np.where(b[0] > 0, np.take_along_axis(upto, np.maximum(b - 1, 0),
+                                                          axis=0)[0], 0)
+            in_bin -= below
+            with np.errstate(invalid="ignore", divide="ignore"):
+                # Samples are taken as spread evenly across their bin
+                frac = (target - below + 0.5) / in_bin
+            values.append(np.where(n > 0, lo + (b[0] + frac) * width, np.nan))
+        q1, median, q3 = values
+        std = np.maximum((q3 - q1) / 1.349, width / 2)
+        return median, std
+
+    def _accumulate(self, frames, lower, upper):
+        count = total = total_sq = None
+        for frame in self._open(frames):
+            x = np.asarray(frame, dtype=np.float64)
+            if count is None:
+                count = np.zeros(x.shape, dtype=np.uint32)
+                total = np.zeros(x.shape, dtype=np.float64)
+                total_sq = np.zeros(x.shape, dtype=np.float64)
+            # NaN samples and NaN bounds both compare False
+            keep = (x >= lower) & (x <= upper)
+            x = np.where(keep, x, 0.0)
+            count += keep
+            total += x
+            total_sq += x * x
+        return count, total, total_sq
+
+    @staticmethod
+    def _moments(count, total, total_sq):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            var = total_sq / count - mean * mean
+        return mean, np.sqrt(np.maximum(var, 0.0))
+
+    def _bounds(self, center, std):
+        # Keep identical samples when the spread collapses to zero
+        width = np.maximum(self.sigma * std, np.finfo(np.float32).eps * np.abs(center))
+        return center - width, center + width
+
+    def _clip(self, frames):
+        seed = self._seed(frames)
+        if seed is None:
+            return None
+        center, std = seed
+        fallback = center
+        prev_count = None
+        for _ in range(self.iters):
+            lower, upper = self._bounds(center, std)
+            count, total, total_sq = self._accumulate(frames, lower, upper)
+            center, std = self._moments(count, total, total_sq)
+            if prev_count is not None and np.array_equal(count, prev_count):
+                break
+            prev_count = count
+        return count, total, total_sq, fallback
+
+    def accumulate(self, frames) -> WelfordAccumulator:
+        """Accumulator over the samples that survive clipping.
+
+        Its count/mean/M2 merge exactly with other accumulators, e.g. the
+        partials of sharded and append-mode stacks.
+        """
+        state = self._clip(frames)
+        if state is None:
+            return WelfordAccumulator()
+        return WelfordAccumulator.from_moments(*state[:3])
+
+    def combine(self, frames):
+        state = self._clip(frames)
+        if state is None:
+            return None
+        count, total, total_sq, fallback = state
+        center, _ = self._moments(count, total, total_sq)
+        # Pixels where every sample was rejected keep the median seed
+        return np.where(count > 0, center, fallback).astype(np.float32)
+
+
 def stack_images(images, method="average", use_memmap=False, **kwargs):
     if not images: return None
+    # Frames may be held compactly (see FrameCodec); decode on the fly
+    codec = kwargs.get("codec") or FrameCodec()
 
-    # Memory Mapping Logic to handle large datasets on low RAM
+    def decoded():
+        return (codec.decode(img) for img in images)
+
+    # One pass, one frame at a time: never needs the memmap detour
+    if method == "weighted":
+        return WeightedAverageStrategy().combine(decoded(), kwargs.get("weights"))
+
+    # Out-of-core: memmapped cube reduced in strips sized to the memory budget
     if use_memmap:
-        fd, temp_path = tempfile.mkstemp(suffix='.npy')
-        os.close(fd)
-        shape = (len(images), *images[0].shape)
-        mmap_arr = np.memmap(temp_path, dtype='float32', mode='w+', shape=shape)
-
-        for i, img in enumerate(images):
-            mmap_arr[i] = img.astype(np.float32)
-        mmap_arr.flush()
-
-        if method == "median":
-            res = np.nanmedian(mmap_arr, axis=0)
-        else:
-            res = np.nanmean(mmap_arr, axis=0)
-
-        del mmap_arr
-        if os.path.exists(temp_path): os.remove(temp_path)
-        return res.astype(np.float32)
+        engine = TiledCombineEngine(
+            method=method,
+            memory_limit_mb=kwargs.get("memory_limit_mb"),
+            sigma=kwargs.get("sigma", 3.0),
+            iters=kwargs.get("sigma_iters", 5),
+            tmp_dir=kwargs.get("tmp_dir"),
+            clip_mode=kwargs.get("clip_mode", "sigma"),
+            clip_low=kwargs.get("clip_low"),
+            clip_high=kwargs.get("clip_high"),
+            codec=codec,
+        )
+        return engine.combine(images)
 
-    # Fallback to Sigma Clipping with Chunking
+    # Clip the in-memory frames tile by tile (no masked arrays, no cube copy)
     if method == "sigma":
-        strategy = ChunkedSigmaClipStrategy(
+        strategy = SigmaClipStrategy(
             sigma=kwargs.get("sigma", 3.0),
             iters=kwargs.get("sigma_iters", 5),
-            chunk_size=kwargs.get("chunk_size", 3)
+            mode=kwargs.get("clip_mode", "sigma"),
+            low=kwargs.get("clip_low"),
+            high=kwargs.get("clip_high"),
+            memory_limit_mb=kwargs.get("memory_limit_mb"),
+            codec=codec,
         )
         return strategy.combine(images)
 
-    # Standard NumPy stack (only if enough RAM)
-    arr = np.stack(images, axis=0)
+    # Median of row tiles by partition/sort: no full (N, H, W) cube
     if method == "median":
-        return np.nanmedian(arr, axis=0).astype(np.float32)
-    return np.nanmean(arr, axis=0).astype(np.float32)
\ No newline at end of file
+        engine = TiledCombineEngine(
+            method="median", memory_limit_mb=kwargs.get("memory_limit_mb"), codec=codec
+        )
+        return engine.combine_arrays(images)
+
+    # Running mean: no (N, H, W) copy of the frames
+    precision = kwargs.get("accumulator_precision", "float64")
+    return StreamingAverageStrategy(precision).combine(decoded())
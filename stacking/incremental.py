@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .accumulator import WelfordAccumulator
+from .cache import file_digest
+from .combine import StreamingSigmaClipStrategy
+from .sharded import SHARDABLE_METHODS, ShardedStacker
+
+MANIFEST_VERSION = 1
+INCREMENTAL_METHODS = SHARDABLE_METHODS
+
+
+def state_paths(output_path):
+    """Accumulator state and manifest kept next to `output_path`."""
+    stem = os.path.splitext(output_path)[0]
+    return f"{stem}.state.npz", f"{stem}.manifest.json"
+
+
+def _file_entry(path):
+    st = os.stat(path)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha1": file_digest(path),
+    }
+
+
+class StackManifest:
+    """Frames already in a saved stack and the settings that produced it.
+
+    Frames are keyed by absolute path and recorded with size, mtime and a
+    content hash; a frame whose size or mtime changed still counts as
+    unchanged if its hash matches. `generation` ties the manifest to the
+    accumulator state saved with it.
+    """
+
+    def __init__(self, settings_key, frames=None, reference=None, generation=0):
+        self.settings_key = settings_key
+        self.frames = dict(frames or {})
+        self.reference = reference
+        self.generation = generation
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(data["settings"], data["frames"], data.get("reference"),
+                   data.get("generation", 0))
+
+    def save(self, path):
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings_key,
+            "generation": self.generation,
+            "reference": self.reference,
+            "frames": self.frames,
+        }
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, path)
+        return path
+
+    def _unchanged(self, path):
+        entry = self.frames.get(os.path.abspath(path))
+        if entry is None or not os.path.exists(path):
+            return False
+        st = os.stat(path)
+        if (st.st_size, st.st_mtime_ns) == (entry["size"], entry["mtime_ns"]):
+            return True
+        return st.st_size == entry["size"] and file_digest(path) == entry["sha1"]
+
+    def stale(self):
+        """Recorded frames that were removed or modified since."""
+        return [p for p in self.frames if not self._unchanged(p)]
+
+    def new(self, paths):
+        return [p for p in paths if os.path.abspath(p) not in self.frames]
+
+    def add(self, paths):
+        for path in paths:
+            self.frames[os.path.abspath(path)] = _file_entry(path)
+
+
+class IncrementalStacker:
+    """Append-mode stacking: only frames not in the saved state are processed.
+
+    The accumulator (Welford count/mean/M2) and a manifest of processed
+    frames live next to the output. A rerun calibrates, aligns (to the
+    saved reference) and stacks just the new frames through ShardedStacker
+    and merges them into the state, so an update costs O(new frames).
+    `average` is exact. `sigma` clips the first batch as a sharded stack
+    and every appended frame against the saved stack's mean +/- sigma
+    standard deviations, so even a single new frame has its outliers
+    rejected. Changed settings, or a stacked frame that was removed or
+    modified, restart the stack from scratch.
+    """
+
+    def __init__(self, output_path, method="average", settings=None, workers=1,
+                 **stacker_options):
+        if method not in INCREMENTAL_METHODS:
+            raise ValueError(f"Append mode does not support method '{method}'")
+        self.method = method
+        self.state_path, self.manifest_path = state_paths(output_path)
+        settings = dict(settings or {}, method=method)
+        raw = json.dumps(settings, sort_keys=True, default=str)
+        self.settings_key = hashlib.sha1(raw.encode()).hexdigest()
+        self.workers = workers
+        self.stacker_options = stacker_options
+
+    def resume(self):
+        """Saved `(accumulator, manifest, reason)`; empty ones plus the
+        reason for starting over when the state cannot be reused."""
+        fresh = WelfordAccumulator(), StackManifest(self.settings_key)
+        manifest = StackManifest.load(self.manifest_path)
+        if manifest is None or not os.path.exists(self.state_path):
+            return (*fresh, "no saved state")
+        if manifest.settings_key != self.settings_key:
+            return (*fresh, "settings changed")
+        stale = manifest.stale()
+        if stale:
+            return (*fresh, f"{len(stale)} stacked frame(s) removed or modified")
+        aligned = self.stacker_options.get("align")
+        if aligned and manifest.reference and not os.path.exists(manifest.reference):
+            return (*fresh, "alignment reference removed")
+        acc, meta = WelfordAccumulator.load(self.state_path)
+        if meta.get("generation") != manifest.generation:
+            return (*fresh, "state and manifest out of sync")
+        return acc, manifest, None
+
+    def clip_bounds(self, acc):
+        """Range new frames must fall in: the saved stack's mean +/- sigma
+        standard deviations, open where it has fewer than two samples."""
+        sigma = self.stacker_options.get("sigma", 3.0)
+        std = np.sqrt(acc.variance(ddof=1).astype(np.float64))
+        lower, upper = StreamingSigmaClipStrategy(sigma)._bounds(acc.mean, std)
+        known = np.isfinite(std)
+        return np.where(known, lower, -np.inf), np.where(known, upper, np.inf)
+
+    def update(self, paths):
+        """Stack the frames of `paths` not yet in the state and save it.
+
+        Returns `(accumulator, new_paths, reason)`; `reason` says why the
+        saved state was discarded (None when it was reused).
+        """
+        acc, manifest, reason = self.resume()
+        new = manifest.new(paths)
+        if not new:
+            return acc, new, reason
+        reference = manifest.reference or os.path.abspath(new[0])
+        options = dict(self.stacker_options)
+        if self.method == "sigma" and acc.count is not None:
+            options["bounds"] = self.clip_bounds(acc)
+        stacker = ShardedStacker(
+            method=self.method, workers=self.workers, ref_path=reference, **options,
+        )
+        acc.merge(stacker.stack(new))
+        manifest.add(new)
+        manifest.reference = reference
+        manifest.generation += 1
+        # State first: a manifest never points at a state that is not there
+        acc.save(self.state_path, generation=manifest.generation,
+                 **stacker.partial_meta(list(manifest.frames)))
+        manifest.save(self.manifest_path)
+        return acc, new, reason
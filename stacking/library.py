@@ -0,0 +1,184 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+from osiris_io.file_loader import FileLoader
+from utils import LogManager
+
+from .preprocess import Calibrator
+
+_EXPOSURE_KEYS = ("EXPTIME", "EXPOSURE")
+_TEMPERATURE_KEYS = ("CCD-TEMP", "CCD_TEMP", "SET-TEMP")
+_GAIN_KEYS = ("GAIN",)
+
+
+def _first(header, keys):
+    if header is None:
+        return None
+    for key in keys:
+        value = header.get(key)
+        if value is not None:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+@dataclass(frozen=True)
+class FrameInfo:
+    """Acquisition settings that decide which calibration master fits a frame."""
+
+    exposure: Optional[float] = None
+    temperature: Optional[float] = None
+    gain: Optional[float] = None
+
+    @classmethod
+    def from_header(cls, header) -> "FrameInfo":
+        return cls(
+            exposure=_first(header, _EXPOSURE_KEYS),
+            temperature=_first(header, _TEMPERATURE_KEYS),
+            gain=_first(header, _GAIN_KEYS),
+        )
+
+
+@dataclass(frozen=True)
+class LibraryEntry:
+    kind: str
+    path: str
+    info: FrameInfo
+
+
+def _kind_of(path, header) -> Optional[str]:
+    imagetyp = str(header.get("IMAGETYP", "")).lower() if header is not None else ""
+    name = os.path.basename(path).lower()
+    for kind in ("bias", "dark", "flat"):
+        if kind in imagetyp or kind in name:
+            return kind
+    return None
+
+
+class CalibrationLibrary:
+    """Master bias/dark frames indexed by exposure, temperature and gain.
+
+    Only headers are read when indexing. For each light frame the best
+    master dark is picked (same gain, temperature within
+    `temp_tolerance`, closest exposure) and scaled linearly by exposure
+    (and, with `temp_doubling` set, by 2 ** (dT / temp_doubling)). Darks
+    are expected bias-subtracted, as built by MasterFrameBuilder; `bias`
+    (e.g. a master given on the command line) is subtracted when the
+    library has no matching bias of its own. Frames without a matching
+    dark are logged once per acquisition setting. Loaded
+    masters and the resulting Calibrators are held in small LRU caches, so
+    mixed-exposure sessions never have every dark in memory at once.
+    """
+
+    def __init__(
+        self, flat=None, temp_tolerance=2.0, temp_doubling=None, cache_size=8,
+        bias=None,
+    ):
+        self.flat = flat
+        self.bias = bias
+        self.temp_tolerance = temp_tolerance
+        self.temp_doubling = temp_doubling
+        self.cache_size = cache_size
+        self.entries: List[LibraryEntry] = []
+        self._masters = OrderedDict()
+        self._calibrators = OrderedDict()
+        self._unmatched = set()
+
+    @classmethod
+    def from_directory(cls, directory, **kwargs) -> "CalibrationLibrary":
+        library = cls(**kwargs)
+        for path in FileLoader.list_image_paths(directory):
+            library.add(path)
+        return library
+
+    def add(self, path, kind=None, info=None):
+        header = FileLoader.load_header(path)
+        kind = kind or _kind_of(path, header)
+        if kind not in ("bias", "dark"):
+            return None
+        entry = LibraryEntry(kind, path, info or FrameInfo.from_header(header))
+        self.entries.append(entry)
+        return entry
+
+    def _candidates(self, kind, info):
+        out = []
+        for entry in self.entries:
+            if entry.kind != kind:
+                continue
+            e = entry.info
+            if None not in (e.gain, info.gain) and e.gain != info.gain:
+                continue
+            if None not in (e.temperature, info.temperature):
+                if abs(e.temperature - info.temperature) > self.temp_tolerance:
+                    continue
+            out.append(entry)
+        return out
+
+    def select(self, kind, info: FrameInfo) -> Optional[LibraryEntry]:
+        """Best-matching master of `kind` for a frame, or None."""
+        def distance(entry):
+            e = entry.info
+            exp = 0.0
+            if None not in (e.exposure, info.exposure):
+                exp = abs(e.exposure - info.exposure)
+            temp = 0.0
+            if None not in (e.temperature, info.temperature):
+                temp = abs(e.temperature - info.temperature)
+            return exp, temp
+
+        candidates = self._candidates(kind, info)
+        return min(candidates, key=distance) if candidates else None
+
+    def scale_factor(self, dark: LibraryEntry, info: FrameInfo) -> float:
+        d = dark.info
+        scale = 1.0
+        if None not in (d.exposure, info.exposure) and d.exposure > 0:
+            scale = info.exposure / d.exposure
+        if self.temp_doubling and None not in (d.temperature, info.temperature):
+            scale *= 2.0 ** ((info.temperature - d.temperature) / self.temp_doubling)
+        return scale
+
+    def _lru(self, cache, key, build):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        value = build()
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def _master(self, entry):
+        return self._lru(
+            self._masters, entry.path, lambda: FileLoader.load_image(entry.path)
+        )
+
+    def calibrator_for(self, info: FrameInfo) -> Calibrator:
+        """Calibrator with the selected bias and exposure-scaled dark."""
+        bias_info = FrameInfo(gain=info.gain, temperature=info.temperature)
+        bias = self.select("bias", bias_info)
+        dark = self.select("dark", info)
+        if dark is None and info not in self._unmatched:
+            self._unmatched.add(info)
+            LogManager.get_logger().warning(
+                f"No library dark within {self.temp_tolerance} C for {info}; "
+                "calibrating without a dark"
+            )
+        scale = self.scale_factor(dark, info) if dark is not None else None
+        key = (bias.path if bias else None, dark.path if dark else None, scale)
+
+        def build():
+            scaled = None
+            if dark is not None:
+                scaled = self._master(dark).astype("float32") * scale
+            return Calibrator(
+                bias=self._master(bias) if bias is not None else self.bias,
+                dark=scaled,
+                flat=self.flat,
+            )
+
+        return self._lru(self._calibrators, key, build)
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from .accumulator import WelfordAccumulator
+from .align import FrameAligner
+
+
+class LiveStacker:
+    """Calibrates, aligns and accumulates frames one at a time.
+
+    The first frame added is the alignment reference. `snapshot()` may be
+    called from another thread (e.g. a preview writer) between or during
+    `add()` calls; the accumulator update itself is serialised.
+    """
+
+    def __init__(self, calibrator=None, align=False, align_options=None,
+                 precision="float64"):
+        self.calibrator = calibrator
+        self.aligner = FrameAligner(**(align_options or {})) if align else None
+        self.acc = WelfordAccumulator(precision)
+        self.frames = 0
+        self.last_latency = None
+        self._lock = threading.Lock()
+
+    def add(self, img, path=None) -> float:
+        """Stack one frame; returns the time it took in seconds."""
+        started = time.perf_counter()
+        if self.calibrator is not None:
+            img = self.calibrator.apply(img)
+        if self.aligner is not None:
+            img = self.aligner.align(img, path)
+        with self._lock:
+            self.acc.add(img)
+            self.frames += 1
+        self.last_latency = time.perf_counter() - started
+        return self.last_latency
+
+    def snapshot(self):
+        """Current mean (float32, NaN where no frame covers), or None."""
+        with self._lock:
+            if self.acc.count is None:
+                return None
+            return self.acc.finalize()
+
+
+class LivePreview:
+    """Writes stretched previews of a LiveStacker in a background thread.
+
+    A preview is skipped while the previous one is still being written, so
+    slow encoders never hold up stacking.
+    """
+
+    def __init__(self, stacker, path, stretch_options=None):
+        self.stacker = stacker
+        self.path = path
+        self.stretch_options = stretch_options or {}
+        self.written = 0
+        self._thread = None
+        self._frames = None
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _write(self, image):
+        from osiris_io.file_writer import FileWriter
+
+        from .postprocess import normalize_image
+
+        FileWriter.save_image(self.path, normalize_image(image, **self.stretch_options))
+        self.written += 1
+
+    def update(self, wait=False):
+        """Start writing a preview if there are new frames; True if started."""
+        if self.busy and not wait:
+            return False
+        self.join()
+        if self.stacker.frames == self._frames:
+            return False
+        image = self.stacker.snapshot()
+        if image is None:
+            return False
+        self._frames = self.stacker.frames
+        self._thread = threading.Thread(target=self._write, args=(image,), daemon=True)
+        self._thread.start()
+        if wait:
+            self.join()
+        return True
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,209 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from config import DefaultConfig
+from utils import MemoryManager
+
+from .precision import FrameCodec
+
+PLAN_MODES = ("memory", "tiled", "stream")
+
+# Per-pixel bytes each method keeps besides the frames themselves:
+# accumulators, the float32 result and the stretched output
+_RESULT_BPP = 4 + 8
+_STREAM_BPP = {"average": 20, "weighted": 16, "sigma": 64, "median": 48}
+_MEMORY_BPP = {"average": 20, "weighted": 16, "sigma": 0, "median": 0}
+_MB = 1024 * 1024
+
+
+def memory_budget_mb(limit_mb=None) -> float:
+    """`limit_mb` (default DefaultConfig.memory_limit_mb), capped at half
+    of the memory available right now."""
+    if limit_mb is None:
+        limit_mb = DefaultConfig().memory_limit_mb
+    return min(limit_mb, MemoryManager.get_available_memory_mb() / 2)
+
+
+@dataclass
+class ExecutionPlan:
+    """Execution mode chosen for a run, with the numbers behind it."""
+
+    mode: str
+    n_frames: int
+    frame_shape: tuple
+    frame_dtype: str
+    budget_mb: float
+    estimates_mb: dict = field(default_factory=dict)
+    tile_budget_mb: float = None
+    rows_per_tile: int = None
+    reason: str = ""
+
+    @property
+    def estimated_mb(self) -> float:
+        return self.estimates_mb.get(self.mode, 0.0)
+
+    def options(self) -> dict:
+        """Run parameters that select this plan in run_pipeline."""
+        opts = {}
+        if self.mode == "tiled":
+            opts["use_memmap"] = True
+        elif self.mode == "stream":
+            opts["stream"] = True
+        if self.tile_budget_mb is not None:
+            opts["memory_limit_mb"] = self.tile_budget_mb
+        return opts
+
+    def describe(self) -> str:
+        shape = "x".join(str(s) for s in self.frame_shape)
+        text = (
+            f"Plan: {self.mode} for {self.n_frames} x {shape} {self.frame_dtype} "
+            f"frames (~{self.estimated_mb:.0f} MB of {self.budget_mb:.0f} MB budget"
+        )
+        if self.rows_per_tile:
+            text += f", {self.rows_per_tile} rows per tile"
+        return f"{text}); {self.reason}"
+
+
+class ExecutionPlanner:
+    """Picks the fastest execution mode whose peak memory fits the budget.
+
+    Frame count, shape and dtype come from the file headers
+    (FrameHandle.info), so nothing is decoded. Modes, fastest first:
+
+    - ``memory``: every frame held (in the `precision` storage format),
+      sigma/median combined in row tiles sized to what the frames leave of
+      the budget.
+    - ``tiled``: unaligned FITS stacks read in memory-mapped row strips.
+    - ``stream``: one frame in flight; multi-pass methods re-read the files.
+
+    Only modes that give the in-memory result are considered (see
+    `eligible`); when none fits, the one with the smallest estimate is used.
+    """
+
+    def __init__(self, memory_limit_mb=None):
+        self.memory_limit_mb = memory_limit_mb
+
+    def budget_mb(self) -> float:
+        return memory_budget_mb(self.memory_limit_mb)
+
+    @staticmethod
+    def inspect(paths):
+        """`(n_frames, shape, dtype)` of a frame set, from its first header."""
+        from osiris_io.file_loader import FrameHandle
+
+        shape, dtype = FrameHandle(paths[0]).info()
+        return len(paths), tuple(shape), np.dtype(dtype)
+
+    @staticmethod
+    def _tile_floor_mb(method, n_frames, shape):
+        """Working memory of one output row for a tiled combine."""
+        from .tiled import TiledCombineEngine
+
+        if method not in ("sigma", "median"):
+            return 0.0
+        row = n_frames * int(np.prod(shape[1:], dtype=np.int64)) * 4
+        return row * TiledCombineEngine._WORKING_COPIES[method] / _MB
+
+    def estimates(self, method, n_frames, shape, dtype, align=False,
+                  calibrated=False, precision="float32", jobs=1):
+        """Peak memory estimate (MB) of each mode."""
+        pixels = int(np.prod(shape, dtype=np.int64))
+        storage = FrameCodec(precision).dtype.itemsize
+        # Calibrated frames are float and compacted; raw ones keep their dtype
+        held = storage if calibrated else dtype.itemsize
+        aligned = storage if align else 0
+        if align and jobs != 1 and n_frames > 1:
+            # Parallel alignment decodes every frame into a float32 block;
+            # float32 output is views of it, compact output a copy besides
+            aligned = 4 + (storage if storage != 4 else 0)
+        frames = n_frames * pixels * (held + aligned)
+        tile = self._tile_floor_mb(method, n_frames, shape)
+        memory = (frames + pixels * (_MEMORY_BPP.get(method, 20) + _RESULT_BPP)) / _MB
+        # The frame being aligned, its reference and one calibrated buffer
+        in_flight = pixels * (dtype.itemsize + 4 + (8 if align else 0))
+        return {
+            "memory": memory + tile,
+            "tiled": tile + pixels * _RESULT_BPP / _MB,
+            "stream": (in_flight + pixels * (_STREAM_BPP.get(method, 20) + _RESULT_BPP))
+            / _MB,
+        }
+
+    @staticmethod
+    def lossless(precision, dtype, calibrated=False) -> bool:
+        """Whether in-memory frames keep their values in `precision` storage.
+
+        Native integer frames are held as they are, except 16-bit frames
+        in uint16 storage (saturated samples are clamped); float frames
+        are quantized by any format but float32.
+        """
+        if precision == "float32":
+            return True
+        if calibrated or dtype.kind not in "ui":
+            return False
+        return not (precision == "uint16" and dtype.itemsize == 2)
+
+    @staticmethod
+    def eligible(method, paths, dtype, align=False, calibrated=False, library=False,
+                 quality=False, precision="float32"):
+        """Modes that give the in-memory result for these settings.
+
+        The planner only switches between these, so the output does not
+        depend on the memory that happens to be free. Tiled FITS strips go
+        through the same kernels as the in-memory path. Streaming keeps
+        alignment borders as NaN where the in-memory path fills them with
+        0, and its sigma clip estimates mean/std instead of median/MAD, so
+        it only stands in for unaligned average stacks and for the radix
+        histogram median of raw, unaligned, uncalibrated 8/16-bit integer
+        frames. Lossy `precision` storage only applies in memory.
+        """
+        modes = ["memory"]
+        if not ExecutionPlanner.lossless(precision, dtype, calibrated or library):
+            return modes
+        fits_only = all(p.lower().endswith((".fits", ".fit")) for p in paths)
+        if fits_only and not (align or library or quality):
+            modes.append("tiled")
+        streamable = {
+            "average": not align,
+            "weighted": not align,
+            "median": (dtype.kind in "ui" and dtype.itemsize <= 2
+                       and not (align or calibrated or library)),
+        }
+        if streamable.get(method):
+            modes.append("stream")
+        return modes
+
+    def plan(self, paths, method="average", align=False, calibrated=False,
+             library=False, quality=False, precision="float32", jobs=1):
+        n_frames, shape, dtype = self.inspect(paths)
+        budget = self.budget_mb()
+        estimates = self.estimates(
+            method, n_frames, shape, dtype, align=align,
+            calibrated=calibrated or library, precision=precision, jobs=jobs,
+        )
+        modes = self.eligible(method, paths, dtype, align=align, calibrated=calibrated,
+                              library=library, quality=quality, precision=precision)
+        fitting = [m for m in modes if estimates[m] <= budget]
+        if fitting:
+            mode = fitting[0]
+            reason = "fastest mode that fits" if mode == modes[0] else (
+                f"{', '.join(modes[:modes.index(mode)])} would exceed the budget"
+            )
+        else:
+            mode = min(modes, key=estimates.get)
+            reason = "no equivalent mode fits the budget; using the smallest"
+
+        plan = ExecutionPlan(
+            mode=mode, n_frames=n_frames, frame_shape=shape,
+            frame_dtype=str(dtype.newbyteorder("=")), budget_mb=budget,
+            estimates_mb=estimates, reason=reason,
+        )
+        if method in ("sigma", "median") and mode != "stream":
+            from .tiled import TiledCombineEngine
+
+            tile = self._tile_floor_mb(method, n_frames, shape)
+            # Tiles get whatever the held frames leave of the budget
+            plan.tile_budget_mb = max(budget - (estimates[mode] - tile), tile)
+            engine = TiledCombineEngine(method, memory_limit_mb=plan.tile_budget_mb)
+            plan.rows_per_tile = engine.rows_per_tile(n_frames, shape)
+        return plan
@@ -0,0 +1,130 @@
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "uint16")
+# uint16 code reserved for missing samples (alignment borders, BLANK)
+UINT16_SENTINEL = np.uint16(65535)
+FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+
+class FrameCodec:
+    """Storage format for frames held between calibration, align and stack.
+
+    ``float32`` keeps today's behaviour. ``float16`` halves the storage of
+    float frames (11-bit mantissa, values up to 65504) and ``uint16``
+    stores ``round((value - offset) * scale)`` with 65535 as the NaN
+    sentinel, so NaN borders survive. All arithmetic happens on decoded
+    float32 data; only storage is compact.
+
+    Integer frames that were never converted (uncalibrated input) are left
+    in their native dtype by `store` and decode with a plain cast, so 8-bit
+    input stays 8-bit until alignment produces float output. Native uint16
+    frames share the uint16 storage dtype, so `store` clamps them to 65534
+    to keep the sentinel free. Samples outside the storable range (the
+    uint16 window, or +-65504 for float16) are clipped and counted in
+    `clipped`.
+    """
+
+    def __init__(self, name="float32", scale=1.0, offset=0.0):
+        if name not in PRECISIONS:
+            raise ValueError(f"Unknown intermediate precision '{name}'")
+        self.name = name
+        self.scale = float(scale)
+        self.offset = float(offset)
+        self.clipped = 0
+
+    @classmethod
+    def for_sample(cls, name, sample) -> "FrameCodec":
+        """Codec for frames like `sample`.
+
+        For uint16, 8-bit input keeps 8 fractional bits (scale 256), 16-bit
+        input is stored as is (saturated samples clamped to 65534), and
+        float input (calibrated frames) is mapped from its value range with
+        at least half a range of headroom on either side.
+        """
+        sample = np.asarray(sample)
+        if name != "uint16":
+            return cls(name)
+        if np.issubdtype(sample.dtype, np.integer):
+            if sample.dtype.itemsize == 1:
+                return cls(name, scale=256.0, offset=float(np.iinfo(sample.dtype).min))
+            return cls(name, offset=float(np.iinfo(sample.dtype).min))
+        lo, hi = float(np.nanmin(sample)), float(np.nanmax(sample))
+        span = hi - lo
+        if not np.isfinite(span) or span <= 0:
+            return cls(name, offset=lo if np.isfinite(lo) else 0.0)
+        # Power-of-two scale and integer offset: integer-valued data is exact
+        scale = 2.0 ** np.floor(np.log2((int(UINT16_SENTINEL) - 1) / (2 * span)))
+        return cls(name, scale=scale, offset=float(np.floor(lo - span / 2)))
+
+    @property
+    def dtype(self):
+        return np.dtype(self.name)
+
+    @property
+    def is_identity(self) -> bool:
+        return self.name == "float32"
+
+    def _encoded(self, arr) -> bool:
+        return arr.dtype == self.dtype
+
+    def store(self, img):
+        """Frame as held between stages: float frames encoded, native
+        integer frames kept (uint16 ones clamped off the sentinel)."""
+        img = np.asarray(img)
+        if np.issubdtype(img.dtype, np.floating) or self._encoded(img):
+            return self.encode(img)
+        return img
+
+    def encode(self, img):
+        """Float frame (NaN = missing) in the storage dtype."""
+        img = np.asarray(img)
+        if self.name == "float16":
+            over = np.count_nonzero(np.abs(img) > FLOAT16_MAX)
+            if over:
+                self.clipped += over
+                img = np.clip(img, -FLOAT16_MAX, FLOAT16_MAX)
+        if self.name != "uint16":
+            return img.astype(self.dtype, copy=False)
+        if img.dtype == np.uint16 and (self.scale, self.offset) == (1.0, 0.0):
+            # Native 16-bit data: a saturated sample must not read as missing
+            return np.minimum(img, UINT16_SENTINEL - 1)
+        scaled = np.subtract(img, self.offset, dtype=np.float32)
+        scaled *= self.scale
+        missing = np.isnan(scaled)
+        scaled[missing] = 0
+        top = float(UINT16_SENTINEL - 1)
+        if scaled.size and (scaled.min() < 0 or scaled.max() > top):
+            self.clipped += np.count_nonzero((scaled < 0) | (scaled > top))
+        np.clip(scaled, 0, top, out=scaled)
+        out = np.rint(scaled, out=scaled).astype(np.uint16)
+        out[missing] = UINT16_SENTINEL
+        return out
+
+    def decode(self, arr, out=None):
+        """Stored (or native integer) frame as float32 with NaN restored."""
+        arr = np.asarray(arr)
+        if self.name != "uint16" or not self._encoded(arr):
+            if out is None:
+                return arr.astype(np.float32, copy=False)
+            out[...] = arr
+            return out
+        out = np.multiply(arr, np.float32(1.0 / self.scale), out=out, dtype=np.float32)
+        out += np.float32(self.offset)
+        out[arr == UINT16_SENTINEL] = np.nan
+        return out
+
+    def to_storage(self, img):
+        """`img` (stored, native or float) in the storage dtype."""
+        img = np.asarray(img)
+        if self._encoded(img):
+            return img
+        return self.encode(self.decode(img))
+
+    def fill_missing(self, arr, value=0.0):
+        """Replace missing samples of a stored frame in place."""
+        if self.name == "uint16" and self._encoded(arr):
+            code = np.clip(round((value - self.offset) * self.scale), 0, 65534)
+            arr[arr == UINT16_SENTINEL] = np.uint16(code)
+        elif np.issubdtype(arr.dtype, np.floating):
+            np.nan_to_num(arr, copy=False, nan=value, posinf=value, neginf=value)
+        return arr
@@ -1,12 +1,60 @@
 import numpy as np
 from typing import Optional
 
+
+class Calibrator:
+    """Calibration with the masters prepared once.
+
+    Bias and dark are folded into a single float32 offset and the flat is
+    stored as its reciprocal (zeros replaced by 1.0), so applying it is one
+    subtraction and one multiplication written into a caller-supplied
+    buffer, with no per-frame conversion of the masters.
+    """
+
+    def __init__(self, bias=None, dark=None, flat=None):
+        self.offset = None
+        for frame in (bias, dark):
+            if frame is None:
+                continue
+            if self.offset is None:
+                self.offset = np.array(frame, dtype=np.float32)
+            else:
+                self.offset += frame
+        self.inv_flat = None
+        if flat is not None:
+            f = np.array(flat, dtype=np.float32)
+            f[f == 0] = 1.0
+            self.inv_flat = np.reciprocal(f, out=f)
+
+    @property
+    def is_identity(self) -> bool:
+        return self.offset is None and self.inv_flat is None
+
+    def apply(self, image: np.ndarray, out: Optional[np.ndarray] = None, rows=None):
+        """Return `(image - bias - dark) * inv_flat` as float32.
+
+        `out` (float32, same shape) is filled in place; it may be `image`
+        itself. `rows` restricts the masters to a strip of the first axis
+        when `image` is such a strip.
+        """
+        if out is None:
+            out = np.empty(image.shape, dtype=np.float32)
+        offset, inv_flat = self.offset, self.inv_flat
+        if rows is not None:
+            offset = None if offset is None else offset[rows]
+            inv_flat = None if inv_flat is None else inv_flat[rows]
+        if offset is not None:
+            np.subtract(image, offset, out=out)
+        elif out is not image:
+            np.copyto(out, image)
+        if inv_flat is not None:
+            np.multiply(out, inv_flat, out=out)
+        return out
+
+    def apply_batch(self, stack: np.ndarray, out: Optional[np.ndarray] = None):
+        """Calibrate an (N, ...) stack of frames in one vectorized pass."""
+        return self.apply(stack, out=out)
+
+
 def apply_calibration(image: np.ndarray, bias=None, dark=None, flat=None) -> np.ndarray:
-    img = image.astype(np.float32)
-    if bias is not None: img -= bias.astype(np.float32)
-    if dark is not None: img -= dark.astype(np.float32)
-    if flat is not None:
-        f = flat.astype(np.float32)
-        f[f == 0] = 1.0
-        img /= f
-    return img
\ No newline at end of file
+    return Calibrator(bias, dark, flat).apply(image)
@@ -0,0 +1,328 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from osiris_io.file_loader import FileLoader
+from utils import pool_context
+
+from .accumulator import WelfordAccumulator
+from .cache import TransformCache, file_signature
+from .combine import StreamingSigmaClipStrategy
+
+PARTIAL_VERSION = 1
+SHARDABLE_METHODS = ("average", "sigma")
+
+
+def _shard_frames(paths, stacker, transform_cache):
+    """Decode, calibrate and (optionally) align one shard's frames."""
+    from .align import iter_aligned
+    from .library import FrameInfo
+
+    ref_path, library = stacker.ref_path or paths[0], stacker.library
+    align = stacker.align
+
+    # The shared reference leads every aligned shard and is dropped below
+    lead = align and paths[0] != ref_path
+    sources = [ref_path, *paths] if lead else list(paths)
+    items = FileLoader.iter_prefetched(sources, return_headers=library is not None)
+
+    def frames():
+        for item in items:
+            if library is not None:
+                img, header = item
+                cal = library.calibrator_for(FrameInfo.from_header(header))
+            else:
+                img, cal = item, stacker.calibrator
+            yield cal.apply(img) if cal is not None else img
+
+    stream = frames()
+    if align:
+        stream = iter_aligned(
+            stream, paths=sources, transform_cache=transform_cache,
+            **stacker.align_options,
+        )
+        if lead:
+            next(stream, None)
+    return stream
+
+
+def _load_bounds(bounds):
+    """`(lower, upper)` arrays, from an .npz path or as given."""
+    if isinstance(bounds, str):
+        with np.load(bounds) as data:
+            return data["lower"], data["upper"]
+    return bounds
+
+
+def _stack_shard(task):
+    """Worker: stack one shard of frames into a partial result on disk."""
+    paths, out_path, settings = task
+    stacker = ShardedStacker(**settings)
+    # Shared across passes so a multi-pass clip registers each frame once
+    cache = TransformCache(None)
+
+    def frames():
+        return _shard_frames(paths, stacker, cache)
+
+    if stacker.method == "sigma" and stacker.bounds is not None:
+        # Fixed clip range (append mode): one pass, nothing re-estimated
+        strategy = StreamingSigmaClipStrategy(stacker.sigma, stacker.iters)
+        lower, upper = _load_bounds(stacker.bounds)
+        count, total, total_sq = strategy._accumulate(frames, lower, upper)
+        acc = WelfordAccumulator.from_moments(count, total, total_sq)
+    elif stacker.method == "sigma":
+        strategy = StreamingSigmaClipStrategy(stacker.sigma, stacker.iters)
+        acc = strategy.accumulate(frames)
+    else:
+        acc = WelfordAccumulator()
+        for frame in frames():
+            acc.add(frame)
+    return acc.save(out_path, **stacker.partial_meta(paths))
+
+
+def _clip_pass(task):
+    """Worker: one pass of a sharded sigma clip over one shard's frames.
+
+    The pass inputs are read from `inputs_path` and its per-pixel result
+    is written to `out_path`; registrations persist in `cache_path` so
+    each frame is aligned once across passes.
+    """
+    paths, out_path, settings, step, inputs_path, cache_path = task
+    stacker = ShardedStacker(**settings)
+    strategy = StreamingSigmaClipStrategy(stacker.sigma, stacker.iters)
+    cache = TransformCache(cache_path)
+
+    def frames():
+        return _shard_frames(paths, stacker, cache)
+
+    with np.load(inputs_path) as inputs:
+        if step == "range":
+            lo, hi = strategy._range(frames)
+            result = {"lo": lo, "hi": hi}
+        elif step == "histogram":
+            counts = strategy._histogram(frames, inputs["lo"], inputs["scale"])
+            result = {"counts": counts}
+        else:
+            count, total, total_sq = strategy._accumulate(
+                frames, inputs["lower"], inputs["upper"]
+            )
+            result = {"count": count, "total": total, "total_sq": total_sq}
+    with open(out_path, "wb") as f:
+        np.savez(f, **result)
+    return out_path
+
+
+class _ShardedSigmaClip(StreamingSigmaClipStrategy):
+    """StreamingSigmaClipStrategy whose passes run over shards in a pool.
+
+    Every pass is a per-pixel min/max or sum over the frames, so reducing
+    the shards' results gives what one process streaming every frame
+    computes: the clip is global whatever the number of shards.
+    """
+
+    def __init__(self, stacker, shards, scratch, pool):
+        super().__init__(stacker.sigma, stacker.iters)
+        self.settings = stacker._settings()
+        self.shards = shards
+        self.scratch = scratch
+        self.pool = pool
+
+    def _map(self, step, **inputs):
+        inputs_path = os.path.join(self.scratch, "inputs.npz")
+        with open(inputs_path, "wb") as f:
+            np.savez(f, **inputs)
+        tasks = [
+            (shard, os.path.join(self.scratch, f"{step}_{i:04d}.npz"), self.settings,
+             step, inputs_path, os.path.join(self.scratch, f"transforms_{i:04d}.json"))
+            for i, shard in enumerate(self.shards)
+        ]
+        for path in self.pool.map(_clip_pass, tasks):
+            with np.load(path) as part:
+                yield dict(part)
+            os.remove(path)
+
+    def _range(self, frames):
+        lo = hi = None
+        for part in self._map("range"):
+            if lo is None:
+                lo, hi = part["lo"], part["hi"]
+            else:
+                np.fmin(lo, part["lo"], out=lo)
+                np.fmax(hi, part["hi"], out=hi)
+        return lo, hi
+
+    def _histogram(self, frames, lo, scale):
+        counts = None
+        for part in self._map("histogram", lo=lo, scale=scale):
+            if counts is None:
+                counts = part["counts"].astype(np.uint32)
+            else:
+                counts += part["counts"]
+        return counts
+
+    def _accumulate(self, frames, lower, upper):
+        sums = None
+        for part in self._map("accumulate", lower=lower, upper=upper):
+            if sums is None:
+                sums = [part["count"], part["total"], part["total_sq"]]
+            else:
+                for total, name in zip(sums, ("count", "total", "total_sq")):
+                    total += part[name]
+        return tuple(sums)
+
+
+def merge_partials(partial_paths):
+    """Merge partial results (from any number of runs or machines).
+
+    Returns ``(accumulator, metadata)``. Partials must come from the same
+    method and must not share frames.
+    """
+    merged, meta, seen = WelfordAccumulator(), None, set()
+    for path in partial_paths:
+        acc, info = WelfordAccumulator.load(path)
+        if info.get("version") != PARTIAL_VERSION:
+            raise ValueError(f"{path} is not a partial stack result")
+        if meta is None:
+            meta = dict(info, frames=[])
+        elif info.get("method") != meta.get("method"):
+            raise ValueError(
+                f"Cannot merge '{info.get('method')}' partials "
+                f"with '{meta.get('method')}' ones"
+            )
+        overlap = seen.intersection(info.get("frames", []))
+        if overlap:
+            raise ValueError(f"{len(overlap)} frame(s) appear in more than one partial")
+        seen.update(info.get("frames", []))
+        meta["frames"].extend(info.get("frames", []))
+        merged.merge(acc)
+    return merged, meta
+
+
+class ShardedStacker:
+    """Stacks contiguous shards of frames in worker processes.
+
+    Each worker writes its accumulator to `shard_dir` as a partial result
+    (Welford count/mean/M2 plus JSON metadata); the reduce step merges the
+    partials exactly. `average` is identical to a single-process stack.
+    `sigma` runs each pass of the streaming clip over all shards and
+    reduces their per-pixel sums, so the clip uses the statistics of the
+    whole stack and does not depend on the number of shards; it writes
+    one partial for all the frames. Partials from other runs or machines
+    merge the same way (see `merge_partials`), each clipped on its own.
+
+    `bounds`, a `(lower, upper)` pair of per-pixel arrays, makes `sigma`
+    keep only the samples inside it, in one pass and without estimating
+    a clip of its own (append mode clips new frames against the saved
+    stack this way).
+    """
+
+    def __init__(
+        self, method="average", workers=None, shard_dir=None, sigma=3.0, iters=5,
+        calibrator=None, library=None, align=False, align_options=None,
+        ref_path=None, bounds=None,
+    ):
+        if method not in SHARDABLE_METHODS:
+            raise ValueError(f"Sharded stacking does not support method '{method}'")
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_dir = shard_dir
+        self.sigma = sigma
+        self.iters = iters
+        self.calibrator = calibrator
+        self.library = library
+        self.align = align
+        self.align_options = align_options or {}
+        self.ref_path = ref_path
+        self.bounds = bounds
+
+    def _settings(self):
+        return {
+            "method": self.method, "workers": 1, "sigma": self.sigma,
+            "iters": self.iters, "calibrator": self.calibrator,
+            "library": self.library, "align": self.align,
+            "align_options": self.align_options, "ref_path": self.ref_path,
+            "bounds": self.bounds,
+        }
+
+    def partial_meta(self, paths):
+        return {
+            "version": PARTIAL_VERSION,
+            "method": self.method,
+            "sigma": self.sigma,
+            "iters": self.iters,
+            "frames": [file_signature(p) for p in paths],
+        }
+
+    def shards(self, paths):
+        """Split `paths` into at most `workers` contiguous, even shards."""
+        n = min(self.workers, len(paths))
+        return [paths[i * len(paths) // n:(i + 1) * len(paths) // n] for i in range(n)]
+
+    def run(self, paths, shard_dir=None):
+        """Stack every shard; returns the partial result paths.
+
+        Partials go to `shard_dir`, else `self.shard_dir`, else a new
+        temporary directory that is removed again if a shard fails.
+        """
+        paths = list(paths)
+        if not paths:
+            return []
+        if self.align and self.ref_path is None:
+            self.ref_path = paths[0]
+        shard_dir = shard_dir or self.shard_dir
+        owned = shard_dir is None
+        if owned:
+            shard_dir = tempfile.mkdtemp(prefix="osiris_shards_")
+        bounds_path = None
+        try:
+            os.makedirs(shard_dir, exist_ok=True)
+            settings = self._settings()
+            if self.bounds is not None and self.workers > 1:
+                # Workers read the clip range from disk, not from every task
+                bounds_path = os.path.join(shard_dir, "bounds.npz")
+                lower, upper = self.bounds
+                with open(bounds_path, "wb") as f:
+                    np.savez(f, lower=lower, upper=upper)
+                settings["bounds"] = bounds_path
+            tasks = [
+                (shard, os.path.join(shard_dir, f"partial_{i:04d}.npz"), settings)
+                for i, shard in enumerate(self.shards(paths))
+            ]
+            if len(tasks) == 1:
+                return [_stack_shard(tasks[0])]
+            pool = ProcessPoolExecutor(max_workers=len(tasks),
+                                       mp_context=pool_context())
+            with pool:
+                if self.method == "sigma" and self.bounds is None:
+                    return [self._clip_shards(paths, tasks, shard_dir, pool)]
+                return list(pool.map(_stack_shard, tasks))
+        except BaseException:
+            if owned:
+                shutil.rmtree(shard_dir, ignore_errors=True)
+            raise
+        finally:
+            if bounds_path is not None and os.path.exists(bounds_path):
+                os.remove(bounds_path)
+
+    def _clip_shards(self, paths, tasks, shard_dir, pool):
+        """Global sigma clip over every shard; returns its partial path."""
+        scratch = tempfile.mkdtemp(prefix="clip_", dir=shard_dir)
+        try:
+            clip = _ShardedSigmaClip(self, [task[0] for task in tasks], scratch, pool)
+            acc = clip.accumulate(None)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return acc.save(tasks[0][1], **self.partial_meta(paths))
+
+    def stack(self, paths):
+        """Map over shards in parallel, then reduce; returns the accumulator."""
+        shard_dir = self.shard_dir or tempfile.mkdtemp(prefix="osiris_shards_")
+        try:
+            merged, _ = merge_partials(self.run(paths, shard_dir))
+        finally:
+            if self.shard_dir is None:
+                shutil.rmtree(shard_dir, ignore_errors=True)
+        return merged
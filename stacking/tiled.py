@@ -0,0 +1,162 @@
+import itertools
+import os
+import tempfile
+import warnings
+
+import numpy as np
+
+from .clipping import ClipKernel
+from .median import nanmedian_block
+from .planner import memory_budget_mb
+from .precision import FrameCodec
+
+
+class TiledCombineEngine:
+    """Out-of-core combine over a frame-major memmapped cube.
+
+    Frames are written to the cube one after another (sequential writes),
+    then the cube is reduced in row strips whose height is chosen so that a
+    strip plus the method's temporaries fits the memory budget.
+    """
+
+    # Rough number of strip-sized float32 buffers each method keeps alive
+    _WORKING_COPIES = {"average": 2, "median": 3, "sigma": 5}
+
+    def __init__(
+        self, method="average", memory_limit_mb=None, sigma=3.0, iters=5, tmp_dir=None,
+        clip_mode="sigma", clip_low=None, clip_high=None, codec=None,
+    ):
+        self.method = method
+        self.memory_limit_mb = memory_limit_mb
+        self.sigma = sigma
+        self.iters = iters
+        self.tmp_dir = tmp_dir
+        self.clip_mode = clip_mode
+        self.clip_low = clip_low
+        self.clip_high = clip_high
+        # Storage format of the temp cube and of in-memory frames
+        self.codec = codec or FrameCodec()
+
+    def kernel(self) -> ClipKernel:
+        low, high = self.clip_low, self.clip_high
+        if self.clip_mode in ("sigma", "winsorized"):
+            # Sigma-type modes fall back to the symmetric `sigma` threshold
+            low = self.sigma if low is None else low
+            high = self.sigma if high is None else high
+        return ClipKernel(self.clip_mode, low, high, self.iters)
+
+    def budget_bytes(self) -> int:
+        # Never plan for more than half of what the machine has free right now
+        return int(memory_budget_mb(self.memory_limit_mb) * 1024 * 1024)
+
+    def rows_per_tile(self, n_frames, frame_shape) -> int:
+        row_bytes = n_frames * int(np.prod(frame_shape[1:], dtype=np.int64)) * 4
+        copies = self._WORKING_COPIES.get(self.method, 2)
+        rows = self.budget_bytes() // max(1, row_bytes * copies)
+        return int(min(max(rows, 1), frame_shape[0]))
+
+    def _reduce(self, tile):
+        if self.method == "median":
+            return nanmedian_block(tile)
+        if self.method == "sigma":
+            # Strips are fresh buffers, so the kernel may clip them in place
+            self.kernel().reject(tile)
+            return np.nanmean(tile, axis=0)
+        return np.nanmean(tile, axis=0)
+
+    def _combine_strips(self, n_frames, frame_shape, read_strip):
+        result = np.empty(frame_shape, dtype=np.float32)
+        step = self.rows_per_tile(n_frames, frame_shape)
+        for r0 in range(0, frame_shape[0], step):
+            tile = read_strip(slice(r0, r0 + step))
+            with warnings.catch_warnings():
+                # All-NaN columns (alignment borders) are expected
+                warnings.simplefilter("ignore", RuntimeWarning)
+                result[r0:r0 + step] = self._reduce(tile)
+            del tile
+        return result
+
+    def combine_cube(self, cube):
+        """Reduce an (N, H, ...) array-like strip by strip."""
+        def read_strip(rows):
+            strip = cube[:, rows]
+            return self.codec.decode(strip, out=np.empty(strip.shape, np.float32))
+
+        return self._combine_strips(cube.shape[0], cube.shape[1:], read_strip)
+
+    def combine_arrays(self, images):
+        """Reduce in-memory frames strip by strip, without an (N, H, W) copy."""
+        if not images:
+            return None
+        def read_strip(rows):
+            tile = None
+            for i, img in enumerate(images):
+                strip = img[rows]
+                if tile is None:
+                    tile = np.empty((len(images), *strip.shape), dtype=np.float32)
+                self.codec.decode(strip, out=tile[i])
+            return tile
+
+        return self._combine_strips(len(images), images[0].shape, read_strip)
+
+    def combine_handles(self, handles, preprocess=None):
+        """Reduce lazy frame handles without building a cube.
+
+        Each strip is assembled from `handle.read(rows)`, which for FITS
+        opens the file, maps only those rows and closes it again, so a
+        stack never holds more than one frame's file open.
+        `preprocess(strip, rows)` may transform each frame's strip (e.g.
+        calibration with the matching rows of the master frames).
+        """
+        if not handles:
+            return None
+        if not all(handle.row_access for handle in handles):
+            # Strips of PNG/TIFF/JPEG would decode whole files per strip:
+            # decode each frame once into the temp cube instead
+            def frames():
+                for handle in handles:
+                    img = handle.read()
+                    yield img if preprocess is None else preprocess(img, slice(None))
+
+            return self.combine_iter(frames(), len(handles))
+        frame_shape = handles[0].shape
+
+        def read_strip(rows):
+            tile = None
+            for i, handle in enumerate(handles):
+                strip = handle.read(rows)
+                if preprocess is not None:
+                    strip = preprocess(strip, rows)
+                if tile is None:
+                    tile = np.empty((len(handles), *strip.shape), dtype=np.float32)
+                tile[i] = strip
+            return tile
+
+        return self._combine_strips(len(handles), frame_shape, read_strip)
+
+    def combine(self, images):
+        if not images:
+            return None
+        return self.combine_iter(iter(images), len(images))
+
+    def combine_iter(self, frames, n_frames):
+        """Like `combine` for `n_frames` frames yielded one at a time; each
+        is written to the temp cube as it arrives."""
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            return None
+        fd, temp_path = tempfile.mkstemp(suffix=".npy", dir=self.tmp_dir)
+        os.close(fd)
+        try:
+            shape = (n_frames, *np.shape(first))
+            cube = np.memmap(temp_path, dtype=self.codec.dtype, mode="w+", shape=shape)
+            for i, img in enumerate(itertools.chain([first], frames)):
+                cube[i] = self.codec.to_storage(img)
+            cube.flush()
+            result = self.combine_cube(cube)
+            del cube
+            return result
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from cli import main, run_pipeline
+from osiris_io.file_loader import FileLoader
+from osiris_io.frame_cache import SharedFrameCache
+from stacking.batch import BatchJob, BatchScheduler
+
+
+def write_frames(directory, n=4):
+    directory.mkdir()
+    for i in range(n):
+        rng = np.random.default_rng(i)
+        iio.imwrite(str(directory / f"f{i}.png"),
+                    (rng.random((20, 24)) * 60000).astype(np.uint16))
+    return FileLoader.list_image_paths(str(directory))
+
+
+def test_frame_cache_decodes_shared_frames_once(tmp_path, monkeypatch):
+    paths = write_frames(tmp_path / "in", 2)
+    cache = SharedFrameCache()
+    cache.expect(paths)
+    cache.expect(paths[:1])
+    assert cache.overlap == 1
+
+    decoded = []
+    load_image = FileLoader.load_image
+    monkeypatch.setattr(FileLoader, "load_image", staticmethod(
+        lambda path, **kw: decoded.append(path) or load_image(path, **kw)
+    ))
+    first = cache.handles(paths)[0].load()
+    assert not first.flags.writeable and cache.bytes == first.nbytes
+    assert cache.load(paths[0]) is first
+    # Released after its last expected reader
+    assert cache.bytes == 0
+    cache.load(paths[1])
+    assert decoded == paths and (cache.hits, cache.misses) == (1, 2)
+
+
+def test_frame_cache_over_budget_decodes_again(tmp_path):
+    paths = write_frames(tmp_path / "in", 1)
+    cache = SharedFrameCache(max_bytes=0)
+    cache.expect(paths * 2)
+    a, b = cache.load(paths[0]), cache.load(paths[0])
+    assert a is not b and np.array_equal(a, b) and cache.misses == 2
+
+
+def test_scheduler_respects_core_and_memory_budgets():
+    scheduler = BatchScheduler(cores=2, memory_limit_mb=100)
+    scheduler.memory_mb = 100
+    jobs = [BatchJob(f"j{i}", "in", f"o{i}", memory_mb=30) for i in range(4)]
+    jobs.append(BatchJob("big", "in", "big", memory_mb=500))
+    jobs.append(BatchJob("bad", "in", "bad"))
+    lock, running, peak = threading.Lock(), [], []
+
+    def run_job(job):
+        with lock:
+            running.append(job.name)
+            peak.append(list(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(job.name)
+        if job.name == "bad":
+            raise RuntimeError("boom")
+
+    done = scheduler.run(jobs, run_job)
+    assert max(len(r) for r in peak) == 2
+    assert ["big"] in peak and not any("big" in r and len(r) > 1 for r in peak)
+    assert [j.ok for j in done] == [True] * 5 + [False]
+    assert isinstance(done[-1].error, RuntimeError)
+
+
+def test_scheduler_groups_jobs_by_input():
+    jobs = [BatchJob("a", "x", "1"), BatchJob("b", "y", "2"), BatchJob("c", "x", "3")]
+    assert [j.name for j in BatchScheduler.order(jobs)] == ["a", "c", "b"]
+
+
+def test_all_profiles_batch_matches_single_runs(tmp_path, monkeypatch):
+    write_frames(tmp_path / "in")
+    dark = np.full((20, 24), 100, np.uint16)
+    iio.imwrite(str(tmp_path / "dark.png"), dark)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "osiris.toml").write_text(
+        '[avg]\ninput = "in"\noutput = "avg.fits"\nmethod = "average"\n'
+        'dark = "dark.png"\nalign = true\n'
+        '[med]\ninput = "in"\noutput = "med.fits"\nmethod = "median"\n'
+        'dark = "dark.png"\n'
+    )
+    jobs = main(["--all-profiles", "--batch-cores", "2"])
+    assert [j.name for j in jobs] == ["avg", "med"] and all(j.ok for j in jobs)
+    assert jobs[0].params["shared"].frames.hits > 0
+
+    for name, method, align in (("avg", "average", True), ("med", "median", False)):
+        single = str(tmp_path / f"{name}_single.fits")
+        run_pipeline("in", single, method=method, align=align, dark="dark.png")
+        assert np.array_equal(FileLoader.load_image(f"{name}.fits"),
+                              FileLoader.load_image(single))
+
+
+def test_batch_rejects_unknown_profiles_and_shared_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "osiris.toml").write_text(
+        '[a]\ninput = "in"\noutput = "x.fits"\n[b]\ninput = "in2"\noutput = "x.fits"\n'
+    )
+    with pytest.raises(SystemExit):
+        main(["--profiles", "a,nope"])
+    with pytest.raises(SystemExit):
+        main(["--profiles", "a,b"])
+
+
+def test_worker_pools_do_not_fork_a_threaded_process(tmp_path):
+    from stacking.align import align_images
+    from stacking.sharded import ShardedStacker
+    from utils import pool_context
+
+    paths = write_frames(tmp_path / "in")
+    frames = [FileLoader.load_image(p) for p in paths]
+    results = {}
+
+    def work():
+        results["ctx"] = pool_context().get_start_method()
+        results["aligned"] = align_images(frames, jobs=2)
+        results["acc"] = ShardedStacker(workers=2).stack(paths)
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    assert results["ctx"] in ("forkserver", "spawn")
+    assert len(results["aligned"]) == 4 and results["acc"].count.max() == 4
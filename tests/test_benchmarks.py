@@ -0,0 +1,46 @@
+import json
+
+import numpy as np
+import pytest
+
+import cli
+from benchmarks.suite import compare, run_suite
+from benchmarks.synthetic import synthetic_frames
+
+
+def test_synthetic_frames_are_dithered_star_fields():
+    frames, shifts = synthetic_frames(3, 64, 48, channels=3, dtype="uint8", seed=2)
+    assert len(frames) == 3 and frames[0].shape == (64, 48, 3)
+    assert frames[0].dtype == np.uint8
+    assert np.array_equal(shifts[0], [0, 0]) and np.any(shifts[1:] != 0)
+    # Stars stand well above the sky
+    assert frames[0].max() > 4 * np.median(frames[0])
+
+
+def test_suite_reports_every_case_of_the_selected_stages():
+    results = run_suite(frames=3, height=32, width=32, repeat=1,
+                        stages=("calibrate", "stack", "normalize"))
+    cases = {(r["stage"], r["case"]) for r in results["results"]}
+    assert ("stack", "sigma (memmap)") in cases and ("normalize", "asinh") in cases
+    assert all(r["seconds"] >= 0 and r["peak_mb"] >= 0 for r in results["results"])
+    json.dumps(results)
+
+    slower = json.loads(json.dumps(results))
+    for r in slower["results"]:
+        r["seconds"] *= 2
+    rows = compare(slower, results, threshold=0.5)
+    assert rows and all(row[-1] for row in rows)
+
+
+def test_unknown_stage():
+    with pytest.raises(ValueError):
+        run_suite(frames=2, height=16, width=16, stages=("render",))
+
+
+def test_benchmark_subcommand_writes_json(tmp_path, capsys):
+    out = tmp_path / "bench.json"
+    cli.main(["benchmark", "--frames", "2", "--size", "24", "--repeat", "1",
+              "--stages", "load,normalize", "-o", str(out)])
+    data = json.loads(out.read_text())
+    assert {r["stage"] for r in data["results"]} == {"load", "normalize"}
+    assert data["params"]["height"] == 24
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from stacking.library import CalibrationLibrary, FrameInfo
+
+fits = pytest.importorskip("astropy.io.fits")
+
+
+def write_master(path, value, kind, exposure=None, temp=None, gain=None):
+    hdr = fits.Header()
+    hdr["IMAGETYP"] = kind
+    if exposure is not None:
+        hdr["EXPTIME"] = exposure
+    if temp is not None:
+        hdr["CCD-TEMP"] = temp
+    if gain is not None:
+        hdr["GAIN"] = gain
+    fits.PrimaryHDU(np.full((4, 4), value, dtype=np.float32), header=hdr).writeto(path)
+
+
+@pytest.fixture
+def library(tmp_path):
+    write_master(tmp_path / "bias.fits", 100, "Bias Frame", gain=120)
+    write_master(tmp_path / "d60.fits", 6, "Dark Frame", 60, -10, 120)
+    write_master(tmp_path / "d300.fits", 30, "Dark Frame", 300, -10, 120)
+    write_master(tmp_path / "d300_warm.fits", 90, "Dark Frame", 300, 5, 120)
+    return CalibrationLibrary.from_directory(str(tmp_path), cache_size=2)
+
+
+def test_selects_closest_exposure_at_matching_temperature(library):
+    entry = library.select("dark", FrameInfo(exposure=240, temperature=-9, gain=120))
+    assert entry.path.endswith("d300.fits")
+
+
+def test_dark_is_scaled_by_exposure_and_cached(library):
+    info = FrameInfo(exposure=120, temperature=-10, gain=120)
+    cal = library.calibrator_for(info)
+    frame = np.full((4, 4), 200, dtype=np.float32)
+    # bias 100 + d60 (6/60 s) scaled to 120 s -> 12
+    assert np.allclose(cal.apply(frame), 88)
+    assert library.calibrator_for(info) is cal
+
+
+def test_fallback_bias_is_used_when_library_has_none(tmp_path):
+    write_master(tmp_path / "d60.fits", 5, "Dark Frame", 60, -10)
+    library = CalibrationLibrary.from_directory(
+        str(tmp_path), bias=np.full((4, 4), 100, np.float32)
+    )
+    cal = library.calibrator_for(FrameInfo(exposure=60, temperature=-10))
+    assert np.allclose(cal.apply(np.full((4, 4), 1001, np.float32)), 896)
+
+
+def test_missing_dark_is_logged_once(library):
+    from utils import LogManager
+
+    messages = []
+    sink = LogManager.get_logger().add(messages.append, level="WARNING")
+    try:
+        info = FrameInfo(exposure=60, temperature=30, gain=120)
+        library.calibrator_for(info)
+        library.calibrator_for(info)
+    finally:
+        LogManager.get_logger().remove(sink)
+    assert len(messages) == 1 and "No library dark" in messages[0]
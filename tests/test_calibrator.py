@@ -0,0 +1,31 @@
+import numpy as np
+
+from stacking.preprocess import Calibrator, apply_calibration
+
+
+def masters(shape=(5, 5)):
+    rng = np.random.default_rng(2)
+    bias = rng.uniform(0, 2, shape).astype(np.float32)
+    dark = rng.uniform(0, 1, shape).astype(np.float32)
+    flat = rng.uniform(0.5, 1.5, shape).astype(np.float32)
+    flat[0, 0] = 0
+    return bias, dark, flat
+
+
+def test_calibrator_writes_into_caller_buffer():
+    bias, dark, flat = masters()
+    img = np.full((5, 5), 100, dtype=np.uint16)
+    buf = np.empty((5, 5), dtype=np.float32)
+    out = Calibrator(bias, dark, flat).apply(img, out=buf)
+    assert out is buf
+    safe_flat = np.where(flat == 0, 1, flat)
+    assert np.allclose(out, (img - bias - dark) / safe_flat, rtol=1e-5)
+
+
+def test_batch_matches_per_frame():
+    bias, dark, flat = masters()
+    stack = np.random.default_rng(3).uniform(50, 60, (4, 5, 5)).astype(np.float32)
+    cal = Calibrator(bias, dark, flat)
+    batch = cal.apply_batch(stack.copy())
+    for frame, expected in zip(stack, batch):
+        assert np.allclose(apply_calibration(frame, bias, dark, flat), expected)
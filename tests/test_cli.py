@@ -3,10 +3,11 @@ import os
 import imageio.v3 as iio
 import numpy as np
 
+import stacking
 from cli import run_pipeline
 
 
-def test_run_pipeline_end_to_end(tmp_path):
+def test_run_pipeline_end_to_end(tmp_path, monkeypatch):
     # prepare temporary input directory with synthetic images
     input_dir = tmp_path / "in"
     input_dir.mkdir()
@@ -17,6 +18,13 @@ def test_run_pipeline_end_to_end(tmp_path):
 
     output_path = str(tmp_path / "out_default.png")
 
+    stacked = []
+    normalize = stacking.normalize_image
+    monkeypatch.setattr(
+        stacking, "normalize_image",
+        lambda image, **kw: stacked.append(image) or normalize(image, **kw),
+    )
+
     res = run_pipeline(
         str(input_dir),
         output_path,
@@ -27,5 +35,6 @@ def test_run_pipeline_end_to_end(tmp_path):
     assert os.path.exists(res)
     out = iio.imread(res)
     assert out.shape == (10, 10)
-    # average of 0,10,20 -> 10
-    assert out.mean() == 10
+    # average of 0,10,20 -> 10; a constant stack stretches to black
+    assert stacked[0].mean() == 10
+    assert not out.any()
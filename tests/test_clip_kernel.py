@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from stacking.clipping import ClipKernel
+from stacking.combine import SigmaClipStrategy, stack_images
+
+
+def noisy_block(seed=0):
+    rng = np.random.default_rng(seed)
+    block = rng.normal(100, 2, (15, 8, 9)).astype(np.float32)
+    block[4, 3, :] = 5000  # trail
+    block[9, :, 2] = np.nan  # alignment border
+    return block
+
+
+@pytest.mark.parametrize("mode", ClipKernel.MODES)
+def test_every_mode_rejects_trail(mode):
+    res = ClipKernel(mode).combine(noisy_block())
+    assert np.all(np.abs(res - 100) < 5)
+
+
+def test_reject_stops_early_and_keeps_identical_samples():
+    block = np.full((6, 4, 4), 7.0, dtype=np.float32)
+    kernel = ClipKernel("sigma", iters=10)
+    assert kernel.reject(block) == 1
+    assert not np.isnan(block).any()
+
+
+def test_sigma_clip_strategy_tiles_match_single_block():
+    block = noisy_block(1)
+    frames = list(block)
+    res = SigmaClipStrategy(sigma=3.0, iters=5, memory_limit_mb=0.001).combine(frames)
+    assert np.allclose(res, ClipKernel("sigma").combine(block), equal_nan=True)
+
+
+def test_stack_images_sigma_accepts_clip_mode():
+    frames = list(noisy_block(2))
+    res = stack_images(frames, method="sigma", clip_mode="winsorized")
+    assert np.all(np.abs(res - 100) < 5)
@@ -0,0 +1,52 @@
+import imageio.v3 as iio
+import numpy as np
+
+import stacking.align as align_mod
+from stacking.align import FeatureMatchAlignStrategy
+
+
+def star_field(shape=(96, 96), n=40, seed=1):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[: shape[0], : shape[1]]
+    img = np.zeros(shape, dtype=np.float32)
+    for y, x in rng.uniform(8, shape[0] - 8, size=(n, 2)):
+        img += np.exp(-((yy - y) ** 2 + (xx - x) ** 2) / 3.0)
+    return np.clip(img, 0, 1)
+
+
+def test_reference_features_extracted_once(monkeypatch):
+    base = star_field()
+    imgs = [base, np.roll(base, 3, axis=1), np.roll(base, -2, axis=0)]
+    strat = FeatureMatchAlignStrategy(n_keypoints=100)
+    calls = []
+    original = strat._features
+    monkeypatch.setattr(strat, "_features", lambda *a: calls.append(1) or original(*a))
+    strat.align(imgs)
+    # one extraction for the reference plus one per frame
+    assert len(calls) == len(imgs) + 1
+
+
+def test_disk_cache_skips_extraction(tmp_path, monkeypatch):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"f{i}.png"
+        frame = np.roll(star_field(), i, axis=1) * 255
+        iio.imwrite(str(path), frame.astype(np.uint8))
+        paths.append(str(path))
+    imgs = [iio.imread(p) / 255.0 for p in paths]
+    cache_dir = str(tmp_path / "cache")
+
+    strat = FeatureMatchAlignStrategy(n_keypoints=100, cache_dir=cache_dir)
+    first = strat.align(imgs, paths=paths)
+    assert len(list((tmp_path / "cache").glob("*.npz"))) == len(paths)
+    # the shifted frame was really registered (not returned unchanged)
+    assert not np.allclose(first[1], imgs[1], equal_nan=True)
+
+    def no_orb(*args, **kwargs):
+        raise AssertionError("ORB should not run on a warm cache")
+
+    monkeypatch.setattr(align_mod, "ORB", no_orb)
+    strat = FeatureMatchAlignStrategy(n_keypoints=100, cache_dir=cache_dir)
+    second = strat.align(imgs, paths=paths)
+    for a, b in zip(first, second):
+        assert np.allclose(a, b, equal_nan=True)
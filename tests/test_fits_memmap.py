@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+from osiris_io.file_loader import FileLoader, FrameHandle
+from stacking.tiled import TiledCombineEngine
+
+fits = pytest.importorskip("astropy.io.fits")
+
+
+def test_read_rows_scales_and_converts_to_native(tmp_path):
+    data = (np.arange(48, dtype=np.uint16).reshape(6, 8) * 1000).astype(np.uint16)
+    path = str(tmp_path / "frame.fits")
+    # astropy stores uint16 as int16 with BZERO=32768
+    fits.PrimaryHDU(data).writeto(path)
+
+    with FrameHandle(path) as handle:
+        assert handle.shape == (6, 8)
+        rows = handle.read(slice(2, 4))
+    assert rows.dtype == np.float32
+    assert rows.dtype.byteorder in ("=", "|")
+    assert np.array_equal(rows, data[2:4].astype(np.float32))
+
+
+def test_tiled_combine_over_fits_handles(tmp_path):
+    frames = [np.full((10, 4), v, dtype=np.float32) for v in (1, 2, 9)]
+    for i, frame in enumerate(frames):
+        fits.PrimaryHDU(frame).writeto(str(tmp_path / f"f{i}.fits"))
+    handles = FileLoader.list_frames(str(tmp_path))
+    engine = TiledCombineEngine(method="median", memory_limit_mb=1e-6)
+    assert np.allclose(engine.combine_handles(handles), 2)
+
+
+def test_fits_reads_do_not_keep_files_open(tmp_path):
+    resource = pytest.importorskip("resource")
+    for i in range(60):
+        fits.PrimaryHDU(np.full((16, 4), i, dtype=np.float32)).writeto(
+            str(tmp_path / f"f{i:02d}.fits"))
+    handles = FileLoader.list_frames(str(tmp_path))
+    engine = TiledCombineEngine(method="median", memory_limit_mb=1e-4)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    in_use = len(os.listdir("/proc/self/fd"))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (in_use + 30, hard))
+    try:
+        result = engine.combine_handles(handles)
+        frames = [FileLoader.load_image(h.path) for h in handles]
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert np.allclose(result, 29.5)
+    assert frames[0].dtype == np.float32 and frames[0].dtype.isnative
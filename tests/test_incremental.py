@@ -0,0 +1,96 @@
+import json
+import os
+
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from cli import run_pipeline
+from osiris_io.file_loader import FileLoader
+from stacking.combine import StreamingAverageStrategy
+from stacking.incremental import IncrementalStacker, state_paths
+
+
+def add_frames(directory, start, stop):
+    directory.mkdir(exist_ok=True)
+    for i in range(start, stop):
+        rng = np.random.default_rng(i)
+        iio.imwrite(str(directory / f"f{i:02d}.png"),
+                    (rng.random((12, 10)) * 200).astype(np.uint8))
+    return FileLoader.list_image_paths(str(directory))
+
+
+def test_update_only_stacks_new_frames(tmp_path):
+    out = str(tmp_path / "stack.fits")
+    paths = add_frames(tmp_path / "in", 0, 4)
+    acc, new, reason = IncrementalStacker(out).update(paths)
+    assert len(new) == 4 and reason == "no saved state"
+
+    paths = add_frames(tmp_path / "in", 4, 6)
+    acc, new, reason = IncrementalStacker(out).update(paths)
+    assert [os.path.basename(p) for p in new] == ["f04.png", "f05.png"]
+    assert reason is None and acc.count.max() == 6
+    full = StreamingAverageStrategy().combine(iio.imread(p) for p in paths)
+    assert np.allclose(acc.finalize(), full, atol=1e-4)
+
+    _, manifest_path = state_paths(out)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    assert len(manifest["frames"]) == 6
+    assert all(len(e["sha1"]) == 40 for e in manifest["frames"].values())
+    _, new, _ = IncrementalStacker(out).update(paths)
+    assert new == []
+
+
+def test_modified_frame_or_new_settings_restart_the_stack(tmp_path):
+    out = str(tmp_path / "stack.fits")
+    paths = add_frames(tmp_path / "in", 0, 3)
+    IncrementalStacker(out).update(paths)
+
+    # Same content, new mtime: still reused
+    os.utime(paths[0], ns=(0, 0))
+    _, new, reason = IncrementalStacker(out).update(paths)
+    assert new == [] and reason is None
+
+    iio.imwrite(paths[1], np.zeros((12, 10), np.uint8))
+    acc, new, reason = IncrementalStacker(out).update(paths)
+    assert len(new) == 3 and "modified" in reason and acc.count.max() == 3
+
+    _, new, reason = IncrementalStacker(out, settings={"sigma": 2}).update(paths)
+    assert len(new) == 3 and reason == "settings changed"
+
+
+def test_append_pipeline_matches_full_restack(tmp_path):
+    src = tmp_path / "in"
+    add_frames(src, 0, 3)
+    out, full = str(tmp_path / "live.fits"), str(tmp_path / "full.fits")
+    run_pipeline(str(src), out, align=True, append=True)
+    add_frames(src, 3, 5)
+    run_pipeline(str(src), out, align=True, append=True)
+    run_pipeline(str(src), full, align=True, stream=True)
+    assert np.array_equal(FileLoader.load_image(out), FileLoader.load_image(full))
+
+
+def test_append_rejects_unsupported_methods(tmp_path):
+    with pytest.raises(ValueError):
+        IncrementalStacker(str(tmp_path / "x.fits"), method="median")
+
+
+def test_appended_frame_is_clipped_against_the_saved_stack(tmp_path):
+    src = tmp_path / "in"
+    src.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(11):
+        frame = rng.normal(100, 5, (12, 10))
+        if i == 10:
+            frame[6] = 50000  # satellite trail in the appended frame
+        iio.imwrite(str(src / f"f{i:02d}.png"), frame.astype(np.uint16))
+    paths = FileLoader.list_image_paths(str(src))
+    out = str(tmp_path / "stack.fits")
+    saved, _, _ = IncrementalStacker(out, method="sigma").update(paths[:10])
+    before = saved.count.copy()
+    acc, new, _ = IncrementalStacker(out, method="sigma").update(paths)
+    assert len(new) == 1
+    # The trail is rejected, the rest of the new frame is stacked
+    assert np.array_equal(acc.count[6], before[6]) and acc.finalize()[6].max() < 120
+    assert (acc.count[:6] - before[:6]).mean() > 0.9
@@ -0,0 +1,61 @@
+import imageio.v3 as iio
+import numpy as np
+
+import stacking.masters as masters_mod
+from cli import main
+from osiris_io.file_loader import FileLoader
+from stacking.masters import MasterFrameBuilder
+
+
+def write_set(directory, values):
+    directory.mkdir()
+    for i, value in enumerate(values):
+        iio.imwrite(str(directory / f"f{i}.png"),
+                    np.full((6, 6), value, dtype=np.uint8))
+    return str(directory)
+
+
+def test_master_bias_rejects_outlier_and_is_cached(tmp_path, monkeypatch):
+    bias_dir = write_set(tmp_path / "bias", [10, 10, 11, 10, 200, 10, 11, 10])
+    builder = MasterFrameBuilder(cache_dir=str(tmp_path / "cache"))
+    master = builder.build("bias", bias_dir)
+    assert master.dtype == np.float32
+    assert np.allclose(master, 10 + 2 / 7)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached master should not be restacked")
+
+    monkeypatch.setattr(masters_mod.StreamingSigmaClipStrategy, "combine", fail)
+    assert np.array_equal(builder.build("bias", bias_dir), master)
+
+
+def test_dark_and_flat_are_bias_corrected(tmp_path):
+    bias_dir = write_set(tmp_path / "bias", [5, 5, 5])
+    dark_dir = write_set(tmp_path / "dark", [8, 8, 8])
+    flat_dir = write_set(tmp_path / "flat", [105, 105, 105])
+    builder = MasterFrameBuilder(cache_dir=str(tmp_path / "cache"), method="median")
+    masters = builder.build_all(bias=bias_dir, dark=dark_dir, flat=flat_dir)
+    assert np.allclose(masters["dark"], 3)
+    assert np.allclose(masters["flat"], 1)
+
+
+def test_masters_subcommand_writes_fits(tmp_path):
+    bias_dir = write_set(tmp_path / "bias", [4, 4, 4])
+    out = tmp_path / "out"
+    main(["masters", "--bias", bias_dir, "--out", str(out),
+          "--masters-cache", str(tmp_path / "cache")])
+    assert (out / "master_bias.fits").exists()
+
+
+def test_median_master_decodes_each_png_once(tmp_path, monkeypatch):
+    dark_dir = write_set(tmp_path / "dark", [8, 9, 8, 50, 8])
+    decoded = []
+    load_image = FileLoader.load_image
+    monkeypatch.setattr(FileLoader, "load_image", staticmethod(
+        lambda path, **kw: decoded.append(path) or load_image(path, **kw)
+    ))
+    builder = MasterFrameBuilder(cache_dir=str(tmp_path / "cache"), method="median")
+    monkeypatch.setattr(masters_mod.TiledCombineEngine, "rows_per_tile",
+                        lambda self, n, shape: 1)
+    assert np.allclose(builder.build("dark", dark_dir), 8)
+    assert len(decoded) == 5
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from stacking.combine import stack_images
+from stacking.median import HistogramMedianStrategy, nanmedian_block
+
+
+@pytest.mark.parametrize("dtype,low,high", [
+    (np.uint8, 0, 256), (np.uint16, 0, 65536), (np.int16, -500, 500),
+])
+@pytest.mark.parametrize("n_frames", [1, 4, 7])
+def test_histogram_median_is_exact(dtype, low, high, n_frames):
+    rng = np.random.default_rng(n_frames)
+    frames = [rng.integers(low, high, (5, 6, 3)).astype(dtype) for _ in range(n_frames)]
+    if n_frames > 2:
+        frames[1] = frames[0].copy()  # duplicated samples around the median
+    res = HistogramMedianStrategy().combine(lambda: iter(frames))
+    expected = np.median(np.stack(frames).astype(np.float64), axis=0)
+    assert np.array_equal(res, expected.astype(np.float32))
+
+
+def test_histogram_median_rejects_float_frames():
+    with pytest.raises(ValueError):
+        HistogramMedianStrategy().combine([np.zeros((2, 2), dtype=np.float32)])
+
+
+def test_nanmedian_block_matches_numpy():
+    rng = np.random.default_rng(0)
+    block = rng.normal(size=(6, 8, 8)).astype(np.float32)
+    assert np.allclose(nanmedian_block(block), np.median(block, axis=0))
+    block[2, :3] = np.nan
+    block[:, 0, 0] = np.nan
+    assert np.allclose(
+        nanmedian_block(block), np.nanmedian(block, axis=0), equal_nan=True
+    )
+
+
+def test_stack_images_median_in_tiles():
+    frames = [np.full((4, 4), v, dtype=np.float32) for v in (1, 2, 100)]
+    frames[2][0, 0] = np.nan
+    res = stack_images(frames, method="median", memory_limit_mb=0.0001)
+    assert res[0, 0] == 1.5
+    assert np.allclose(res[1:], 2)
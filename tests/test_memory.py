@@ -15,3 +15,9 @@ def test_check_memory_limit_true():
 def test_check_memory_limit_false():
     # Should be False for a very low limit
     assert not MemoryManager.check_memory_limit(0.00001)
+
+
+def test_get_available_memory_mb():
+    available = MemoryManager.get_available_memory_mb()
+    assert isinstance(available, float)
+    assert available > 0
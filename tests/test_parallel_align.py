@@ -0,0 +1,30 @@
+import numpy as np
+
+from stacking.align import align_images
+
+
+def test_parallel_alignment_matches_serial():
+    ref = np.zeros((24, 24))
+    ref[12, 12] = 1.0
+    shifts = [(2, -3), (-1, 4)]
+    imgs = [ref] + [np.roll(ref, shift, axis=(0, 1)) for shift in shifts]
+
+    serial = align_images(imgs, jobs=1)
+    parallel = align_images(imgs, jobs=2)
+    assert len(parallel) == len(imgs)
+    for a, b in zip(serial, parallel):
+        assert np.allclose(a, b)
+
+
+def test_parallel_alignment_hands_out_views_of_one_released_block():
+    import os
+
+    rng = np.random.default_rng(0)
+    imgs = [rng.random((16, 16)).astype(np.float32) for _ in range(3)]
+    before = set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+    aligned = align_images(imgs, jobs=2)
+    # No per-frame copies: every frame is a view into the shared block
+    assert all(a.base is not None for a in aligned)
+    assert np.shares_memory(aligned[0].base, aligned[1].base)
+    if os.path.isdir("/dev/shm"):
+        assert set(os.listdir("/dev/shm")) == before
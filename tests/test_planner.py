@@ -0,0 +1,115 @@
+import imageio.v3 as iio
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from cli import run_pipeline
+from osiris_io.file_loader import FileLoader, FrameHandle
+from stacking.planner import ExecutionPlanner
+
+
+def write_pngs(directory, n=12, shape=(64, 80)):
+    directory.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        iio.imwrite(str(directory / f"f{i:02d}.png"),
+                    (rng.random(shape) * 60000).astype(np.uint16))
+    return FileLoader.list_image_paths(str(directory))
+
+
+@pytest.mark.parametrize("name, data", [
+    ("a.png", np.zeros((5, 7, 3), np.uint8)),
+    ("b.png", np.zeros((5, 7), np.uint16)),
+    ("c.tif", np.zeros((5, 7), np.float32)),
+])
+def test_frame_info_matches_decoded_frame(tmp_path, name, data):
+    path = str(tmp_path / name)
+    iio.imwrite(path, data)
+    img = FileLoader.load_image(path)
+    assert FrameHandle(path).info() == (img.shape, img.dtype)
+
+
+def test_frame_info_reads_fits_headers(tmp_path):
+    path = str(tmp_path / "f.fits")
+    fits.PrimaryHDU(np.zeros((6, 9), np.uint16)).writeto(path)
+    assert FrameHandle(path).info() == ((6, 9), np.dtype(np.uint16))
+
+
+def test_plan_prefers_memory_then_falls_back_to_stream(tmp_path):
+    paths = write_pngs(tmp_path / "in")
+    roomy = ExecutionPlanner(memory_limit_mb=512).plan(paths, method="average")
+    assert roomy.mode == "memory" and roomy.options() == {}
+    assert roomy.frame_shape == (64, 80) and roomy.frame_dtype == "uint16"
+
+    # Twelve frames exceed the budget; one frame in flight does not
+    tight = ExecutionPlanner(memory_limit_mb=0.2).plan(paths, method="average")
+    assert tight.mode == "stream" and tight.options() == {"stream": True}
+    assert tight.estimates_mb["stream"] <= 0.2 < tight.estimates_mb["memory"]
+
+
+def test_plan_uses_tiled_fits_and_sizes_tiles(tmp_path):
+    paths = []
+    for i in range(20):
+        path = str(tmp_path / f"f{i}.fits")
+        fits.PrimaryHDU(np.full((128, 128), i, np.float32)).writeto(path)
+        paths.append(path)
+    plan = ExecutionPlanner(memory_limit_mb=0.5).plan(paths, method="sigma")
+    assert plan.mode == "tiled" and plan.options()["use_memmap"] is True
+    assert 1 <= plan.rows_per_tile < 128
+    # The streaming sigma clip uses another estimator than ClipKernel
+    assert "stream" not in ExecutionPlanner.eligible(
+        "sigma", paths, np.dtype(np.float32)
+    )
+
+
+def test_planner_only_switches_between_equivalent_modes(tmp_path):
+    paths = write_pngs(tmp_path / "in", n=6)
+    uint16 = np.dtype(np.uint16)
+    # Aligned frames: zero-filled borders in memory, NaN ones when streamed
+    plan = ExecutionPlanner(memory_limit_mb=0.01).plan(paths, align=True)
+    assert plan.mode == "memory" and plan.reason.startswith("no equivalent")
+    assert "stream" in ExecutionPlanner.eligible("average", paths, uint16)
+    assert ExecutionPlanner.eligible("average", paths, uint16, calibrated=True,
+                                     precision="float16") == ["memory"]
+
+    outputs = []
+    for limit in (512, 0.01):
+        out = str(tmp_path / f"out_{limit}.fits")
+        run_pipeline(str(tmp_path / "in"), out, method="sigma", align=True,
+                     align_downsample=1, memory_limit_mb=limit)
+        outputs.append(FileLoader.load_image(out))
+    assert np.array_equal(*outputs)
+
+
+def test_streaming_median_needs_raw_integer_frames():
+    paths = ["a.png", "b.png"]
+    assert "stream" in ExecutionPlanner.eligible("median", paths, np.dtype(np.uint16))
+    assert "stream" not in ExecutionPlanner.eligible(
+        "median", paths, np.dtype(np.float32)
+    )
+    for flag in ("align", "calibrated", "library"):
+        assert "stream" not in ExecutionPlanner.eligible(
+            "median", paths, np.dtype(np.uint16), **{flag: True}
+        )
+
+
+def test_planned_stream_run_matches_in_memory_run(tmp_path):
+    paths = write_pngs(tmp_path / "in")
+    assert ExecutionPlanner(memory_limit_mb=0.2).plan(paths).mode == "stream"
+    a, b = str(tmp_path / "a.fits"), str(tmp_path / "b.fits")
+    run_pipeline(str(tmp_path / "in"), a, method="average", plan=False)
+    run_pipeline(str(tmp_path / "in"), b, method="average", memory_limit_mb=0.2)
+    assert np.array_equal(FileLoader.load_image(a), FileLoader.load_image(b))
+
+
+def test_parallel_alignment_raises_the_memory_estimate():
+    planner = ExecutionPlanner()
+    args = ("average", 10, (100, 100), np.dtype(np.uint16))
+    # float32 output is views of the shared block: no more than serial
+    assert (planner.estimates(*args, align=True, jobs=4)["memory"]
+            == planner.estimates(*args, align=True)["memory"])
+    # Compact output is copied out of the float32 block
+    serial = planner.estimates(*args, align=True, precision="uint16")["memory"]
+    parallel = planner.estimates(*args, align=True, precision="uint16", jobs=4)
+    assert parallel["memory"] > serial
+    assert planner.estimates(*args, jobs=4) == planner.estimates(*args)
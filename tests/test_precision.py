@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from stacking.align import align_images
+from stacking.combine import stack_images
+from stacking.precision import UINT16_SENTINEL, FrameCodec
+
+
+def test_uint16_codec_keeps_nan_and_8bit_fractions():
+    raw = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    codec = FrameCodec.for_sample("uint16", raw)
+    frame = raw.astype(np.float32) + 0.25
+    frame[0, 0] = np.nan
+    stored = codec.encode(frame)
+    assert stored.dtype == np.uint16 and stored[0, 0] == UINT16_SENTINEL
+    decoded = codec.decode(stored)
+    assert np.isnan(decoded[0, 0])
+    assert np.allclose(decoded[1:], frame[1:])
+    # Native integer frames are not re-encoded and decode with a cast
+    assert np.array_equal(codec.decode(raw), raw.astype(np.float32))
+
+
+def test_uint16_codec_maps_calibrated_float_range():
+    frame = np.random.default_rng(0).normal(0, 40, (8, 8)).astype(np.float32)
+    codec = FrameCodec.for_sample("uint16", np.round(frame))
+    assert np.array_equal(codec.decode(codec.encode(np.round(frame))), np.round(frame))
+    assert np.abs(codec.decode(codec.encode(frame)) - frame).max() < 1 / codec.scale
+
+
+@pytest.mark.parametrize("precision", ["float16", "uint16"])
+def test_compact_frames_stack_like_float32(precision):
+    rng = np.random.default_rng(1)
+    frames = [rng.integers(0, 200, (16, 16)).astype(np.uint8) for _ in range(5)]
+    codec = FrameCodec.for_sample(precision, frames[0])
+    aligned = align_images(frames, codec=codec)
+    assert all(a.dtype == codec.dtype for a in aligned)
+    reference = stack_images(align_images(frames), method="sigma")
+    for use_memmap in (False, True):
+        res = stack_images(aligned, method="sigma", codec=codec, use_memmap=use_memmap)
+        assert np.allclose(res, reference, atol=0.05)
+
+
+@pytest.mark.parametrize("align", [False, True])
+def test_saturated_uint16_samples_are_not_missing(align):
+    frames = [np.full((16, 16), 1000, np.uint16) for _ in range(3)]
+    for f in frames:
+        f[8, 8] = 65535
+    codec = FrameCodec.for_sample("uint16", frames[0])
+    stored = [codec.store(f) for f in frames]
+    assert all(s[8, 8] == 65534 for s in stored)
+    if align:
+        stored = align_images(stored, codec=codec)
+    res = stack_images(stored, method="average", codec=codec)
+    assert res[8, 8] == 65534
+
+
+def test_float16_clips_out_of_range_values_and_counts_them():
+    rng = np.random.default_rng(2)
+    frames = [rng.random((16, 16)).astype(np.float32) * 1000 for _ in range(3)]
+    for f in frames:
+        f[4, 4] = 70000
+    codec = FrameCodec.for_sample("float16", frames[0])
+    stored = [codec.store(f) for f in frames]
+    assert codec.clipped == 3 and all(np.isfinite(s).all() for s in stored)
+    aligned = align_images(stored, codec=codec)
+    assert np.isfinite(stack_images(aligned, codec=codec)).all()
+
+
+def test_uint16_codec_counts_samples_outside_its_window():
+    codec = FrameCodec.for_sample("uint16", np.array([[0.0, 100.0]], np.float32))
+    codec.encode(np.array([[50.0, 1e6]], np.float32))
+    assert codec.clipped == 1
@@ -0,0 +1,41 @@
+import threading
+import time
+
+import imageio.v3 as iio
+import numpy as np
+
+from osiris_io.file_loader import FileLoader, FrameHandle
+
+
+def make_frames(tmp_path, n=6):
+    for i in range(n):
+        iio.imwrite(str(tmp_path / f"f{i}.png"), np.full((4, 4), i, dtype=np.uint8))
+    return str(tmp_path)
+
+
+def test_list_frames_is_lazy(tmp_path):
+    handles = FileLoader.list_frames(make_frames(tmp_path))
+    assert all(isinstance(h, FrameHandle) for h in handles)
+    assert handles[2].load()[0, 0] == 2
+
+
+def test_prefetch_preserves_order_and_bounds_queue(tmp_path, monkeypatch):
+    directory = make_frames(tmp_path)
+    original = FileLoader.load_image
+    started = []
+    lock = threading.Lock()
+
+    def slow_load(path, return_header=False):
+        with lock:
+            started.append(path)
+        time.sleep(0.01)
+        return original(path, return_header=return_header)
+
+    monkeypatch.setattr(FileLoader, "load_image", staticmethod(slow_load))
+    frames = FileLoader.iter_prefetched(directory, workers=3, prefetch=2)
+    first = next(frames)
+    assert first[0, 0] == 0
+    # only the prefetch window (plus its refill) may have been requested
+    assert len(started) <= 3
+    rest = list(frames)
+    assert [f[0, 0] for f in rest] == [1, 2, 3, 4, 5]
@@ -1,10 +1,11 @@
 import os
 import numpy as np
 import imageio.v3 as iio
+import stacking
 from cli import run_pipeline
 
 
-def test_preprocess_applied(tmp_path):
+def test_preprocess_applied(tmp_path, monkeypatch):
     # create input images with known offset
     input_dir = tmp_path / "in"
     input_dir.mkdir()
@@ -27,6 +28,13 @@ def test_preprocess_applied(tmp_path):
 
     output_path = str(tmp_path / "out_default.png")
 
+    stacked = []
+    normalize = stacking.normalize_image
+    monkeypatch.setattr(
+        stacking, "normalize_image",
+        lambda image, **kw: stacked.append(image) or normalize(image, **kw),
+    )
+
     res = run_pipeline(
         str(input_dir),
         output_path,
@@ -41,5 +49,7 @@ def test_preprocess_applied(tmp_path):
     assert os.path.exists(res)
     out = iio.imread(res)
     # each input pixel: 10 - bias(1) - dark(2) = 7; average stays 7
-    assert out.mean() == 7
+    assert stacked[0].mean() == 7
+    # a constant stack stretches to black
+    assert not out.any()
 
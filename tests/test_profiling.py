@@ -0,0 +1,59 @@
+import json
+
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from cli import run_pipeline
+from utils.profiling import StageProfiler
+
+
+def test_stage_records_time_memory_and_throughput():
+    profiler = StageProfiler(sample_interval=0.001)
+    with profiler.stage("work") as stage:
+        block = np.ones((512, 512, 8))
+        block.sum()
+        stage.add_frames(4)
+        stage.add_bytes(2048)
+    (record,) = profiler.stages
+    assert record.wall_s > 0 and record.cpu_s >= 0
+    assert record.peak_rss_mb >= record.rss_start_mb > 0
+    data = record.as_dict()
+    assert data["frames"] == 4 and data["frames_per_s"] > 0
+    assert data["bytes_read"] == 2048
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = StageProfiler(enabled=False, capture="cprofile")
+    with profiler.stage("work") as stage:
+        stage.add_frames()
+    assert profiler.stages == [] and profiler.capture is None
+
+
+def test_unknown_capture():
+    with pytest.raises(ValueError):
+        StageProfiler(capture="perf")
+
+
+@pytest.mark.parametrize("capture", [None, "cprofile", "tracemalloc"])
+def test_pipeline_writes_profile_report(tmp_path, capture):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        img = (rng.random((16, 16)) * 200).astype(np.uint8)
+        iio.imwrite(str(input_dir / f"img_{i}.png"), img)
+    report = tmp_path / "profile.json"
+    run_pipeline(str(input_dir), str(tmp_path / "out.png"), align=True,
+                 profile_report=str(report), profile_capture=capture)
+
+    data = json.loads(report.read_text())
+    names = [s["name"] for s in data["stages"]]
+    assert names == ["calibration", "load", "align", "stack", "postprocess", "write"]
+    load = data["stages"][1]
+    assert load["frames"] == 3 and load["frames_per_s"] > 0
+    assert data["total"]["wall_s"] >= sum(s["wall_s"] for s in data["stages"]) * 0.99
+    if capture == "cprofile":
+        assert data["cprofile"] and (tmp_path / "profile.prof").exists()
+    if capture == "tracemalloc":
+        assert data["tracemalloc"] and "traced_peak_mb" in load
@@ -0,0 +1,38 @@
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from stacking.combine import stack_images
+from stacking.quality import grade_frames, measure_frame, write_quality_report
+
+
+def star_frame(sigma_psf, amplitude=50.0, seed=0, shape=(80, 80)):
+    rng = np.random.default_rng(seed)
+    stars = np.zeros(shape, dtype=np.float32)
+    pos = rng.integers(8, shape[0] - 8, size=(2, 25))
+    stars[tuple(pos)] = amplitude * 2 * np.pi * sigma_psf ** 2
+    img = gaussian_filter(stars, sigma_psf) + 10
+    return img + rng.normal(0, 0.5, shape).astype(np.float32)
+
+
+def test_measure_frame_reports_fwhm_and_stars():
+    sharp = measure_frame(star_frame(1.0))
+    blurred = measure_frame(star_frame(2.0, seed=1))
+    assert sharp.star_count > 10
+    assert abs(sharp.background - 10) < 1
+    assert sharp.fwhm < blurred.fwhm
+
+
+def test_grading_rejects_worst_and_writes_report(tmp_path):
+    frames = [star_frame(1.0, seed=i) for i in range(4)] + [star_frame(3.0, 5, seed=9)]
+    qualities = [measure_frame(f, index=i) for i, f in enumerate(frames)]
+    grade_frames(qualities, reject_fraction=0.2)
+    assert qualities[4].rejected and qualities[4].weight == 0
+    report = tmp_path / "q.csv"
+    write_quality_report(str(report), qualities)
+    assert report.read_text().splitlines()[0].startswith("index,path,fwhm")
+
+
+def test_weighted_stack_ignores_zero_weight_frames():
+    imgs = [np.full((3, 3), 1.0), np.full((3, 3), 3.0), np.full((3, 3), 100.0)]
+    res = stack_images(imgs, method="weighted", weights=[1.0, 3.0, 0.0])
+    assert np.allclose(res, 2.5)
@@ -0,0 +1,74 @@
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from stacking.accumulator import WelfordAccumulator
+from stacking.combine import StreamingAverageStrategy, StreamingSigmaClipStrategy
+from stacking.sharded import ShardedStacker, merge_partials
+
+
+def write_frames(tmp_path, n=6):
+    rng = np.random.default_rng(1)
+    paths = []
+    for i in range(n):
+        path = tmp_path / f"f{i}.png"
+        iio.imwrite(path, (rng.random((12, 10)) * 200).astype(np.uint8))
+        paths.append(str(path))
+    return paths
+
+
+def test_sharded_average_matches_single_pass(tmp_path):
+    paths = write_frames(tmp_path)
+    stacker = ShardedStacker(method="average", workers=3)
+    merged = stacker.stack(paths)
+    single = StreamingAverageStrategy().combine(iio.imread(p) for p in paths)
+    assert np.allclose(merged.finalize(), single, atol=1e-4)
+    assert merged.count.max() == len(paths)
+
+
+def test_partials_merge_offline_and_reject_duplicates(tmp_path):
+    paths = write_frames(tmp_path)
+    a = ShardedStacker(workers=1, shard_dir=str(tmp_path / "a")).run(paths[:4])
+    b = ShardedStacker(workers=1, shard_dir=str(tmp_path / "b")).run(paths[4:])
+    merged, meta = merge_partials(a + b)
+    assert len(meta["frames"]) == len(paths)
+    acc, _ = WelfordAccumulator.load(a[0])
+    assert acc.count.max() == 4
+    with pytest.raises(ValueError):
+        merge_partials(a + a)
+
+
+def test_shards_are_contiguous_and_even():
+    stacker = ShardedStacker(workers=3)
+    assert stacker.shards(list(range(7))) == [[0, 1], [2, 3], [4, 5, 6]]
+    assert stacker.shards(list(range(2))) == [[0], [1]]
+
+
+def test_failed_shard_removes_temporary_partials(tmp_path, monkeypatch):
+    paths = write_frames(tmp_path)
+    paths[-1] = str(tmp_path / "missing.png")
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(scratch))
+    with pytest.raises(Exception):
+        ShardedStacker(method="average", workers=3).stack(paths)
+    with pytest.raises(Exception):
+        ShardedStacker(method="average", workers=3).run(paths)
+    assert list(scratch.iterdir()) == []
+
+
+def test_sharded_sigma_clips_against_the_whole_stack(tmp_path):
+    rng = np.random.default_rng(2)
+    frames = [rng.normal(100, 5, (12, 10)).astype(np.uint8) for _ in range(6)]
+    frames[3][4] = 250  # satellite trail
+    paths = []
+    for i, frame in enumerate(frames):
+        paths.append(str(tmp_path / f"f{i}.png"))
+        iio.imwrite(paths[-1], frame)
+    single = StreamingSigmaClipStrategy().accumulate(frames)
+    for workers in (2, 6):
+        merged = ShardedStacker(method="sigma", workers=workers).stack(paths)
+        # One frame per shard still has its trail rejected
+        assert np.array_equal(merged.count, single.count)
+        assert merged.count[4].max() == 5
+        assert np.allclose(merged.finalize(), single.finalize(), atol=1e-6)
@@ -3,10 +3,11 @@ import os
 import imageio.v3 as iio
 import numpy as np
 
+import stacking
 from cli import run_pipeline
 
 
-def test_streaming_average_pipeline(tmp_path):
+def test_streaming_average_pipeline(tmp_path, monkeypatch):
     input_dir = tmp_path / "in"
     input_dir.mkdir()
     for i in range(5):
@@ -16,6 +17,13 @@ def test_streaming_average_pipeline(tmp_path):
 
     output_path = str(tmp_path / "out_stream.png")
 
+    stacked = []
+    normalize = stacking.normalize_image
+    monkeypatch.setattr(
+        stacking, "normalize_image",
+        lambda image, **kw: stacked.append(image) or normalize(image, **kw),
+    )
+
     res = run_pipeline(
         str(input_dir),
         output_path,
@@ -29,4 +37,6 @@ def test_streaming_average_pipeline(tmp_path):
     assert os.path.exists(res)
     out = iio.imread(res)
     assert out.shape == (8, 8)
-    assert out.mean() == 20
+    assert stacked[0].mean() == 20
+    # a constant stack stretches to black
+    assert not out.any()
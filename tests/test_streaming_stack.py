@@ -0,0 +1,23 @@
+import numpy as np
+
+from stacking.align import iter_aligned
+from stacking.combine import StreamingAverageStrategy
+
+
+def test_streaming_average_ignores_nan():
+    a = np.ones((4, 4), dtype=np.float32) * 2
+    b = np.ones((4, 4), dtype=np.float32) * 4
+    b[0, 0] = np.nan
+    res = StreamingAverageStrategy().combine(iter([a, b]))
+    assert res[0, 0] == 2
+    assert np.allclose(res[1:, 1:], 3)
+
+
+def test_iter_aligned_uses_first_frame_as_reference():
+    ref = np.zeros((20, 20))
+    ref[10, 10] = 1.0
+    moved = np.roll(np.roll(ref, 2, axis=0), -3, axis=1)
+    out = list(iter_aligned(iter([ref, moved])))
+    maxpos = np.unravel_index(np.nanargmax(out[1]), out[1].shape)
+    assert abs(maxpos[0] - 10) <= 1
+    assert abs(maxpos[1] - 10) <= 1
@@ -0,0 +1,21 @@
+import numpy as np
+
+from stacking.combine import stack_images
+from stacking.tiled import TiledCombineEngine
+
+
+def test_memmap_median_matches_in_memory():
+    rng = np.random.default_rng(0)
+    imgs = [rng.random((12, 9, 3)).astype(np.float32) for _ in range(7)]
+    res = stack_images(imgs, method="median", use_memmap=True)
+    assert np.allclose(res, np.median(np.stack(imgs), axis=0))
+
+
+def test_tiled_sigma_rejects_outlier_across_strips():
+    base = np.ones((10, 8), dtype=np.float32) * 10
+    imgs = [base.copy() for _ in range(9)]
+    imgs[3] = base * 1000
+    # A tiny budget forces one-row strips
+    engine = TiledCombineEngine(method="sigma", memory_limit_mb=1e-6)
+    assert engine.rows_per_tile(len(imgs), base.shape) == 1
+    assert np.allclose(engine.combine(imgs), 10)
@@ -0,0 +1,47 @@
+import imageio.v3 as iio
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from stacking.align import PhaseCorrelationAlignStrategy, align_images
+from stacking.cache import TransformCache
+
+
+def write_frames(tmp_path, n=3):
+    rng = np.random.default_rng(7)
+    base = np.zeros((40, 40), dtype=np.float32)
+    base[tuple(rng.integers(5, 35, size=(2, 20)))] = 1.0
+    base = gaussian_filter(base, 1.2)
+    paths = []
+    for i in range(n):
+        path = tmp_path / f"f{i}.png"
+        frame = np.roll(base, (i, -i), axis=(0, 1)) / base.max() * 255
+        iio.imwrite(str(path), frame.astype(np.uint8))
+        paths.append(str(path))
+    return paths
+
+
+def test_warm_cache_skips_registration(tmp_path, monkeypatch):
+    paths = write_frames(tmp_path)
+    imgs = [iio.imread(p) for p in paths]
+    index = str(tmp_path / "transforms.json")
+
+    cold_cache = TransformCache(index)
+    cold = align_images(imgs, paths=paths, transform_cache=cold_cache)
+    assert cold_cache.misses == len(paths)
+
+    def no_estimate(*args, **kwargs):
+        raise AssertionError("registration should come from the cache")
+
+    monkeypatch.setattr(PhaseCorrelationAlignStrategy, "estimate", no_estimate)
+    warm_cache = TransformCache(index)
+    warm = align_images(imgs, paths=paths, transform_cache=warm_cache)
+    assert warm_cache.hits == len(paths)
+    for a, b in zip(cold, warm):
+        assert np.array_equal(a, b)
+
+
+def test_cache_key_depends_on_reference(tmp_path):
+    paths = write_frames(tmp_path)
+    cache = TransformCache()
+    key = cache.key(paths[1], paths[0], "phase")
+    assert key != cache.key(paths[1], paths[2], "phase")
@@ -0,0 +1,96 @@
+import os
+
+import imageio.v3 as iio
+import numpy as np
+import pytest
+
+from cli import main
+from osiris_io.file_loader import FileLoader
+from osiris_io.watcher import DirectoryWatcher
+from stacking.combine import StreamingAverageStrategy
+from stacking.live import LivePreview, LiveStacker
+
+
+def write_frame(directory, name, seed):
+    rng = np.random.default_rng(seed)
+    path = str(directory / name)
+    iio.imwrite(path, (rng.random((16, 12)) * 200).astype(np.uint8))
+    return path
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watcher_reports_each_complete_frame_once(tmp_path, use_inotify):
+    old = write_frame(tmp_path, "old.png", 0)
+    with DirectoryWatcher(str(tmp_path), poll_interval=0.05,
+                          use_inotify=use_inotify) as watcher:
+        assert watcher.existing() == [old]
+        assert watcher.poll(0.1) == []
+        # Partial writes go to a hidden file and are renamed when done
+        partial = write_frame(tmp_path, ".new.png.part", 1)
+        new = str(tmp_path / "new.png")
+        os.rename(partial, new)
+        (tmp_path / "notes.txt").write_text("x")
+        found = []
+        for _ in range(10):
+            found += watcher.poll(0.2)
+            if found:
+                break
+        assert found + watcher.poll(0.15) == [new]
+
+
+def test_live_stacker_matches_streaming_average(tmp_path):
+    frames = [iio.imread(write_frame(tmp_path, f"f{i}.png", i)) for i in range(4)]
+    stacker = LiveStacker()
+    assert stacker.snapshot() is None
+    for img in frames:
+        assert stacker.add(img) >= 0
+    expected = StreamingAverageStrategy().combine(iter(frames))
+    assert stacker.frames == 4
+    assert np.allclose(stacker.snapshot(), expected, atol=1e-4)
+
+    preview = LivePreview(stacker, str(tmp_path / "preview.png"))
+    assert preview.update(wait=True)
+    assert not preview.update(wait=True)
+    assert preview.written == 1 and (tmp_path / "preview.png").exists()
+
+
+def test_watch_command_stacks_existing_frames_and_stops_when_idle(tmp_path):
+    src = tmp_path / "in"
+    src.mkdir()
+    for i in range(3):
+        write_frame(src, f"f{i}.png", i)
+    out = str(tmp_path / "live.png")
+    stacker = main(["watch", "-i", str(src), "-o", out, "--align",
+                    "--align-downsample", "1", "--polling", "--poll-interval", "0.05",
+                    "--idle-timeout", "0.2"])
+    assert stacker.frames == 3
+    assert FileLoader.load_image(out).shape == (16, 12)
+
+    stacker = main(["watch", "-i", str(src), "-o", out, "--max-frames", "2"])
+    assert stacker.frames == 2
+
+
+def test_watch_retries_a_failed_frame_once_and_keeps_previewing(tmp_path, monkeypatch):
+    src = tmp_path / "in"
+    src.mkdir()
+    for i in range(3):
+        write_frame(src, f"f{i}.png", i)
+    attempts = {}
+    load_image = FileLoader.load_image
+
+    def flaky(path, **kwargs):
+        name = os.path.basename(path)
+        attempts[name] = attempts.get(name, 0) + 1
+        # f1 is still being written on the first try; f2 never loads
+        if name == "f2.png" or (name == "f1.png" and attempts[name] == 1):
+            raise OSError("truncated file")
+        return load_image(path, **kwargs)
+
+    monkeypatch.setattr(FileLoader, "load_image", staticmethod(flaky))
+    out = str(tmp_path / "live.png")
+    stacker = main(["watch", "-i", str(src), "-o", out, "--polling",
+                    "--poll-interval", "0.05", "--retry-delay", "0.1",
+                    "--preview-interval", "0", "--idle-timeout", "0.3"])
+    assert stacker.frames == 2
+    assert attempts == {"f0.png": 1, "f1.png": 2, "f2.png": 2}
+    assert (tmp_path / "live.png").exists()
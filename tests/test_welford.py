@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from stacking.accumulator import WelfordAccumulator
+from stacking.combine import stack_images
+
+
+def frames(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    out = [rng.normal(1000, 5, (6, 7)).astype(np.float32) for _ in range(n)]
+    out[3][0, 0] = np.nan
+    return out
+
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_welford_matches_numpy(precision):
+    data = frames()
+    acc = WelfordAccumulator(precision)
+    for f in data:
+        acc.add(f)
+    cube = np.stack(data)
+    assert np.allclose(acc.finalize(), np.nanmean(cube, axis=0), atol=1e-3)
+    assert np.allclose(acc.variance(), np.nanvar(cube, axis=0, ddof=1), rtol=1e-3)
+    assert acc.count[0, 0] == len(data) - 1
+
+
+def test_merged_partials_equal_single_pass():
+    data = frames()
+    whole, left, right = (WelfordAccumulator() for _ in range(3))
+    for f in data:
+        whole.add(f)
+    for f in data[:17]:
+        left.add(f)
+    for f in data[17:]:
+        right.add(f)
+    left.merge(right)
+    assert np.allclose(left.finalize(), whole.finalize())
+    assert np.allclose(left.variance(), whole.variance())
+
+
+def test_float32_merge_keeps_compensated_precision():
+    # A large offset leaves float32 state with a coarse ulp (~0.002 at 3e4)
+    data = [f + np.float32(3e4) for f in frames(400, seed=1)]
+    whole = WelfordAccumulator("float64")
+    parts = [WelfordAccumulator("float32") for _ in range(4)]
+    for i, f in enumerate(data):
+        whole.add(f)
+        parts[i % 4].add(f)
+    merged = WelfordAccumulator("float32")
+    for part in parts:
+        merged.merge(part)
+    assert np.abs(merged.finalize() - whole.finalize()).max() < 1e-3
+    assert np.allclose(merged.variance(), whole.variance(), rtol=1e-4)
+
+
+def test_noise_map_and_empty_pixels():
+    a = np.array([[1.0, np.nan]], dtype=np.float32)
+    b = np.array([[3.0, np.nan]], dtype=np.float32)
+    acc = WelfordAccumulator().add(a).add(b)
+    assert np.isnan(acc.finalize()[0, 1])
+    assert np.isclose(acc.noise()[0, 0], 1.0)
+
+
+def test_stack_average_without_memmap_uses_accumulator():
+    data = frames(5)
+    res = stack_images(data, method="average")
+    assert np.allclose(res, np.nanmean(np.stack(data), axis=0), atol=1e-3)
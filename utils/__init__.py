@@ -1,6 +1,8 @@
 from .error import ErrorManager
 from .logging import LogManager
 from .memory import MemoryManager
+from .processes import pool_context
+from .profiling import StageProfiler
 
 # export singletons/instances for convenient use
 memory_manager = MemoryManager()
@@ -10,6 +12,8 @@ __all__ = [
     "LogManager",
     "MemoryManager",
     "ErrorManager",
+    "StageProfiler",
+    "pool_context",
     "memory_manager",
     "error_manager",
 ]
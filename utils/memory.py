@@ -21,6 +21,9 @@ class MemoryManager(metaclass=_SingletonMeta):
         mem_bytes = process.memory_info().rss
         return mem_bytes / (1024 * 1024)
 
+    def _get_available_memory_mb(self) -> float:
+        return psutil.virtual_memory().available / (1024 * 1024)
+
     def _check_memory_limit(self, limit_mb: float) -> bool:
         """Instance method: Returns True if current memory usage is below the limit."""
         return self._get_memory_usage_mb() < limit_mb
@@ -30,6 +33,10 @@ class MemoryManager(metaclass=_SingletonMeta):
     def get_memory_usage_mb(cls) -> float:
         return cls()._get_memory_usage_mb()
 
+    @classmethod
+    def get_available_memory_mb(cls) -> float:
+        return cls()._get_available_memory_mb()
+
     @classmethod
     def check_memory_limit(cls, limit_mb: float) -> bool:
         return cls()._check_memory_limit(limit_mb)
@@ -0,0 +1,17 @@
+import multiprocessing
+import threading
+
+
+def pool_context():
+    """multiprocessing context for worker pools, or None for the default.
+
+    Forking while other threads run copies the locks they hold (logging,
+    tqdm, prefetch pools, caches) into the child, where nothing will ever
+    release them. In that case, e.g. for profiles run as a batch, workers
+    are started from a fork server instead.
+    """
+    if threading.active_count() == 1:
+        return None
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
@@ -0,0 +1,202 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import psutil
+
+from .memory import MemoryManager
+
+PROFILE_VERSION = 1
+CAPTURES = ("cprofile", "tracemalloc")
+
+
+def _cpu_seconds():
+    """User + system CPU time of this process and its reaped workers."""
+    times = psutil.Process().cpu_times()
+    children = (getattr(times, "children_user", 0.0)
+                + getattr(times, "children_system", 0.0))
+    return times.user + times.system + children
+
+
+def _read_bytes():
+    """Bytes this process has read so far (read() calls), or None."""
+    try:
+        counters = psutil.Process().io_counters()
+    except (AttributeError, psutil.Error):
+        return None
+    return getattr(counters, "read_chars", counters.read_bytes)
+
+
+class StageRecord:
+    """Numbers collected for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rss_start_mb = self.rss_end_mb = self.peak_rss_mb = 0.0
+        self.frames = None
+        self.bytes_read = None
+        self.traced_peak_mb = None
+
+    def add_frames(self, n=1):
+        self.frames = (self.frames or 0) + n
+
+    def add_bytes(self, n):
+        self.bytes_read = (self.bytes_read or 0) + n
+
+    def as_dict(self):
+        out = {
+            "name": self.name,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "rss_start_mb": self.rss_start_mb,
+            "rss_end_mb": self.rss_end_mb,
+            "peak_rss_mb": self.peak_rss_mb,
+        }
+        if self.frames is not None:
+            out["frames"] = self.frames
+            out["frames_per_s"] = self.frames / max(self.wall_s, 1e-9)
+        if self.bytes_read is not None:
+            out["bytes_read"] = self.bytes_read
+            out["read_mb_per_s"] = self.bytes_read / 2**20 / max(self.wall_s, 1e-9)
+        if self.traced_peak_mb is not None:
+            out["traced_peak_mb"] = self.traced_peak_mb
+        return out
+
+
+class _RssSampler(threading.Thread):
+    """Polls the process RSS while a stage runs and keeps the maximum."""
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = MemoryManager.get_memory_usage_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, MemoryManager.get_memory_usage_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, MemoryManager.get_memory_usage_mb())
+        return self.peak
+
+
+class StageProfiler:
+    """Wall/CPU time, peak RSS, frames/s and bytes read per pipeline stage.
+
+    Stages are context managers yielding a `StageRecord`, which the stage
+    body can feed with `add_frames` / `add_bytes`; when a stage reports no
+    bytes itself, the process read counter delta is used. `capture` adds a
+    deep-dive over the whole run: ``cprofile`` (stats written next to the
+    report, top functions in it) or ``tracemalloc`` (per-stage traced peak
+    and the largest live allocation sites). A disabled profiler only
+    yields throw-away records.
+    """
+
+    def __init__(self, enabled=True, capture=None, sample_interval=0.05, on_stage=None):
+        if capture is not None and capture not in CAPTURES:
+            raise ValueError(f"Unknown profile capture '{capture}'")
+        self.enabled = enabled
+        self.capture = capture if enabled else None
+        self.sample_interval = sample_interval
+        self.on_stage = on_stage
+        self.stages = []
+        self._profile = None
+        self._snapshot = None
+        self._started = None
+
+    def start(self):
+        if not self.enabled or self._started is not None:
+            return self
+        self._started = (time.perf_counter(), _cpu_seconds())
+        if self.capture == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.capture == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+        if self.capture == "tracemalloc" and tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name):
+        record = StageRecord(name)
+        if not self.enabled:
+            yield record
+            return
+        self.start()
+        sampler = _RssSampler(self.sample_interval)
+        sampler.start()
+        record.rss_start_mb = sampler.peak
+        read_before = _read_bytes()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield record
+        finally:
+            record.wall_s = time.perf_counter() - wall
+            record.cpu_s = _cpu_seconds() - cpu
+            if tracemalloc.is_tracing():
+                record.traced_peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            read_after = _read_bytes()
+            if record.bytes_read is None and None not in (read_before, read_after):
+                record.bytes_read = read_after - read_before
+            record.peak_rss_mb = sampler.stop()
+            record.rss_end_mb = MemoryManager.get_memory_usage_mb()
+            self.stages.append(record)
+            if self.on_stage is not None:
+                self.on_stage(record)
+
+    def report(self, top=25):
+        """The collected numbers as a JSON-serialisable dict."""
+        wall, cpu = self._started or (time.perf_counter(), _cpu_seconds())
+        out = {
+            "version": PROFILE_VERSION,
+            "total": {
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": _cpu_seconds() - cpu,
+                "peak_rss_mb": max((s.peak_rss_mb for s in self.stages), default=0.0),
+            },
+            "stages": [s.as_dict() for s in self.stages],
+        }
+        if self._profile is not None:
+            text = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=text)
+            stats.sort_stats("cumulative").print_stats(top)
+            out["cprofile"] = text.getvalue().splitlines()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            out["tracemalloc"] = [
+                {"site": str(stat.traceback), "size_mb": stat.size / 2**20,
+                 "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:top]
+            ]
+        return out
+
+    def write(self, path):
+        """Stop capturing and write the report (plus `.prof` for cProfile)."""
+        self.stop()
+        report = self.report()
+        if self._profile is not None:
+            prof_path = os.path.splitext(path)[0] + ".prof"
+            self._profile.dump_stats(prof_path)
+            report["cprofile_stats"] = prof_path
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return path